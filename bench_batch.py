@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+BMK Server - Batch vs single-item create benchmark
+Posts the same rows through POST /tasks, /users, /workers one at a time and
+through the /batch routes, in-process against a throwaway database, and
+prints rows/sec for each.
+
+Usage: python bench_batch.py [--rows 2000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '.')
+
+_tmp = tempfile.mkdtemp(prefix="bmk-bench-")
+os.environ["BMK_SQLITE_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["BMK_FILES_DIR"] = os.path.join(_tmp, "files")
+os.environ["BMK_RATE_LIMIT_ENABLED"] = "0"
+
+from fastapi.testclient import TestClient
+
+import server
+
+server.ensure_schema()  # no lifespan without a TestClient with-block
+
+def _users(prefix, n):
+    return [{"name": f"{prefix} user {i}", "email": f"{prefix}{i}@bench.local"} for i in range(n)]
+
+
+def _tasks(prefix, n):
+    return [{"title": f"{prefix} task {i}", "description": "Bench task", "user_id": 1000 + i % 500} for i in range(n)]
+
+
+def _workers(offset, n):
+    return [{"user_id": offset + i, "name": f"Worker {i}", "skills": "plumbing,painting"} for i in range(n)]
+
+
+def _time(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def run(rows):
+    client = TestClient(server.app)
+    cases = [
+        ("users", "/users", _users("single", rows), "/users/batch", _users("batch", rows)),
+        ("tasks", "/tasks", _tasks("single", rows), "/tasks/batch", _tasks("batch", rows)),
+        ("workers", "/workers", _workers(0, rows), "/workers/batch", _workers(rows, rows)),
+    ]
+    print(f"{'route':10s} {'single rows/s':>14s} {'batch rows/s':>14s} {'speedup':>8s}")
+    print("-" * 50)
+    results = {}
+    for name, single_url, single_items, batch_url, batch_items in cases:
+        single = _time(lambda: [client.post(single_url, json=item) for item in single_items])
+        response = {}
+        batch = _time(lambda: response.update(client.post(batch_url, json=batch_items).json()))
+        assert len(response["created"]) == rows, response.get("errors", [])[:3]
+        results[name] = (rows / single, rows / batch)
+        print(f"{name:10s} {rows / single:14.0f} {rows / batch:14.0f} {single / batch:7.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare batch and single-item create routes")
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.rows)
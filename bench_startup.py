@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+BMK Server - Cold start benchmark
+Starts `uvicorn server:app` the way render.yaml does and measures the time
+from process start to the first successful response, first against an empty
+database (schema gets created) and then against the existing one (schema
+version matches, nothing to do). With --profile, also prints the slowest
+imports from `python -X importtime -c "import server"`.
+
+Usage: python bench_startup.py [--runs 5] [--profile] [--top 25]
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _env(tmp):
+    env = dict(os.environ)
+    env["BMK_SQLITE_PATH"] = os.path.join(tmp, "startup.db")
+    env["BMK_FILES_DIR"] = os.path.join(tmp, "files")
+    return env
+
+
+def time_to_first_response(env, timeout=60):
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/")
+                if conn.getresponse().status == 200:
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("server did not answer in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def import_profile(env, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        env=env, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    print(f"\nSlowest imports (cumulative, top {top}):")
+    print(f"  {'cumulative ms':>13s} {'self ms':>8s}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:13.1f} {self_us / 1000:8.1f}  {name}")
+
+
+def run(runs, profile, top):
+    tmp = tempfile.mkdtemp(prefix="bmk-startup-")
+    env = _env(tmp)
+    cold = time_to_first_response(env)  # empty database: creates the schema
+    warm = [time_to_first_response(env) for _ in range(runs)]
+    print(f"First response, empty database:   {cold * 1000:8.0f} ms")
+    print(f"First response, existing schema:  {statistics.median(warm) * 1000:8.0f} ms median "
+          f"(min {min(warm) * 1000:.0f}, max {max(warm) * 1000:.0f}, {runs} runs)")
+    if profile:
+        import_profile(env, top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure process start to first response")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile", action="store_true", help="print the slowest imports")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+    run(args.runs, args.profile, args.top)
@@ -1,7 +1,7 @@
 # BMK Server - Backend for connecting hirers and workers
 # Deployed on Render.com
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
@@ -10,6 +10,8 @@ import uuid
 import json
 import os
 
+import metrics
+
 app = FastAPI(title="BMK API", description="Backend for BMK - Hirer & Worker Platform for Nepal")
 
 # Enable CORS for Flutter app
@@ -20,6 +22,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Data storage (JSON file for persistence)
 DATA_FILE = "bmk_data.json"
@@ -173,6 +176,10 @@ def app_version():
 def health():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # ============== USER ENDPOINTS ==============
 
 @app.post("/users", response_model=User)
@@ -0,0 +1,19 @@
+# Point the app at a throwaway database and files directory before server is imported
+import os
+import tempfile
+
+import pytest
+
+_TMP_DIR = tempfile.mkdtemp(prefix="bmk-test-")
+os.environ.setdefault("BMK_SQLITE_PATH", os.path.join(_TMP_DIR, "bmk_test.db"))
+os.environ.setdefault("BMK_FILES_DIR", os.path.join(_TMP_DIR, "files"))
+os.environ.setdefault("BMK_RATE_LIMIT_ENABLED", "0")
+
+collect_ignore = ["test_api.py"]  # manual script against a running server
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    # Tests use TestClient without a with-block, which skips the lifespan that creates tables
+    import server
+    server.ensure_schema()
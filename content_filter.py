@@ -1,18 +1,138 @@
 # Basic content filter for offensive words
-# You can expand this list or use a library for more advanced filtering
+# Words are compiled once into an Aho-Corasick automaton, so scanning a text
+# is linear in its length no matter how long the word list gets. Call
+# set_bad_words() to change the list; the new automaton is swapped in whole.
+import os
+import re
+import unicodedata
+from collections import deque
+
 BAD_WORDS = [
     "badword1", "badword2", "offensive1", "offensive2", "spamword"
 ]
 
+# Leetspeak / symbol substitutions folded before matching
+LEET_MAP = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t",
+    "@": "a", "$": "s", "|": "l",
+})
+# "!" is only a letter inside a word ("sh!t"); at the end it's punctuation
+_BANG_IN_WORD = re.compile(r"!(?=\w)")
+
+# Devanagari digits -> ASCII, and zero-width joiners / nukta dropped
+DEVANAGARI_MAP = {0x0966 + i: str(i) for i in range(10)}
+DEVANAGARI_MAP.update({0x200C: None, 0x200D: None, 0x093C: None})
+
+
+def normalize(text: str, leet: bool = True) -> str:
+    """Fold case, accents, Devanagari variants and (optionally) leetspeak."""
+    text = unicodedata.normalize("NFKD", text.translate(DEVANAGARI_MAP))
+    # Drop Latin accents but keep Devanagari vowel signs, which carry meaning
+    text = "".join(c for c in text if not ("\u0300" <= c <= "\u036f"))
+    text = unicodedata.normalize("NFC", text).casefold()
+    if not leet:
+        return text
+    return _BANG_IN_WORD.sub("i", text).translate(LEET_MAP)
+
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_" or unicodedata.category(c).startswith("M")
+
+
+class Automaton:
+    """Aho-Corasick automaton over normalized words."""
+
+    def __init__(self, words):
+        self.words = tuple(dict.fromkeys(w for w in words if w))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for index, word in enumerate(self.words):
+            node = 0
+            for c in normalize(word):
+                nxt = self._goto[node].get(c)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][c] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += ((index, len(normalize(word))),)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and c not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(c, 0) if self._goto[f].get(c) != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def scan(self, text: str, first_only: bool = False):
+        """Return indices into self.words of whole-word matches in text."""
+        text = normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        node = 0
+        n = len(text)
+        for i, c in enumerate(text):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            if not out[node]:
+                continue
+            if i + 1 < n and _is_word_char(text[i + 1]):
+                continue
+            for index, length in out[node]:
+                start = i - length + 1
+                if start == 0 or not _is_word_char(text[start - 1]):
+                    found.append(index)
+                    if first_only:
+                        return found
+        return found
+
+
+_automaton = Automaton(BAD_WORDS)
+
+
+def set_bad_words(words):
+    """Replace the word list; readers keep using the old automaton until the swap."""
+    global _automaton, BAD_WORDS
+    automaton = Automaton(words)
+    BAD_WORDS = list(automaton.words)
+    _automaton = automaton
+
+
+def load_bad_words(path):
+    """Load a word list (one word per line, # comments) and swap it in."""
+    with open(path, encoding="utf-8") as f:
+        words = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    set_bad_words(words)
+
+
+# Deployments can keep the real list outside the repo
+if os.environ.get("BMK_BAD_WORDS_FILE"):
+    load_bad_words(os.environ["BMK_BAD_WORDS_FILE"])
+
+
 def contains_bad_words(text: str) -> bool:
-    text_lower = text.lower()
-    for word in BAD_WORDS:
-        if word in text_lower:
-            return True
-    return False
+    return bool(text) and bool(_automaton.scan(text, first_only=True))
 
 # Optionally, you can return the list of found words
 
 def find_bad_words(text: str):
-    text_lower = text.lower()
-    return [word for word in BAD_WORDS if word in text_lower]
+    automaton = _automaton
+    if not text:
+        return []
+    return [automaton.words[i] for i in dict.fromkeys(automaton.scan(text))]
+
+
+def find_bad_words_batch(texts):
+    """find_bad_words over many texts against one consistent word list."""
+    automaton = _automaton
+    return [
+        [automaton.words[i] for i in dict.fromkeys(automaton.scan(t))] if t else []
+        for t in texts
+    ]
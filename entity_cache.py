@@ -0,0 +1,121 @@
+# Read-through cache for the detail endpoints the app re-opens constantly.
+#
+# Each EntityCache is a size-bounded LRU of id -> response dict with a TTL.
+# Writers in this process invalidate explicitly after commit; writes from
+# other processes (and any path that forgets) arrive through invalidation.py,
+# which is polled before every lookup. Concurrent misses for the same id
+# share one load (single flight).
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import invalidation
+import metrics
+
+MAX_ENTRIES = int(os.environ.get("BMK_ENTITY_CACHE_SIZE", "10000"))
+TTL_SECONDS = float(os.environ.get("BMK_ENTITY_CACHE_TTL", "60"))
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error", "stale")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+
+
+class EntityCache:
+    def __init__(self, name, table, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        invalidation.subscribe(table, self._on_change)
+
+    def get(self, key, load):
+        """Cached value for key, or load() it once however many callers miss together.
+
+        A None result (not found) is returned but not cached.
+        """
+        invalidation.poll()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            hit = entry is not None and entry[0] > now
+            if hit:
+                self._data.move_to_end(key)
+            else:
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _Flight()
+        if hit:
+            metrics.cache_hit(self.name)
+            return entry[1]
+        if not leader:
+            # Another request is already loading this id; wait for its result
+            metrics.CACHE_LOOKUPS.inc((self.name, "coalesced"))
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        metrics.cache_miss(self.name)
+        try:
+            flight.value = load()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.error is None and flight.value is not None and not flight.stale:
+                    self._data[key] = (time.monotonic() + self.ttl, flight.value)
+                    self._data.move_to_end(key)
+                    while len(self._data) > self.max_entries:
+                        self._data.popitem(last=False)
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            flight = self._inflight.get(key)
+            if flight is not None:
+                # Loaded before the write landed; hand it to waiters but don't keep it
+                flight.stale = True
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [k for k, (_, value) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            for flight in self._inflight.values():
+                flight.stale = True
+
+    def _on_change(self, keys):
+        if keys is None:
+            self.clear()
+        else:
+            for key in keys:
+                self.invalidate(key)
+
+
+tasks = EntityCache("tasks", "tasks")
+workers = EntityCache("workers", "workers")
+# Keyed by user_id; holds the subscription row's plan and expiry (or none)
+subscriptions = EntityCache("subscriptions", "pro_subscriptions")
+
+
+def invalidate_user(user_id):
+    """Drop everything cached for a user that was banned or deleted."""
+    subscriptions.invalidate(user_id)
+    tasks.invalidate_where(lambda task: task["user_id"] == user_id)
+    workers.invalidate_where(lambda worker: worker["user_id"] == user_id)
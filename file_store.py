@@ -0,0 +1,280 @@
+# Content-addressed storage for uploaded files.
+# Blobs live under FILES_DIR/blobs/<sha[:2]>/<sha> and the stored_files table
+# maps the logical filename clients use to the blob holding its bytes, so
+# re-uploading the same content never stores it twice. Uploads are parsed
+# straight off the request body (never spooled by the framework first), so
+# the size limit applies to the bytes actually received.
+import hashlib
+import os
+import re
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio.from_thread
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+import invalidation
+import metrics
+from server import FILES_DIR, SessionLocal, StoredFile
+
+BLOBS_DIR = os.path.join(FILES_DIR, "blobs")
+CHUNK_SIZE = 1024 * 1024
+# Upload limit, enforced while streaming
+MAX_UPLOAD_BYTES = int(os.environ.get("BMK_MAX_UPLOAD_MB", "100")) * 1024 * 1024
+# Room for multipart boundaries, part headers and small form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# How long a cached stat/etag entry is trusted before re-checking the disk;
+# an upload in any process drops entries sooner (see metadata())
+META_TTL_SECONDS = float(os.environ.get("BMK_FILE_META_TTL", "60"))
+
+_UNSAFE_CHARS = re.compile(r"[^\w.\- ]", re.UNICODE)
+
+os.makedirs(BLOBS_DIR, exist_ok=True)
+
+FileMeta = namedtuple("FileMeta", "path stat etag last_modified loaded_at version")
+
+# Logical filename -> FileMeta, so downloads skip the DB lookup and stat call
+_meta_cache = {}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class BadUpload(Exception):
+    pass
+
+
+def safe_name(filename):
+    """Reduce a client supplied filename to a single safe path component."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    name = _UNSAFE_CHARS.sub("_", name).strip(" .")
+    return name or "upload"
+
+
+def blob_path(sha256):
+    return os.path.join(BLOBS_DIR, sha256[:2], sha256)
+
+
+def save_stream(src, filename, content_type=None):
+    """Copy src to a blob in chunks, hashing as we go. Blocking: run off the event loop.
+
+    Returns (StoredFile-like dict, deduplicated).
+    """
+    name = safe_name(filename)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=BLOBS_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        target = blob_path(sha256)
+        deduplicated = os.path.exists(target)
+        if deduplicated:
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    db = SessionLocal()
+    try:
+        entry = db.query(StoredFile).filter(StoredFile.name == name).first()
+        if not entry:
+            entry = StoredFile(name=name)
+            db.add(entry)
+        entry.sha256 = sha256
+        entry.size = size
+        entry.content_type = content_type
+        entry.created_at = datetime.now(timezone.utc)
+        db.commit()
+    finally:
+        db.close()
+    _meta_cache.pop(name, None)
+    return {"filename": name, "sha256": sha256, "size": size}, deduplicated
+
+
+class MultipartUpload:
+    """Blocking file-like reader over one file field of a multipart request.
+
+    Meant for a worker thread: body chunks are pulled from the request's
+    async stream through anyio.from_thread and fed to an incremental
+    multipart parser, and read() returns the field's bytes as they arrive.
+    Reading stops (UploadTooLarge) as soon as the body outgrows the limit.
+    """
+
+    def __init__(self, request, field="file"):
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise BadUpload("Expected a multipart/form-data body")
+        self.field = field
+        self.filename = None
+        self.content_type = None
+        self._body = request.stream()
+        self._received = 0
+        self._data = bytearray()
+        self._state = "before"  # before | headers | in_file | done
+        self._headers = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._in_field = False
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value_part,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def _part_begin(self):
+        self._headers = {}
+        self._header_name = self._header_value = b""
+
+    def _header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def _header_value_part(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def _headers_finished(self):
+        _, disposition = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_field = (
+            self._state == "before"
+            and disposition.get(b"name", b"").decode("utf-8", "replace") == self.field
+            and b"filename" in disposition
+        )
+        if self._in_field:
+            self.filename = disposition[b"filename"].decode("utf-8", "replace")
+            content_type = self._headers.get(b"content-type")
+            self.content_type = content_type.decode("latin-1") if content_type else None
+            self._state = "in_file"
+
+    def _part_data(self, data, start, end):
+        if self._in_field:
+            self._data += data[start:end]
+
+    def _part_end(self):
+        if self._in_field:
+            self._in_field = False
+            self._state = "done"
+
+    def _feed(self):
+        """Parse the next body chunk; False once the body is exhausted."""
+        try:
+            chunk = anyio.from_thread.run(self._body.__anext__)
+        except StopAsyncIteration:
+            self._parser.finalize()
+            return False
+        self._received += len(chunk)
+        if self._received > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+            raise UploadTooLarge(f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+        self._parser.write(chunk)
+        return True
+
+    def open(self):
+        """Read up to the start of the file field, setting filename and content_type."""
+        while self._state == "before":
+            if not self._feed():
+                raise BadUpload(f"No {self.field!r} file field in the upload")
+        return self
+
+    def read(self, size=-1):
+        # Rest of the body (other fields) is left unread once the file part ends
+        while (size < 0 or len(self._data) < size) and self._state == "in_file":
+            if not self._feed():
+                raise BadUpload("Upload ended in the middle of the file")
+        size = len(self._data) if size < 0 else size
+        chunk = bytes(self._data[:size])
+        del self._data[:size]
+        return chunk
+
+
+def save_upload(request, field="file"):
+    """Store the file field of a multipart request as it is received. Blocking: run off the event loop."""
+    upload = MultipartUpload(request, field).open()
+    return save_stream(upload, upload.filename, upload.content_type)
+
+
+def _lookup(filename):
+    """Map a logical filename to (path, sha256), or (None, None).
+
+    Files placed directly in FILES_DIR (e.g. the APK) are still served and
+    have no sha256.
+    """
+    name = safe_name(filename)
+    if name != filename:
+        return None, None
+    db = SessionLocal()
+    try:
+        entry = db.query(StoredFile).filter(StoredFile.name == name).first()
+    finally:
+        db.close()
+    if entry:
+        path = blob_path(entry.sha256)
+        if os.path.isfile(path):
+            return path, entry.sha256
+    legacy = os.path.join(FILES_DIR, name)
+    return (legacy, None) if os.path.isfile(legacy) else (None, None)
+
+
+def metadata(filename):
+    """Cached FileMeta for a logical filename, or None if it doesn't exist."""
+    now = time.monotonic()
+    # Entries are only good for the stored_files version they were read at,
+    # so a file replaced by another worker isn't served from a stale blob
+    version = invalidation.versions().get("stored_files")
+    meta = _meta_cache.get(filename)
+    if meta and meta.version == version and now - meta.loaded_at < META_TTL_SECONDS:
+        metrics.cache_hit("file_meta")
+        return meta
+    metrics.cache_miss("file_meta")
+    path, sha256 = _lookup(filename)
+    if not path:
+        _meta_cache.pop(filename, None)
+        return None
+    st = os.stat(path)
+    # Blobs are immutable, so their hash is a strong validator
+    etag = f'"{sha256}"' if sha256 else f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    meta = FileMeta(path, st, etag, formatdate(st.st_mtime, usegmt=True), now, version)
+    _meta_cache[filename] = meta
+    return meta
+
+
+def not_modified(meta, headers):
+    """True when the request's conditional headers match the cached file."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or meta.etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return int(meta.stat.st_mtime) <= since.timestamp()
+    return False
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+BMK Server - Synthetic dataset generator for capacity testing
+Generates users, tasks, workers, chat messages and Pro subscriptions with
+realistic skew (a few hot posters and chatters, busy Kathmandu-valley
+municipalities, common vs rare skills) and bulk-loads them with executemany.
+
+Rows are generated in fixed-size chunks, each from its own seeded RNG, in a
+process pool, so the same --seed always yields the same dataset whatever
+--processes is.
+
+Usage: python generate_dataset.py [--db bmk.db] [--users 100000] [--tasks 500000]
+                                  [--workers 50000] [--messages 300000]
+                                  [--pro-fraction 0.05] [--seed 42] [--processes N]
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '.')
+
+CHUNK_SIZE = 20_000
+MUNICIPALITIES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "municipalities.csv")
+# Fixed "now" so the same seed gives byte-identical rows on every run
+EPOCH = datetime(2026, 1, 1)
+
+FIRST_NAMES = [
+    "Aarav", "Aayush", "Anish", "Bikash", "Bishal", "Deepak", "Ganesh", "Hari", "Kiran", "Krishna",
+    "Manish", "Nabin", "Prakash", "Rajesh", "Ram", "Roshan", "Santosh", "Sanjay", "Suman", "Sushant",
+    "Aasha", "Anjali", "Bina", "Gita", "Kabita", "Laxmi", "Manisha", "Nisha", "Pooja", "Puja",
+    "Rita", "Sabina", "Sarita", "Sita", "Srijana", "Sunita", "Sushma", "Usha", "Yamuna", "Rekha",
+]
+LAST_NAMES = [
+    "Adhikari", "Bhandari", "Basnet", "Bhattarai", "Chaudhary", "Gurung", "Karki", "Khatri", "KC",
+    "Lama", "Magar", "Maharjan", "Pandey", "Poudel", "Rai", "Sharma", "Shrestha", "Tamang", "Thapa", "Yadav",
+]
+# (skill, relative frequency) - plumbing and cleaning jobs dwarf specialist ones
+SKILLS = [
+    ("cleaning", 30), ("plumbing", 22), ("electrical", 18), ("painting", 15), ("carpentry", 12),
+    ("cooking", 12), ("driving", 10), ("gardening", 8), ("masonry", 8), ("tutoring", 6),
+    ("delivery", 6), ("welding", 4), ("tailoring", 4), ("computer repair", 3), ("photography", 2),
+]
+TASK_TEMPLATES = {
+    "cleaning": ["Clean house", "Deep clean kitchen", "Office cleaning", "Clean water tank"],
+    "plumbing": ["Fix leaking tap", "Install water pump", "Repair toilet flush", "Fix plumbing issue"],
+    "electrical": ["Fix electrical outlet", "Install inverter", "Wire new room", "Install lights"],
+    "painting": ["Paint house", "Paint walls", "Paint gate"],
+    "carpentry": ["Repair door", "Build shelves", "Fix window frame"],
+    "cooking": ["Cook for family event", "Daily cook needed", "Catering for puja"],
+    "driving": ["Driver for day trip", "Airport pickup", "Goods transport"],
+    "gardening": ["Clean garden", "Plant vegetables", "Trim hedges"],
+    "masonry": ["Repair wall", "Build compound wall", "Fix floor tiles"],
+    "tutoring": ["Math tutor needed", "English tuition", "SEE exam preparation"],
+    "delivery": ["Deliver parcels", "Grocery delivery", "Move furniture"],
+    "welding": ["Weld gate", "Repair grill"],
+    "tailoring": ["Stitch kurta", "Alter clothes"],
+    "computer repair": ["Fix laptop", "Install software"],
+    "photography": ["Wedding photographer", "Event photos"],
+}
+BUDGETS = [500, 1000, 1500, 2000, 3000, 5000, 8000, 10000, 15000, 25000]
+TASK_STATUSES = [("open", 55), ("in-progress", 15), ("completed", 20), ("closed", 10)]
+CHAT_LINES = [
+    "Is this task still available?", "I can come tomorrow morning.", "What is the budget?",
+    "Please share the exact location.", "Done, please check.", "Thank you!", "Can you send a photo?",
+    "I have 5 years of experience.", "Call me when you are free.", "Namaste, interested in this work.",
+]
+# Rough province centres (lat, lng); municipalities get a deterministic jitter around them
+PROVINCE_CENTRES = {
+    "Koshi Pradesh": (26.9, 87.3), "Madhesh Pradesh": (26.8, 85.9), "Bagmati Pradesh": (27.6, 85.4),
+    "Gandaki Pradesh": (28.3, 84.0), "Lumbini Pradesh": (27.9, 83.0), "Karnali Pradesh": (29.0, 82.0),
+    "Sudurpashchim Pradesh": (29.2, 80.8),
+}
+BUSY_DISTRICTS = {"Kathmandu": 40, "Lalitpur": 20, "Bhaktapur": 12, "Kaski": 15, "Morang": 10, "Chitwan": 10, "Rupandehi": 8}
+
+
+def load_municipalities():
+    with open(MUNICIPALITIES_CSV, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        digest = hashlib.md5(row["name"].encode()).digest()
+        lat, lng = PROVINCE_CENTRES.get(row["province"], (28.0, 84.0))
+        row["latitude"] = round(lat + (digest[0] / 255 - 0.5) * 1.2, 5)
+        row["longitude"] = round(lng + (digest[1] / 255 - 0.5) * 1.6, 5)
+        row["weight"] = BUSY_DISTRICTS.get(row["district"], 1)
+    return rows
+
+
+def _weighted(pairs):
+    values = [v for v, _ in pairs]
+    cumulative, total = [], 0
+    for _, w in pairs:
+        total += w
+        cumulative.append(total)
+    return values, cumulative
+
+
+def _hot(rng, first_id, count, skew=3.0):
+    """Power-law pick: low ids are far more likely (hot users)."""
+    return first_id + min(count - 1, int(count * rng.random() ** skew))
+
+
+def _when(rng, days=365):
+    return EPOCH - timedelta(seconds=int(rng.random() ** 2 * days * 86400))
+
+
+def _point(rng, muni):
+    """A point within a few km of the municipality, or (None, None) - placed at its centre - for 1 in 5 rows."""
+    if rng.random() < 0.2:
+        return None, None
+    return (round(muni["latitude"] + rng.uniform(-0.03, 0.03), 5),
+            round(muni["longitude"] + rng.uniform(-0.03, 0.03), 5))
+
+
+def _rng(seed, table, chunk):
+    return random.Random(f"{seed}:{table}:{chunk}")
+
+
+# Each generator returns the rows for ids [start, start + count)
+
+def gen_users(seed, chunk, start, count, ctx):
+    rng = _rng(seed, "users", chunk)
+    rows = []
+    for user_id in range(start, start + count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        role = "hirer" if rng.random() < 0.35 else "worker"
+        rows.append((user_id, name, f"user{user_id}@bmk.synthetic", role, ctx["password_hash"], 0))
+    return rows
+
+
+def gen_tasks(seed, chunk, start, count, ctx):
+    rng = _rng(seed, "tasks", chunk)
+    skills, skill_cum = _weighted(SKILLS)
+    statuses, status_cum = _weighted(TASK_STATUSES)
+    munis, muni_cum = ctx["munis"], ctx["muni_cum"]
+    rows = []
+    for task_id in range(start, start + count):
+        skill = rng.choices(skills, cum_weights=skill_cum)[0]
+        muni = rng.choices(munis, cum_weights=muni_cum)[0]
+        title = rng.choice(TASK_TEMPLATES[skill])
+        description = f"{title} in {muni['name']}, {muni['district']}. Need someone with {skill} experience."
+        status = rng.choices(statuses, cum_weights=status_cum)[0]
+        user_id = _hot(rng, ctx["first_user_id"], ctx["users"])
+        budget = f"Rs. {rng.choice(BUDGETS)}" if rng.random() < 0.7 else "Negotiable"
+        rows.append((
+            task_id, title, description, status, user_id, 0, skill, muni["name"], budget,
+            _when(rng).strftime("%Y-%m-%d %H:%M:%S.%f"), 1 if rng.random() < 0.1 else 0, *_point(rng, muni),
+        ))
+    return rows
+
+
+def gen_workers(seed, chunk, start, count, ctx):
+    rng = _rng(seed, "workers", chunk)
+    skills, skill_cum = _weighted(SKILLS)
+    munis, muni_cum = ctx["munis"], ctx["muni_cum"]
+    rows = []
+    for worker_id in range(start, start + count):
+        # Workers map onto distinct users where possible
+        user_id = ctx["first_user_id"] + (worker_id - ctx["first_worker_id"]) % ctx["users"]
+        worker_skills = sorted(set(rng.choices(skills, cum_weights=skill_cum, k=rng.randint(1, 3))))
+        muni = rng.choices(munis, cum_weights=muni_cum)[0]
+        rows.append((
+            worker_id, user_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"98{rng.randint(0, 99_999_999):08d}", json.dumps(worker_skills), muni["name"],
+            f"Experienced in {', '.join(worker_skills)}.", 1 if rng.random() < 0.8 else 0,
+            round(min(5.0, max(0.0, rng.gauss(3.8, 0.8))), 1), 0, *_point(rng, muni),
+        ))
+    return rows
+
+
+def gen_messages(seed, chunk, start, count, ctx):
+    rng = _rng(seed, "chat_messages", chunk)
+    rows = []
+    for message_id in range(start, start + count):
+        user_id = _hot(rng, ctx["first_user_id"], ctx["users"], skew=2.0)
+        rows.append((message_id, user_id, rng.choice(CHAT_LINES), _when(rng, 180).isoformat(), 0))
+    return rows
+
+
+def gen_subscriptions(seed, chunk, start, count, ctx):
+    rng = _rng(seed, "pro_subscriptions", chunk)
+    rows = []
+    for i, sub_id in enumerate(range(start, start + count)):
+        # Spread Pro users evenly over the generated users, one each
+        user_id = ctx["first_user_id"] + int((chunk * CHUNK_SIZE + i) / ctx["pro_fraction"])
+        expires_at = EPOCH + timedelta(days=rng.randint(-60, 90))
+        rows.append((sub_id, user_id, "pro", expires_at.strftime("%Y-%m-%d %H:%M:%S.%f")))
+    return rows
+
+
+TABLES = [
+    # (table, columns, generator)
+    ("users", "id, name, email, role, password_hash, banned", gen_users),
+    ("tasks", "id, title, description, status, user_id, flagged, category, location, budget, created_at, is_urgent, "
+              "latitude, longitude", gen_tasks),
+    ("workers", 'id, user_id, name, phone, skills, location, about, "isAvailable", rating, flagged, latitude, longitude',
+     gen_workers),
+    ("chat_messages", "id, user_id, content, timestamp, flagged", gen_messages),
+    ("pro_subscriptions", "id, user_id, plan, expires_at", gen_subscriptions),
+]
+
+
+def _generate_chunk(args):
+    generator, seed, chunk, start, count, ctx = args
+    return generator(seed, chunk, start, count, ctx)
+
+
+def generate(db_path, users, tasks, workers, messages, pro_fraction, seed, processes):
+    os.environ["BMK_SQLITE_PATH"] = db_path
+    from server import (ROLLUP_TRIGGERS, SEARCH_INDEXES, engine, ensure_schema, get_password_hash,
+                        install_rollup_triggers, install_search_indexes, install_version_triggers)
+    import rollups
+    import search
+
+    ensure_schema()
+
+    # One real hash so generated users can log in with "bmk123" in load tests
+    password_hash = get_password_hash("bmk123")
+    munis = load_municipalities()
+    _, muni_cum = _weighted([(m["name"], m["weight"]) for m in munis])
+
+    raw = engine.raw_connection()
+    conn = raw.driver_connection
+    # Bulk load: one transaction per table, no fsync per commit
+    conn.execute("PRAGMA synchronous = OFF")
+
+    def next_id(table):
+        return (conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0) + 1
+
+    if not conn.execute("SELECT COUNT(*) FROM municipalities").fetchone()[0]:
+        conn.executemany(
+            "INSERT INTO municipalities (name, province, district, ward, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?)",
+            [(m["name"], m["province"], m["district"], "", m["latitude"], m["longitude"]) for m in munis],
+        )
+        conn.commit()
+
+    ctx = {
+        "password_hash": password_hash,
+        "munis": [{k: m[k] for k in ("name", "district", "latitude", "longitude")} for m in munis],
+        "muni_cum": muni_cum,
+        "first_user_id": next_id("users"),
+        "users": users,
+        "first_worker_id": next_id("workers"),
+        "pro_fraction": pro_fraction,
+    }
+    counts = {
+        "users": users, "tasks": tasks, "workers": workers,
+        "chat_messages": messages, "pro_subscriptions": int(users * pro_fraction),
+    }
+    if workers > users or counts["pro_subscriptions"] > users:
+        raise SystemExit("--workers and Pro subscriptions can't exceed --users (one per user)")
+
+    started = time.perf_counter()
+    total = 0
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for table, columns, generator in TABLES:
+                count = counts[table]
+                if not count:
+                    continue
+                table_started = time.perf_counter()
+                first_id = next_id(table)
+                jobs = [
+                    (generator, seed, chunk, first_id + offset, min(CHUNK_SIZE, count - offset), ctx)
+                    for chunk, offset in enumerate(range(0, count, CHUNK_SIZE))
+                ]
+                placeholders = ", ".join("?" * len(columns.split(",")))
+                sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+                # Per-row data_versions triggers would double the insert cost; bump once per table
+                for op in ("insert", "update", "delete"):
+                    conn.execute(f"DROP TRIGGER IF EXISTS bump_{table}_{op}")
+                # Same for the full-text and rollup triggers; both are rebuilt in one pass afterwards
+                for fts, content, _ in SEARCH_INDEXES.values():
+                    if content == table:
+                        for op in ("insert", "update", "delete"):
+                            conn.execute(f"DROP TRIGGER IF EXISTS {fts}_{op}")
+                for name, _, _, _ in ROLLUP_TRIGGERS.get(table, ()):
+                    conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                for rows in pool.map(_generate_chunk, jobs):
+                    conn.executemany(sql, rows)
+                conn.execute("UPDATE data_versions SET version = version + 1 WHERE name = ?", (table,))
+                conn.commit()
+                total += count
+                elapsed = time.perf_counter() - table_started
+                print(f"  ✓ {table:18s} {count:10,d} rows  {count / elapsed:12,.0f} rows/s")
+    finally:
+        raw.close()
+        install_version_triggers()
+        install_search_indexes()
+        install_rollup_triggers()
+    print(f"  ✓ {rollups.rebuild():,d} daily rollup rows")
+    indexed = [name for name, (_, content, _) in SEARCH_INDEXES.items() if counts.get(content)]
+    if indexed:
+        search_started = time.perf_counter()
+        search.rebuild(indexed)
+        print(f"  ✓ search index {', '.join(indexed)} rebuilt in {time.perf_counter() - search_started:.1f}s")
+    elapsed = time.perf_counter() - started
+    print("-" * 60)
+    print(f"✓ {total:,d} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    return total, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic BMK dataset")
+    parser.add_argument("--db", default=os.environ.get("BMK_SQLITE_PATH", "bmk.db"))
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--tasks", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, default=50_000)
+    parser.add_argument("--messages", type=int, default=300_000)
+    parser.add_argument("--pro-fraction", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f"Generating synthetic dataset into {args.db} (seed {args.seed})...")
+    print("-" * 60)
+    generate(args.db, args.users, args.tasks, args.workers, args.messages,
+             args.pro_fraction, args.seed, args.processes)
@@ -0,0 +1,340 @@
+# Nearest open tasks and available workers to a point.
+#
+# Each GeoIndex holds a snapshot of its table's live rows as NumPy arrays
+# sorted by latitude. A query cuts the latitude band of its search radius
+# out with two binary searches, masks that band to the radius' longitude
+# window, and computes haversine distances only for the rows left, all
+# vectorized. While fewer than k rows fall inside, the radius doubles, but
+# never past the k-th distance among rows already measured: any k rows bound
+# the answer, so that radius is sure to be the last. Rows without their own
+# coordinates sit at the centroid of the municipality named in their
+# location.
+#
+# Rows changed since the snapshot (data_changes, see invalidation.py) are
+# re-read and patched in by a background thread at most every
+# BMK_GEO_REFRESH_SECONDS while the old snapshot keeps serving; only when
+# more than BMK_GEO_REBUILD_FRACTION of the rows changed, a municipality
+# moved or the change log was outrun is the whole table reloaded. Hits are
+# re-read from the table, so rows deleted or closed since are dropped and
+# the ranking goes deeper until k rows survive. NumPy is imported on the
+# first build or query, not with server.
+import argparse
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+# server before invalidation, which imports job_queue (see search.py)
+from server import CLOSED_TASK_STATUSES, Task, Worker, engine
+import invalidation
+
+EARTH_RADIUS_KM = 6371.0088
+# Radius that covers the whole globe from any point
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+START_RADIUS_KM = float(os.environ.get("BMK_GEO_START_RADIUS_KM", "10"))
+REFRESH_SECONDS = float(os.environ.get("BMK_GEO_REFRESH_SECONDS", "15"))
+REBUILD_FRACTION = float(os.environ.get("BMK_GEO_REBUILD_FRACTION", "0.05"))
+MAX_K = 100
+# Extra hits ranked per query, to cover rows deleted or closed since the snapshot
+_SPARE = 10
+_IDS_PER_QUERY = 500
+
+# One point per municipality name (a municipality may have a row per ward)
+_CENTROIDS = (
+    "SELECT name, AVG(latitude) AS latitude, AVG(longitude) AS longitude FROM municipalities "
+    "WHERE latitude IS NOT NULL AND longitude IS NOT NULL GROUP BY name"
+)
+
+
+def _points_sql(table, where, key):
+    own = "r.latitude IS NOT NULL AND r.longitude IS NOT NULL"
+    return (
+        f"SELECT * FROM (SELECT r.id, "
+        f"CASE WHEN {own} THEN r.latitude ELSE m.latitude END AS lat, "
+        f"CASE WHEN {own} THEN r.longitude ELSE m.longitude END AS lng, {key} AS key "
+        f"FROM {table} r LEFT JOIN ({_CENTROIDS}) m ON m.name = r.location WHERE {where}) "
+        f"WHERE lat IS NOT NULL AND lng IS NOT NULL"
+    )
+
+
+def _kth(distances, k):
+    """k-th smallest of distances (len >= k), widened a hair so the box at that radius keeps the row."""
+    import numpy as np
+    return float(np.partition(distances, k - 1)[k - 1]) * (1 + 1e-9)
+
+
+class Points:
+    """Immutable snapshot: ids and coordinates (radians) sorted by latitude, plus an optional key code per row."""
+
+    def __init__(self, ids, lat, lng, keys=None):
+        import numpy as np
+        lat = np.radians(np.asarray(lat, dtype=np.float64))
+        order = np.argsort(lat, kind="stable")
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.lat = lat[order]
+        self.lng = np.radians(np.asarray(lng, dtype=np.float64))[order]
+        self.cos_lat = np.cos(self.lat)
+        self.vocabulary = {}
+        self.codes = None
+        if keys is not None:
+            codes = [self.vocabulary.setdefault(key, len(self.vocabulary)) for key in keys]
+            self.codes = np.asarray(codes, dtype=np.int32)[order]
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def patched(self, drop, ids, lat, lng, keys=None):
+        """A new snapshot without the rows whose id is in drop, plus the given rows."""
+        import numpy as np
+        fresh = Points(ids, lat, lng, keys)
+        keep = ~np.isin(self.ids, np.fromiter(drop, dtype=np.int64, count=len(drop)))
+        # The fresh rows are sorted too, so inserting each at its place keeps the order
+        at = np.searchsorted(self.lat[keep], fresh.lat)
+        points = object.__new__(Points)
+        points.ids = np.insert(self.ids[keep], at, fresh.ids)
+        points.lat = np.insert(self.lat[keep], at, fresh.lat)
+        points.lng = np.insert(self.lng[keep], at, fresh.lng)
+        points.cos_lat = np.insert(self.cos_lat[keep], at, fresh.cos_lat)
+        points.vocabulary = dict(self.vocabulary)
+        points.codes = None
+        if self.codes is not None:
+            # fresh.vocabulary lists its keys in code order
+            recode = np.array([points.vocabulary.setdefault(key, len(points.vocabulary))
+                               for key in fresh.vocabulary], dtype=np.int32)
+            points.codes = np.insert(self.codes[keep], at, recode[fresh.codes] if len(fresh) else fresh.codes)
+        points.built_at = time.monotonic()
+        return points
+
+    def _box(self, lat0, lng0, radius_km, key):
+        """Positions inside the bounding box of the radius around lat0/lng0 (radians)."""
+        import numpy as np
+        dlat = radius_km / EARTH_RADIUS_KM
+        lo = np.searchsorted(self.lat, lat0 - dlat, side="left")
+        hi = np.searchsorted(self.lat, lat0 + dlat, side="right")
+        mask = None
+        if lat0 - dlat > -math.pi / 2 and lat0 + dlat < math.pi / 2:
+            # Widest longitude the spherical cap reaches (it holds no pole)
+            dlng = math.asin(min(1.0, math.sin(dlat) / math.cos(lat0)))
+            lng = self.lng[lo:hi]
+            if -math.pi <= lng0 - dlng and lng0 + dlng <= math.pi:
+                mask = (lng >= lng0 - dlng) & (lng <= lng0 + dlng)
+            else:
+                # The window crosses the antimeridian
+                mask = np.abs((lng - lng0 + math.pi) % (2 * math.pi) - math.pi) <= dlng
+        if key is not None:
+            same = self.codes[lo:hi] == self.vocabulary[key]
+            mask = same if mask is None else mask & same
+        return np.arange(lo, hi) if mask is None else lo + np.flatnonzero(mask)
+
+    def _distances(self, lat0, lng0, positions):
+        """Haversine distances in km from lat0/lng0 (radians) to the rows at positions."""
+        import numpy as np
+        a = (np.sin((self.lat[positions] - lat0) / 2) ** 2
+             + math.cos(lat0) * self.cos_lat[positions] * np.sin((self.lng[positions] - lng0) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def nearest(self, lat, lng, k, radius_km=None, key=None):
+        """(ids, distances in km) of the k rows nearest lat/lng (degrees) within radius_km, closest first."""
+        import numpy as np
+        if key is not None and key not in self.vocabulary:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        lat0, lng0 = math.radians(lat), math.radians(lng)
+        limit = min(radius_km or MAX_RADIUS_KM, MAX_RADIUS_KM)
+        # Any k rows bound the distance to the k-th nearest; start from the rows nearest in latitude
+        middle = np.searchsorted(self.lat, lat0)
+        sample = np.arange(max(0, middle - k), min(len(self), middle + k))
+        if key is not None:
+            sample = sample[self.codes[sample] == self.vocabulary[key]]
+        if len(sample) >= k:
+            limit = min(limit, _kth(self._distances(lat0, lng0, sample), k))
+        radius = min(START_RADIUS_KM, limit)
+        while True:
+            positions = self._box(lat0, lng0, radius, key)
+            # The circle can't hold k rows if its box doesn't; only then is it worth measuring
+            if len(positions) >= k or radius >= limit:
+                distances = self._distances(lat0, lng0, positions)
+                inside = distances <= radius
+                # Everything within radius is found, so with k of them these are the k nearest overall
+                if inside.sum() >= k or radius >= limit:
+                    positions, distances = positions[inside], distances[inside]
+                    break
+                limit = min(limit, _kth(distances, k))
+            radius = min(radius * 2, limit)
+        if len(positions) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+            positions, distances = positions[top], distances[top]
+        order = np.argsort(distances, kind="stable")
+        return self.ids[positions[order]], distances[order]
+
+
+class GeoIndex:
+    def __init__(self, name, table, where, key="NULL"):
+        self.name = name
+        self.table = table
+        self.where = where
+        self.key = key
+        self.sql = _points_sql(table, where, key)
+        self.keyed = key != "NULL"
+        self._points = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._refreshing = False
+        # Row ids changed since the snapshot; None when it must be reloaded whole
+        self._changed = set()
+        invalidation.subscribe(table, self._on_change)
+        invalidation.subscribe("municipalities", lambda keys: self._on_change(None))
+
+    def _on_change(self, keys):
+        with self._lock:
+            if keys is None or self._changed is None:
+                self._changed = None
+            else:
+                self._changed |= keys
+                # Past the rebuild threshold the ids aren't worth keeping
+                if self._points is not None and len(self._changed) > REBUILD_FRACTION * len(self._points):
+                    self._changed = None
+
+    def _rows(self, sql, params=()):
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(sql, params).all()
+        ids, lat, lng, keys = zip(*rows) if rows else ((), (), (), ())
+        return ids, lat, lng, keys if self.keyed else None
+
+    def build(self):
+        """Load a fresh snapshot from the table; returns it."""
+        # Catch up on the change log first: a write during the load is then
+        # applied again later, which is harmless, rather than missed
+        invalidation.poll(force=True)
+        with self._lock:
+            self._changed = set()
+        self._points = Points(*self._rows(self.sql))
+        return self._points
+
+    def _patch(self, changed):
+        """Re-read the changed rows and patch them into the current snapshot."""
+        changed = sorted(key for key in changed if key is not None)
+        ids, lat, lng, keys = [], [], [], []
+        for start in range(0, len(changed), _IDS_PER_QUERY):
+            chunk = changed[start:start + _IDS_PER_QUERY]
+            where = f"({self.where}) AND r.id IN ({', '.join('?' * len(chunk))})"
+            rows = self._rows(_points_sql(self.table, where, self.key), tuple(chunk))
+            ids += rows[0]
+            lat += rows[1]
+            lng += rows[2]
+            keys += rows[3] or ()
+        self._points = self._points.patched(changed, ids, lat, lng, keys if self.keyed else None)
+
+    def _refresh(self):
+        try:
+            with self._lock:
+                changed, self._changed = self._changed, set()
+            if changed is None:
+                self.build()
+            elif changed:
+                self._patch(changed)
+        finally:
+            self._refreshing = False
+
+    def points(self):
+        """Current snapshot; the first call builds it, later ones refresh it in the background."""
+        points = self._points
+        if points is None:
+            with self._build_lock:
+                return self.build() if self._points is None else self._points
+        if time.monotonic() - points.built_at >= REFRESH_SECONDS:
+            # Delivers the changes made since to _on_change
+            invalidation.poll()
+            with self._lock:
+                start = self._changed != set() and not self._refreshing
+                if start:
+                    self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh, name=f"geo-{self.name}", daemon=True).start()
+        return points
+
+    def nearest(self, lat, lng, k, radius_km=None, key=None):
+        return self.points().nearest(lat, lng, k, radius_km, key)
+
+
+# Conditions name only columns the centroid join doesn't have, so they read the same without the alias
+tasks = GeoIndex("tasks", "tasks", f"deleted = 0 AND COALESCE(status, 'open') NOT IN {CLOSED_TASK_STATUSES}",
+                 key="r.category")
+workers = GeoIndex("workers", "workers", 'deleted = 0 AND "isAvailable" = 1')
+
+
+def warm():
+    """Build the snapshots in the background, so the first nearby request doesn't wait for them."""
+    def build_all():
+        for index in (tasks, workers):
+            index.points()
+    threading.Thread(target=build_all, name="geo-warm", daemon=True).start()
+
+
+def centroid(db, municipality):
+    """(lat, lng) of a municipality by name, or None if it has no coordinates."""
+    row = db.execute(text(f"SELECT latitude, longitude FROM ({_CENTROIDS}) WHERE name = :name"),
+                     {"name": municipality}).first()
+    return tuple(row) if row else None
+
+
+def _live(db, model, ids, distances, k, where):
+    """The first k of ids (with distances) whose rows still match where."""
+    found = {row.id: row for row in db.query(model).filter(model.id.in_(ids.tolist()), text(where))}
+    return [(found[i], d) for i, d in zip(ids.tolist(), distances.tolist()) if i in found][:k]
+
+
+def _nearest_live(db, index, model, lat, lng, k, radius_km=None, key=None):
+    """[(row, distance in km)] for the k nearest rows still matching the index, ranking deeper as needed."""
+    fetch = k + _SPARE
+    while True:
+        ids, distances = index.nearest(lat, lng, fetch, radius_km, key)
+        live = _live(db, model, ids, distances, k, index.where)
+        # Fewer hits than asked for means the index had no more within the radius
+        if len(live) == k or len(ids) < fetch:
+            return live
+        fetch *= 2
+
+
+def nearest_tasks(db, lat, lng, k=20, radius_km=None, category=None):
+    """[(task, distance in km)] for the k open tasks nearest lat/lng, closest first."""
+    return _nearest_live(db, tasks, Task, lat, lng, k, radius_km, category)
+
+
+def nearest_workers(db, lat, lng, k=20, radius_km=None):
+    """[(worker, distance in km)] for the k available workers nearest lat/lng, closest first."""
+    return _nearest_live(db, workers, Worker, lat, lng, k, radius_km)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nearest-neighbour ranking benchmark on random points")
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=20)
+    args = parser.parse_args()
+
+    import numpy as np
+    # Spread over Nepal's bounding box, the shape the real data has
+    rng = np.random.default_rng(42)
+    lat = rng.uniform(26.3, 30.5, args.points)
+    lng = rng.uniform(80.0, 88.2, args.points)
+    started = time.perf_counter()
+    points = Points(np.arange(args.points), lat, lng)
+    print(f"✓ {args.points:,d} points indexed in {time.perf_counter() - started:.2f}s")
+    origins = rng.integers(0, args.points, args.queries)
+    timings = []
+    for i in origins:
+        started = time.perf_counter()
+        ids, distances = points.nearest(lat[i], lng[i], args.k)
+        timings.append((time.perf_counter() - started) * 1000)
+    # Spot check against a brute-force scan
+    phi, lam = np.radians(lat), np.radians(lng)
+    a = (np.sin((phi - phi[i]) / 2) ** 2
+         + np.cos(phi[i]) * np.cos(phi) * np.sin((lam - lam[i]) / 2) ** 2)
+    brute = np.sort(2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)))[:args.k]
+    assert np.allclose(brute, distances), "ranking differs from a full scan"
+    timings.sort()
+    print(f"  k={args.k}: p50 {timings[len(timings) // 2]:.2f}ms  p99 {timings[int(len(timings) * 0.99)]:.2f}ms"
+          f"  max {timings[-1]:.2f}ms")
@@ -2,7 +2,6 @@
 # And set your Google OAuth credentials in environment variables or config
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from authlib.integrations.starlette_client import OAuth, OAuthError
 import os
 
 router = APIRouter()
@@ -11,29 +10,39 @@ router = APIRouter()
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "your-google-client-id")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET", "your-google-client-secret")
 
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={
-        'scope': 'openid email profile'
-    }
-)
+# authlib is slow to import, so the client is built on the first Google login
+_oauth = None
+
+def google_client():
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+        oauth = OAuth()
+        oauth.register(
+            name='google',
+            client_id=GOOGLE_CLIENT_ID,
+            client_secret=GOOGLE_CLIENT_SECRET,
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_kwargs={
+                'scope': 'openid email profile'
+            }
+        )
+        _oauth = oauth
+    return _oauth.google
 
 @router.get('/login/google')
 async def login_via_google(request: Request):
     redirect_uri = request.url_for('auth_google_callback')
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    return await google_client().authorize_redirect(request, redirect_uri)
 
 @router.get('/auth/google/callback')
 async def auth_google_callback(request: Request, db=Depends(lambda: None)):
+    from authlib.integrations.starlette_client import OAuthError
     try:
-        token = await oauth.google.authorize_access_token(request)
+        token = await google_client().authorize_access_token(request)
     except OAuthError:
         raise HTTPException(status_code=400, detail="Google OAuth failed")
-    user_info = await oauth.google.parse_id_token(request, token)
+    user_info = await google_client().parse_id_token(request, token)
     # Here, you would look up or create the user in your DB
     # For now, just return the user info
     return user_info
@@ -0,0 +1,116 @@
+# Cross-process cache invalidation through the database itself.
+#
+# Triggers on the versioned tables bump data_versions and append the changed
+# row's key to data_changes in the writer's transaction, whichever process
+# or connection made the write. Each process keeps one read-only connection
+# and asks SQLite's PRAGMA data_version - which changes whenever another
+# connection commits - before trusting its caches; only when it moved are
+# data_versions and the new data_changes rows read and subscribers told which
+# keys changed. With BMK_INVALIDATION_POLL_MS=0 (the default) every cache
+# lookup checks, so a commit in any worker is visible to the next lookup.
+import os
+import sqlite3
+import threading
+import time
+
+import job_queue
+import metrics
+from server import SQLITE_DB_PATH
+
+POLL_SECONDS = float(os.environ.get("BMK_INVALIDATION_POLL_MS", "0")) / 1000
+CHANGE_LOG_KEEP = int(os.environ.get("BMK_CHANGE_LOG_KEEP", "100000"))
+PRUNE_SECONDS = int(os.environ.get("BMK_CHANGE_LOG_PRUNE_SECONDS", "300"))
+
+INVALIDATIONS = metrics.Counter(
+    "bmk_cache_invalidations_total", "Cache invalidations received from data_changes", ("table", "scope"))
+
+_lock = threading.Lock()
+_conn = None
+_data_version = None
+_versions = {}
+_last_change_id = None
+_last_checked = 0.0
+_subscribers = {}  # table -> [callback(keys)], keys is a set of row keys or None for "everything"
+
+
+def subscribe(table, callback):
+    """Call callback(keys) after other writes to table; keys is None when the change log was outrun."""
+    _subscribers.setdefault(table, []).append(callback)
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(SQLITE_DB_PATH, check_same_thread=False, isolation_level=None)
+    return _conn
+
+
+def _read_changes(conn):
+    """New data_versions and change rows since the last poll; caller holds _lock."""
+    global _versions, _last_change_id
+    versions = dict(conn.execute("SELECT name, version FROM data_versions").fetchall())
+    changed = {table for table, version in versions.items() if _versions and _versions.get(table) != version}
+    _versions = versions
+    keys = {}
+    if _last_change_id is None:
+        # First look: start from the end of the log, caches are empty anyway
+        _last_change_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM data_changes").fetchone()[0]
+        return {}
+    if changed:
+        oldest = conn.execute("SELECT MIN(id) FROM data_changes").fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, table_name, row_key FROM data_changes WHERE id > ? ORDER BY id", (_last_change_id,)
+        ).fetchall()
+        outrun = oldest is not None and oldest > _last_change_id + 1
+        for _, table, row_key in rows:
+            keys.setdefault(table, set()).add(row_key)
+        if rows:
+            _last_change_id = rows[-1][0]
+        for table in changed:
+            # Pruned past us, or a bulk load bypassed the triggers: drop the whole table
+            if outrun or table not in keys:
+                keys[table] = None
+    return keys
+
+
+def poll(force=False):
+    """Check for writes by other connections and notify subscribers."""
+    global _data_version, _last_checked
+    now = time.monotonic()
+    if not force and POLL_SECONDS and now - _last_checked < POLL_SECONDS:
+        return
+    with _lock:
+        _last_checked = now
+        conn = _connection()
+        try:
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == _data_version and _last_change_id is not None:
+                return
+            keys = _read_changes(conn)
+            _data_version = data_version
+        except sqlite3.OperationalError:
+            # Schema not created yet
+            return
+    for table, changed_keys in keys.items():
+        INVALIDATIONS.inc((table, "all" if changed_keys is None else "keys"))
+        for callback in _subscribers.get(table, ()):
+            callback(changed_keys)
+
+
+def versions():
+    """Current data_versions counters, refreshed if another connection wrote."""
+    poll()
+    return _versions
+
+
+@job_queue.task("invalidation.prune")
+def prune(keep=CHANGE_LOG_KEEP):
+    """Trim data_changes to its newest keep rows; returns rows deleted."""
+    from server import engine
+    with engine.begin() as conn:
+        return conn.exec_driver_sql(
+            "DELETE FROM data_changes WHERE id <= (SELECT MAX(id) FROM data_changes) - ?", (keep,)
+        ).rowcount
+
+
+job_queue.every(PRUNE_SECONDS, "invalidation.prune", queue="maintenance")
@@ -0,0 +1,283 @@
+# Durable background job queue stored in the app's SQLite database.
+#
+# Handlers enqueue work with enqueue() and return; a pool of worker threads
+# started from the app lifespan claims jobs under a lease, runs the registered
+# function and retries failures with exponential backoff. A job whose worker
+# died is picked up again once its lease expires, unless it has used up its
+# attempts; then it is failed, so a job that kills its worker can't loop.
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import event, text
+
+from server import SessionLocal, engine, Job
+
+WORKERS = int(os.environ.get("BMK_JOB_WORKERS", "2"))
+POLL_SECONDS = float(os.environ.get("BMK_JOB_POLL_SECONDS", "1.0"))
+LEASE_SECONDS = float(os.environ.get("BMK_JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.environ.get("BMK_JOB_MAX_ATTEMPTS", "5"))
+BACKOFF_SECONDS = float(os.environ.get("BMK_JOB_BACKOFF_SECONDS", "2.0"))
+BACKOFF_MAX_SECONDS = 3600.0
+
+log = logging.getLogger(__name__)
+
+# Registered handlers: job name -> callable(**payload)
+_handlers = {}
+# Periodic jobs: name -> [interval_seconds, queue, next_run]
+_schedule = {}
+
+_wake = threading.Event()
+_stop = threading.Event()
+_threads = []
+
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(lambda: {
+    "enqueued": 0,
+    "completed": 0,
+    "retried": 0,
+    "failed": 0,
+    "wait_seconds_total": 0.0,
+    "run_seconds_total": 0.0,
+    "run_seconds_max": 0.0,
+})
+_started_at = time.time()
+
+
+def task(name):
+    """Decorator registering a function as the handler for job `name`."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def register(name, func):
+    _handlers[name] = func
+
+
+def every(seconds, name, queue="default"):
+    """Enqueue job `name` every `seconds` while the worker pool runs."""
+    _schedule[name] = [seconds, queue, 0.0]
+
+
+def enqueue(name, payload=None, queue="default", delay=0, max_attempts=None, db=None):
+    """Add a job. With `db` the job commits atomically with the caller's changes.
+
+    Workers are woken (and the job counted) once the job is committed; a
+    rollback of the caller's session drops it silently.
+    """
+    job = Job(
+        queue=queue,
+        name=name,
+        payload=json.dumps(payload or {}),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts or MAX_ATTEMPTS,
+        run_at=time.time() + delay,
+        created_at=time.time(),
+    )
+    session = db if db is not None else SessionLocal()
+    session.add(job)
+    session.info.setdefault("bmk_enqueued", []).append(queue)
+    if db is None:
+        try:
+            session.commit()
+        finally:
+            session.close()
+    return job
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _enqueued_committed(session):
+    queues = session.info.pop("bmk_enqueued", None)
+    if queues:
+        for queue in queues:
+            _record(queue, "enqueued")
+        _wake.set()
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _enqueued_rolled_back(session, previous_transaction):
+    session.info.pop("bmk_enqueued", None)
+
+
+def _record(queue, counter, amount=1):
+    with _metrics_lock:
+        _metrics[queue][counter] += amount
+
+
+def _claim(worker_id):
+    """Atomically lease the next runnable job, or return None."""
+    now = time.time()
+    token = f"{worker_id}:{uuid.uuid4().hex}"
+    with engine.begin() as conn:
+        # An expired lease whose job has no attempts left is a worker that
+        # died running it every time; fail it rather than lease it again
+        exhausted = conn.execute(
+            text(
+                "SELECT id, queue FROM jobs"
+                " WHERE status = 'running' AND lease_until < :now AND attempts >= max_attempts"
+            ),
+            {"now": now},
+        ).all()
+        for job_id, queue in exhausted:
+            conn.execute(
+                text(
+                    "UPDATE jobs SET status = 'failed', locked_by = NULL, lease_until = NULL,"
+                    " finished_at = :now, last_error = :error WHERE id = :id"
+                ),
+                {"id": job_id, "now": now, "error": "Lease expired on the last attempt"},
+            )
+            _record(queue, "failed")
+        claimed = conn.execute(
+            text(
+                "UPDATE jobs SET status = 'running', locked_by = :token, lease_until = :lease,"
+                " attempts = attempts + 1, started_at = :now"
+                " WHERE id = (SELECT id FROM jobs"
+                "  WHERE (status = 'queued' AND run_at <= :now)"
+                "     OR (status = 'running' AND lease_until < :now)"
+                "  ORDER BY run_at LIMIT 1)"
+            ),
+            {"token": token, "lease": now + LEASE_SECONDS, "now": now},
+        ).rowcount
+        if not claimed:
+            return None
+        return conn.execute(
+            text("SELECT id, queue, name, payload, attempts, max_attempts, run_at FROM jobs WHERE locked_by = :token"),
+            {"token": token},
+        ).mappings().first()
+
+
+def _finish(job, error=None):
+    with engine.begin() as conn:
+        if error is None:
+            # Finished jobs are removed; metrics keep the totals
+            conn.execute(text("DELETE FROM jobs WHERE id = :id"), {"id": job["id"]})
+        elif job["attempts"] < job["max_attempts"]:
+            backoff = min(BACKOFF_SECONDS * 2 ** (job["attempts"] - 1), BACKOFF_MAX_SECONDS)
+            conn.execute(
+                text(
+                    "UPDATE jobs SET status = 'queued', locked_by = NULL, lease_until = NULL,"
+                    " run_at = :run_at, last_error = :error WHERE id = :id"
+                ),
+                {"id": job["id"], "run_at": time.time() + backoff * random.uniform(0.8, 1.2), "error": error},
+            )
+        else:
+            conn.execute(
+                text(
+                    "UPDATE jobs SET status = 'failed', locked_by = NULL, lease_until = NULL,"
+                    " finished_at = :now, last_error = :error WHERE id = :id"
+                ),
+                {"id": job["id"], "now": time.time(), "error": error},
+            )
+
+
+def run_one(worker_id="inline"):
+    """Claim and run a single job. Returns False when nothing was runnable."""
+    job = _claim(worker_id)
+    if job is None:
+        return False
+    queue = job["queue"]
+    started = time.time()
+    _record(queue, "wait_seconds_total", max(0.0, started - job["run_at"]))
+    error = None
+    try:
+        handler = _handlers.get(job["name"])
+        if handler is None:
+            raise LookupError(f"No handler registered for job {job['name']!r}")
+        handler(**json.loads(job["payload"] or "{}"))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.time() - started
+    _finish(job, error)
+    with _metrics_lock:
+        m = _metrics[queue]
+        m["run_seconds_total"] += elapsed
+        m["run_seconds_max"] = max(m["run_seconds_max"], elapsed)
+        if error is None:
+            m["completed"] += 1
+        elif job["attempts"] < job["max_attempts"]:
+            m["retried"] += 1
+        else:
+            m["failed"] += 1
+    return True
+
+
+def _enqueue_due_periodic():
+    now = time.time()
+    for name, entry in list(_schedule.items()):
+        seconds, queue, next_run = entry
+        if now < next_run:
+            continue
+        entry[2] = now + seconds
+        db = SessionLocal()
+        try:
+            # Don't pile up copies if the previous run is still pending
+            pending = db.query(Job).filter(Job.name == name, Job.status.in_(["queued", "running"])).first()
+            if not pending:
+                enqueue(name, queue=queue, db=db)
+                db.commit()
+        finally:
+            db.close()
+
+
+def _worker_loop(worker_id, scheduler):
+    while not _stop.is_set():
+        try:
+            if scheduler:
+                _enqueue_due_periodic()
+            if run_one(worker_id):
+                continue
+        except Exception as e:
+            # Usually "database is locked" under write contention; try again shortly
+            log.warning("Job worker %s error: %s", worker_id, e)
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+
+
+def start_workers(count=None):
+    if any(t.is_alive() for t in _threads):
+        return
+    _stop.clear()
+    _threads.clear()
+    for i in range(count or WORKERS):
+        t = threading.Thread(target=_worker_loop, args=(f"w{i}", i == 0), name=f"bmk-jobs-{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+
+
+def stop_workers(timeout=5.0):
+    _stop.set()
+    _wake.set()
+    for t in _threads:
+        t.join(timeout)
+    _threads.clear()
+
+
+def stats(db):
+    """Per-queue throughput/latency since process start plus current backlog."""
+    uptime = max(time.time() - _started_at, 1e-9)
+    backlog = defaultdict(dict)
+    rows = db.execute(text("SELECT queue, status, COUNT(*) FROM jobs GROUP BY queue, status")).all()
+    for queue, status, count in rows:
+        backlog[queue][status] = count
+    with _metrics_lock:
+        queues = set(_metrics) | set(backlog)
+        result = {}
+        for queue in sorted(queues):
+            m = dict(_metrics[queue])
+            runs = m["completed"] + m["retried"] + m["failed"]
+            result[queue] = {
+                **m,
+                "throughput_per_second": round(m["completed"] / uptime, 4),
+                "avg_wait_seconds": round(m["wait_seconds_total"] / runs, 4) if runs else 0.0,
+                "avg_run_seconds": round(m["run_seconds_total"] / runs, 4) if runs else 0.0,
+                "backlog": backlog.get(queue, {}),
+            }
+    return {"workers": len([t for t in _threads if t.is_alive()]), "queues": result}
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+BMK Server - In-process load test and latency benchmark
+Drives server:app and/or bmk_server:app through httpx's ASGI transport (no
+network, no uvicorn) with a scripted mix of browse / search / chat poll /
+post task / login requests at a fixed concurrency, then reports throughput
+and p50/p95/p99 latency per route. Results are saved as JSON; pass an
+earlier file with --compare to flag p95 regressions between commits.
+
+Usage: python loadtest.py [--app server|bmk_server|both] [--concurrency 16]
+                          [--duration 10] [--tasks 2000] [--users 500]
+                          [--output loadtest_results.json] [--compare old.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, '.')
+
+import httpx
+
+_tmp = tempfile.mkdtemp(prefix="bmk-loadtest-")
+os.environ.setdefault("BMK_SQLITE_PATH", os.path.join(_tmp, "loadtest.db"))
+os.environ.setdefault("BMK_FILES_DIR", os.path.join(_tmp, "files"))
+# The load generator is a single client; don't let the limiter shape the numbers
+os.environ.setdefault("BMK_RATE_LIMIT_ENABLED", "0")
+
+SEARCH_TERMS = ["plumbing", "clean", "paint", "Kathmandu", "driver", "tutor", "repair"]
+
+
+# Each workload entry: (route name, weight, async fn(client, rng) -> response)
+
+def server_workload(users):
+    async def browse(client, rng):
+        return await client.get("/tasks")
+
+    async def search(client, rng):
+        return await client.get("/search", params={"q": rng.choice(SEARCH_TERMS)})
+
+    async def chat_poll(client, rng):
+        return await client.get("/chat")
+
+    async def post_task(client, rng):
+        return await client.post("/tasks", json={
+            "title": f"Load test task {rng.randrange(10**6)}",
+            "description": "Created by loadtest.py",
+            "user_id": rng.randrange(1, users + 1),
+        })
+
+    async def login(client, rng):
+        return await client.post("/login", json={"email": "loadtest@bmk.local", "password": "bmk123"})
+
+    return [
+        ("GET /tasks", 40, browse),
+        ("GET /search", 20, search),
+        ("GET /chat", 25, chat_poll),
+        ("POST /tasks", 10, post_task),
+        ("POST /login", 5, login),
+    ]
+
+
+def bmk_server_workload(users):
+    async def browse(client, rng):
+        return await client.get("/tasks", params={"status": "open"})
+
+    async def search(client, rng):
+        return await client.get("/search", params={"q": rng.choice(SEARCH_TERMS)})
+
+    async def workers(client, rng):
+        return await client.get("/workers")
+
+    async def post_task(client, rng):
+        return await client.post("/tasks", json={
+            "title": f"Load test task {rng.randrange(10**6)}", "description": "Created by loadtest.py",
+            "category": "General", "location": "Kathmandu", "budget": "1000", "duration": "1 day",
+            "poster_id": str(rng.randrange(users)), "poster_name": "Load Test", "poster_phone": "9800000000",
+        })
+
+    async def login(client, rng):
+        # bmk_server has no login; POST /users is the app's sign-in (find-or-create by phone)
+        return await client.post("/users", json={
+            "name": "Load Test", "phone": f"98{rng.randrange(users):08d}", "location": "Kathmandu",
+        })
+
+    return [
+        ("GET /tasks", 40, browse),
+        ("GET /search", 20, search),
+        ("GET /workers", 25, workers),
+        ("POST /tasks", 10, post_task),
+        ("POST /users", 5, login),
+    ]
+
+
+def setup_server(tasks, users):
+    import server
+    from generate_dataset import generate
+
+    # ASGITransport doesn't run the lifespan, which is where the schema is created
+    server.ensure_schema()
+    if not os.path.exists(os.environ["BMK_SQLITE_PATH"]) or not server.SessionLocal().query(server.Task).first():
+        generate(os.environ["BMK_SQLITE_PATH"], users=users, tasks=tasks, workers=min(users, tasks // 10),
+                 messages=tasks // 2, pro_fraction=0.05, seed=42, processes=1)
+    db = server.SessionLocal()
+    try:
+        if not db.query(server.User).filter(server.User.email == "loadtest@bmk.local").first():
+            db.add(server.User(name="Load Test", email="loadtest@bmk.local", role="worker",
+                               password_hash=server.get_password_hash("bmk123")))
+            db.commit()
+    finally:
+        db.close()
+    return server.app, server_workload(users)
+
+
+def setup_bmk_server(tasks, users):
+    import bmk_server
+
+    # Never touch the real bmk_data.json
+    bmk_server.DATA_FILE = os.path.join(_tmp, "bmk_data.json")
+    rng = random.Random(42)
+    bmk_server.save_data({
+        "users": [],
+        "workers": [],
+        "tasks": [
+            {
+                "id": str(i), "title": f"Task {i} {rng.choice(SEARCH_TERMS)}", "description": "Seeded",
+                "category": "General", "location": rng.choice(["Kathmandu", "Pokhara", "Biratnagar"]),
+                "budget": "1000", "duration": "1 day", "posted_date": f"2026-01-01T00:00:{i % 60:02d}",
+                "poster_id": str(i % users), "poster_name": "Seed", "poster_phone": "9800000000",
+                "status": rng.choice(["open", "closed"]), "is_urgent": False, "assigned_to": None,
+            }
+            for i in range(tasks)
+        ],
+    })
+    return bmk_server.app, bmk_server_workload(users)
+
+
+APPS = {"server": setup_server, "bmk_server": setup_bmk_server}
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+async def run_workload(app, workload, concurrency, duration, seed):
+    names = [name for name, _, _ in workload]
+    weights = [weight for _, weight, _ in workload]
+    fns = {name: fn for name, _, fn in workload}
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+    deadline = time.perf_counter() + duration
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        async def user(index):
+            rng = random.Random(f"{seed}:{index}")
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights=weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await fns[name](client, rng)
+                    status = response.status_code
+                except Exception as exc:
+                    # Unhandled errors propagate through the ASGI transport; record them by type
+                    status = type(exc).__name__
+                latencies[name].append(time.perf_counter() - started)
+                statuses[name][str(status)] += 1
+                if not isinstance(status, int) or status >= 500 or status == 404:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    routes = {}
+    for name in names:
+        values = sorted(latencies[name])
+        routes[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "statuses": dict(statuses[name]),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50_ms": round(_percentile(values, 50) * 1000, 3),
+            "p95_ms": round(_percentile(values, 95) * 1000, 3),
+            "p99_ms": round(_percentile(values, 99) * 1000, 3),
+        }
+    total = sum(r["requests"] for r in routes.values())
+    return {"elapsed_seconds": round(elapsed, 3), "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2), "routes": routes}
+
+
+def print_report(app_name, result):
+    print(f"\n{app_name}: {result['total_requests']} requests, {result['throughput_rps']} req/s")
+    print(f"  {'route':14s} {'reqs':>7s} {'err':>5s} {'rps':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for name, r in result["routes"].items():
+        print(f"  {name:14s} {r['requests']:7d} {r['errors']:5d} {r['throughput_rps']:8.1f} "
+              f"{r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f}")
+
+
+def compare(previous, current, threshold):
+    """Print per-route p95 / throughput deltas; return True if anything regressed."""
+    regressed = False
+    print(f"\nComparison with {previous['meta'].get('commit', 'previous run')} (threshold {threshold:.0%}):")
+    for app_name, result in current["apps"].items():
+        old_app = previous["apps"].get(app_name)
+        if not old_app:
+            continue
+        for name, r in result["routes"].items():
+            old = old_app["routes"].get(name)
+            if not old or not old["p95_ms"]:
+                continue
+            change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+            flag = ""
+            if change > threshold:
+                flag = "  <-- REGRESSION"
+                regressed = True
+            print(f"  {app_name:10s} {name:14s} p95 {old['p95_ms']:9.2f} -> {r['p95_ms']:9.2f} ms ({change:+.0%}){flag}")
+    return regressed
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test for the BMK apps")
+    parser.add_argument("--app", choices=["server", "bmk_server", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per app")
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks to seed")
+    parser.add_argument("--users", type=int, default=500, help="users to seed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 increase before failing")
+    args = parser.parse_args()
+
+    apps = list(APPS) if args.app == "both" else [args.app]
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "tasks": args.tasks,
+            "users": args.users,
+            "python": sys.version.split()[0],
+        },
+        "apps": {},
+    }
+    for app_name in apps:
+        app, workload = APPS[app_name](args.tasks, args.users)
+        result = asyncio.run(run_workload(app, workload, args.concurrency, args.duration, args.seed))
+        results["apps"][app_name] = result
+        print_report(app_name, result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if compare(previous, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
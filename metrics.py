@@ -0,0 +1,256 @@
+# Prometheus-style metrics for HTTP requests, the database and in-process caches.
+#
+# No client library: counters and histograms are plain dicts keyed by label
+# tuples, updated under one lock (a few dict operations per request) and
+# rendered in the text exposition format by render(). The middleware records
+# per route *template* ("/tasks/{task_id}") and status class so label
+# cardinality stays bounded.
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+ENABLED = os.environ.get("BMK_METRICS_ENABLED", "1") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+_lock = threading.Lock()
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, labels=(), amount=1):
+        with _lock:
+            self._inc(labels, amount)
+
+    def _inc(self, labels, amount):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self.series = {}
+        _metrics.append(self)
+
+    def observe(self, labels, value):
+        with _lock:
+            self._observe(labels, value)
+
+    def _observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = _labels(self.label_names, labels, [f'le="{_number(bound)}"'])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            base = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{base} {_number(total)}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+HTTP_REQUESTS = Counter(
+    "bmk_http_requests_total", "HTTP requests by route template and status class",
+    ("method", "route", "status"))
+HTTP_LATENCY = Histogram(
+    "bmk_http_request_duration_seconds", "HTTP request latency by route template and status class",
+    ("method", "route", "status"))
+REQUEST_QUERIES = Histogram(
+    "bmk_db_queries_per_request", "Database statements executed per HTTP request",
+    ("route",), QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram(
+    "bmk_db_time_per_request_seconds", "Time spent in database statements per HTTP request",
+    ("route",))
+DB_QUERIES = Counter("bmk_db_queries_total", "Database statements executed")
+DB_SECONDS = Counter("bmk_db_query_seconds_total", "Time spent executing database statements")
+CACHE_LOOKUPS = Counter("bmk_cache_lookups_total", "Cache lookups by result", ("cache", "result"))
+
+_in_flight = 0
+_db_instrumented = False
+
+
+class RequestStats:
+    """Per-request accumulator, reachable from any code running for the request."""
+
+    def __init__(self, scope=None):
+        self.scope = scope or {}
+        self.method = self.scope.get("method")
+        self.route = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        # statement shape -> executions, for query_profiler's N+1 check
+        self.shape_counts = {}
+
+
+_current = ContextVar("bmk_request_stats", default=None)
+
+
+def current_request():
+    """RequestStats for the request being handled, or None outside a request."""
+    return _current.get()
+
+
+def route_template(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and DB time per route template."""
+
+    def __init__(self, app, enabled=ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if not self.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with _lock:
+            _in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = stats.route = route_template(scope)
+            labels = (scope["method"], route, f"{status // 100}xx")
+            with _lock:
+                _in_flight -= 1
+                HTTP_REQUESTS._inc(labels, 1)
+                HTTP_LATENCY._observe(labels, elapsed)
+                if _db_instrumented:
+                    REQUEST_QUERIES._observe((route,), stats.queries)
+                    REQUEST_DB_SECONDS._observe((route,), stats.db_seconds)
+
+
+def instrument_engine(engine):
+    """Count and time every statement on engine, and export its pool usage."""
+    global _db_instrumented
+    from sqlalchemy import event  # bmk_server uses this module without SQLAlchemy
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bmk_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["bmk_query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        with _lock:
+            DB_QUERIES._inc((), 1)
+            DB_SECONDS._inc((), elapsed)
+
+    def _pool():
+        pool = engine.pool
+        lines = []
+        if hasattr(pool, "checkedout"):
+            lines += [
+                "# HELP bmk_db_pool_connections Database pool connections by state",
+                "# TYPE bmk_db_pool_connections gauge",
+                f'bmk_db_pool_connections{{state="checked_out"}} {pool.checkedout()}',
+                f'bmk_db_pool_connections{{state="idle"}} {pool.checkedin()}',
+                f'bmk_db_pool_connections{{state="overflow"}} {max(pool.overflow(), 0)}',
+                "# HELP bmk_db_pool_size Configured database pool size",
+                "# TYPE bmk_db_pool_size gauge",
+                f"bmk_db_pool_size {pool.size()}",
+            ]
+        return lines
+
+    register_collector(_pool)
+    _db_instrumented = True
+
+
+def cache_hit(cache):
+    CACHE_LOOKUPS.inc((cache, "hit"))
+
+
+def cache_miss(cache):
+    CACHE_LOOKUPS.inc((cache, "miss"))
+
+
+def _cache_ratios():
+    totals = {}
+    for (cache, result), n in list(CACHE_LOOKUPS.values.items()):
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (n if result == "hit" else 0), lookups + n)
+    lines = ["# HELP bmk_cache_hit_ratio Cache hits / lookups since start", "# TYPE bmk_cache_hit_ratio gauge"]
+    for cache, (hits, lookups) in sorted(totals.items()):
+        lines.append(f'bmk_cache_hit_ratio{{cache="{_escape(cache)}"}} {_number(hits / lookups if lookups else 0.0)}')
+    return lines
+
+
+def register_collector(fn):
+    """Add a callable returning exposition lines, evaluated on every scrape."""
+    _collectors.append(fn)
+
+
+def render():
+    with _lock:
+        lines = [
+            "# HELP bmk_http_requests_in_flight HTTP requests currently being handled",
+            "# TYPE bmk_http_requests_in_flight gauge",
+            f"bmk_http_requests_in_flight {_in_flight}",
+        ]
+        for metric in _metrics:
+            lines += metric.render()
+        lines += _cache_ratios()
+    for collector in _collectors:
+        lines += collector()
+    return "\n".join(lines) + "\n"
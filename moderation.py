@@ -1,10 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
-from server import get_db, User
+from datetime import datetime, timezone
+import os
+import tracing
+from server import get_db, require_admin, User, ChatMessage, Report
 
-router = APIRouter()
+router = APIRouter(route_class=tracing.TracedRoute)
+
+# A user is auto-flagged for review once this many reports against them,
+# open or reviewed, have come in since a moderator last cleared them;
+# dismissed reports don't count
+REPORT_FLAG_THRESHOLD = int(os.environ.get("BMK_REPORT_FLAG_THRESHOLD", "5"))
+MAX_PAGE_SIZE = 200
 
 class ReportCreate(BaseModel):
     reporter_id: int
@@ -13,18 +23,131 @@ class ReportCreate(BaseModel):
     reason: str
     details: Optional[str] = None
 
-# In-memory store for reports (replace with DB in production)
-REPORTS = []
+class ReportStatusUpdate(BaseModel):
+    status: str  # open | reviewed | dismissed
+
+REPORT_STATUSES = {"open", "reviewed", "dismissed"}
+
+def _report_dict(r: Report):
+    return {
+        "id": r.id,
+        "reporter_id": r.reporter_id,
+        "reported_user_id": r.reported_user_id,
+        "reported_message_id": r.reported_message_id,
+        "reason": r.reason,
+        "details": r.details,
+        "status": r.status,
+        "created_at": r.created_at.isoformat() if r.created_at else None,
+    }
+
+def _adjust_report_count(db: Session, user_id: int, delta: int):
+    # Single UPDATE keeps the counter correct under concurrent reports;
+    # the flag is sticky until a moderator clears it, and a clear raises the
+    # baseline the threshold counts from. Dismissing a report counted before
+    # the clear lowers the baseline with the count.
+    count = User.report_count + delta
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            report_count=count,
+            flag_baseline=func.min(User.flag_baseline, count),
+            flagged=((count - User.flag_baseline) >= REPORT_FLAG_THRESHOLD) | (User.flagged == 1),
+        )
+    )
 
 @router.post("/report")
 def report_content(report: ReportCreate, db: Session = Depends(get_db)):
-    # In production, save to DB
-    REPORTS.append(report.dict())
-    return {"message": "Report submitted", "report": report.dict()}
+    reported_user_id = report.reported_user_id
+    if reported_user_id is None and report.reported_message_id is not None:
+        msg = db.query(ChatMessage).filter(ChatMessage.id == report.reported_message_id).first()
+        reported_user_id = msg.user_id if msg else None
+    new_report = Report(
+        reporter_id=report.reporter_id,
+        reported_user_id=reported_user_id,
+        reported_message_id=report.reported_message_id,
+        reason=report.reason,
+        details=report.details,
+        status="open",
+        created_at=datetime.now(timezone.utc),
+    )
+    db.add(new_report)
+    if reported_user_id is not None:
+        _adjust_report_count(db, reported_user_id, 1)
+    db.commit()
+    db.refresh(new_report)
+    return {"message": "Report submitted", "report": _report_dict(new_report)}
 
 @router.get("/reports")
-def get_reports(admin: bool = False):
-    # In production, restrict to admins
-    if not admin:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    return REPORTS
+def get_reports(
+    admin: bool = False,
+    status: Optional[str] = None,
+    reported_user_id: Optional[int] = None,
+    reported_message_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+):
+    """Newest first; pass the returned next_before_id to fetch the next page."""
+    require_admin(admin)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(Report)
+    if status:
+        query = query.filter(Report.status == status)
+    if reported_user_id is not None:
+        query = query.filter(Report.reported_user_id == reported_user_id)
+    if reported_message_id is not None:
+        query = query.filter(Report.reported_message_id == reported_message_id)
+    if before_id is not None:
+        query = query.filter(Report.id < before_id)
+    reports = query.order_by(Report.id.desc()).limit(limit + 1).all()
+    page = reports[:limit]
+    return {
+        "items": [_report_dict(r) for r in page],
+        "next_before_id": page[-1].id if len(reports) > limit else None,
+    }
+
+@router.post("/reports/{report_id}/status")
+def update_report_status(report_id: int, data: ReportStatusUpdate, admin: bool = False, db: Session = Depends(get_db)):
+    require_admin(admin)
+    if data.status not in REPORT_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {sorted(REPORT_STATUSES)}")
+    report = db.query(Report).filter(Report.id == report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+    # Only dismissed reports stop counting against the user
+    if report.reported_user_id is not None and (report.status == "dismissed") != (data.status == "dismissed"):
+        _adjust_report_count(db, report.reported_user_id, -1 if data.status == "dismissed" else 1)
+    report.status = data.status
+    db.commit()
+    db.refresh(report)
+    return _report_dict(report)
+
+@router.get("/reports/queue")
+def get_flagged_users(admin: bool = False, offset: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+    """Triage queue: flagged users, most reported first."""
+    require_admin(admin)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    users = (
+        db.query(User)
+        .filter(User.flagged == 1, User.deleted == 0)
+        .order_by(User.report_count.desc(), User.id)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"id": u.id, "name": u.name, "email": u.email, "report_count": u.report_count, "banned": u.banned}
+        for u in users
+    ]
+
+@router.post("/reports/users/{user_id}/clear")
+def clear_user_flag(user_id: int, admin: bool = False, db: Session = Depends(get_db)):
+    require_admin(admin)
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.flagged = 0
+    user.flag_baseline = user.report_count
+    db.commit()
+    return {"detail": f"User {user_id} cleared"}
@@ -0,0 +1,114 @@
+# Deleting a user: hide now, remove later.
+#
+# delete_user flags the user row and everything they posted as deleted with
+# a few set-based UPDATEs on the user_id indexes, so the content disappears
+# from every read at once without loading a single child row, and frees the
+# email for a new registration. The rows themselves are removed afterwards
+# by a background job, with DELETEs of at most BMK_PURGE_BATCH_SIZE rows per
+# transaction, so purging a prolific spammer never holds the write lock for
+# more than a few milliseconds at a time. Purged ids are never reused (see
+# NO_ID_REUSE in server.py). A periodic sweep picks up any purge whose job
+# was lost.
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+import job_queue
+import metrics
+from server import engine
+
+BATCH_SIZE = int(os.environ.get("BMK_PURGE_BATCH_SIZE", "500"))
+# Pause between batches so waiting writers get the lock
+PAUSE_SECONDS = float(os.environ.get("BMK_PURGE_PAUSE_MS", "5")) / 1000
+SWEEP_SECONDS = int(os.environ.get("BMK_PURGE_SWEEP_SECONDS", "600"))
+
+# Tables with a deleted flag that a user's rows are hidden in
+USER_OWNED = ["tasks", "workers", "chat_messages"]
+
+# Removed for a deleted user, in this order; the user row goes last so an
+# interrupted purge is found again by the sweep. Recommendation lists that
+# lose a task are backfilled by the next recommendations.rebuild_all.
+USER_DEPENDENTS = [
+    ("worker_recommendations", "worker_id IN (SELECT id FROM workers WHERE user_id = :user_id)"),
+    ("worker_recommendations", "task_id IN (SELECT id FROM tasks WHERE user_id = :user_id)"),
+    ("chat_messages", "user_id = :user_id"),
+    ("tasks", "user_id = :user_id"),
+    ("workers", "user_id = :user_id"),
+    ("pro_subscriptions", "user_id = :user_id"),
+    ("task_quotas", "user_id = :user_id"),
+    ("users", "id = :user_id"),
+]
+
+PURGED = metrics.Counter("bmk_purged_rows_total", "Rows removed by the soft-delete purge", ("table",))
+
+_purging = set()
+_purging_lock = threading.Lock()
+
+
+def hide_user(db, user_id):
+    """Flag a user and their content deleted in the caller's transaction.
+
+    The email is released right away, so the address can register again
+    before the purge gets to the row.
+    """
+    db.execute(
+        text("UPDATE users SET deleted = 1, email = 'deleted-' || id || '@invalid' WHERE id = :user_id"),
+        {"user_id": user_id},
+    )
+    for table in USER_OWNED:
+        db.execute(
+            text(f"UPDATE {table} SET deleted = 1 WHERE user_id = :user_id AND deleted = 0"),
+            {"user_id": user_id},
+        )
+
+
+def _delete_batch(table, condition, user_id):
+    with engine.begin() as conn:
+        return conn.execute(
+            text(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT :limit)"),
+            {"user_id": user_id, "limit": BATCH_SIZE},
+        ).rowcount
+
+
+@job_queue.task("purge.user")
+def purge_user(user_id):
+    """Remove a deleted user's rows in small batches; returns rows deleted per table."""
+    with _purging_lock:
+        if user_id in _purging:
+            return {}
+        _purging.add(user_id)
+    try:
+        with engine.connect() as conn:
+            deleted = conn.execute(text("SELECT deleted FROM users WHERE id = :user_id"), {"user_id": user_id}).scalar()
+        if deleted != 1:
+            # Already purged, or not deleted at all
+            return {}
+        removed = {}
+        for table, condition in USER_DEPENDENTS:
+            while True:
+                count = _delete_batch(table, condition, user_id)
+                if count:
+                    removed[table] = removed.get(table, 0) + count
+                    PURGED.inc((table,), count)
+                if count < BATCH_SIZE:
+                    break
+                time.sleep(PAUSE_SECONDS)
+        return removed
+    finally:
+        with _purging_lock:
+            _purging.discard(user_id)
+
+
+@job_queue.task("purge.sweep")
+def sweep():
+    """Purge every user still flagged deleted; returns how many were purged."""
+    with engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users WHERE deleted = 1"))]
+    for user_id in user_ids:
+        purge_user(user_id)
+    return len(user_ids)
+
+
+job_queue.every(SWEEP_SECONDS, "purge.sweep", queue="maintenance")
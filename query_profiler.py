@@ -0,0 +1,148 @@
+# Statement profiling for the server.py engine.
+#
+# Every statement is timed and reduced to a "shape" (literals and IN lists
+# folded away). Shapes slower than BMK_SLOW_QUERY_MS are logged with the
+# route that issued them; a shape repeating more than
+# BMK_N_PLUS_ONE_THRESHOLD times within one request is reported as a likely
+# N+1; and per-shape totals over a rolling window feed a top-K report.
+# Bound parameters are never kept or logged: they carry passwords, tokens
+# and message text.
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+import metrics
+
+SLOW_QUERY_MS = float(os.environ.get("BMK_SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("BMK_N_PLUS_ONE_THRESHOLD", "10"))
+WINDOW_SECONDS = int(os.environ.get("BMK_QUERY_STATS_WINDOW", "3600"))
+MAX_SHAPES = 2000
+
+log = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+_lock = threading.Lock()
+# Two windows: totals cover the current window plus the one before it
+_current = {}
+_previous = {}
+_window_started = time.monotonic()
+_n_plus_one = {}
+
+
+@lru_cache(maxsize=4096)
+def shape(statement):
+    """Statement with literals replaced by ? and IN lists collapsed."""
+    s = _SPACES.sub(" ", statement).strip()
+    s = _STRING.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    return _IN_LIST.sub("(...)", s)
+
+
+def _route(stats):
+    if stats is None:
+        return None
+    return f"{stats.method} {metrics.route_template(stats.scope)}"
+
+
+def _rotate(now):
+    global _current, _previous, _window_started
+    if now - _window_started >= WINDOW_SECONDS:
+        _previous = _current if now - _window_started < 2 * WINDOW_SECONDS else {}
+        _current = {}
+        _window_started = now
+
+
+def _record(query_shape, elapsed, route):
+    now = time.monotonic()
+    with _lock:
+        _rotate(now)
+        entry = _current.get(query_shape)
+        if entry is None:
+            if len(_current) >= MAX_SHAPES:
+                return
+            entry = _current[query_shape] = {"count": 0, "total": 0.0, "max": 0.0, "routes": {}}
+        entry["count"] += 1
+        entry["total"] += elapsed
+        entry["max"] = max(entry["max"], elapsed)
+        if route:
+            entry["routes"][route] = entry["routes"].get(route, 0) + 1
+
+
+def _check_n_plus_one(stats, query_shape):
+    counts = stats.shape_counts
+    n = counts[query_shape] = counts.get(query_shape, 0) + 1
+    if n == N_PLUS_ONE_THRESHOLD + 1:
+        route = _route(stats)
+        log.warning("N+1 suspected on %s: statement ran %d+ times in one request: %s", route, n, query_shape)
+        with _lock:
+            key = (route, query_shape)
+            _n_plus_one[key] = _n_plus_one.get(key, 0) + 1
+
+
+def instrument(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bmk_profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["bmk_profile_start"].pop()
+        query_shape = shape(statement)
+        stats = metrics.current_request()
+        route = _route(stats)
+        _record(query_shape, elapsed, route)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            log.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000, route or "background", query_shape)
+        if stats is not None and not executemany:
+            _check_n_plus_one(stats, query_shape)
+
+
+def top_queries(limit=20, sort="total"):
+    """Slowest statement shapes over the rolling window, most expensive first."""
+    with _lock:
+        _rotate(time.monotonic())
+        merged = {}
+        for window in (_previous, _current):
+            for query_shape, entry in window.items():
+                m = merged.setdefault(query_shape, {"count": 0, "total": 0.0, "max": 0.0, "routes": {}})
+                m["count"] += entry["count"]
+                m["total"] += entry["total"]
+                m["max"] = max(m["max"], entry["max"])
+                for route, n in entry["routes"].items():
+                    m["routes"][route] = m["routes"].get(route, 0) + n
+        n_plus_one = [
+            {"route": route, "query": query_shape, "requests": n}
+            for (route, query_shape), n in sorted(_n_plus_one.items(), key=lambda kv: -kv[1])
+        ]
+    keys = {
+        "total": lambda m: m["total"],
+        "mean": lambda m: m["total"] / m["count"],
+        "max": lambda m: m["max"],
+        "count": lambda m: m["count"],
+    }
+    ranked = sorted(merged.items(), key=lambda kv: keys[sort](kv[1]), reverse=True)[:limit]
+    return {
+        "window_seconds": WINDOW_SECONDS,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "queries": [
+            {
+                "query": query_shape,
+                "count": m["count"],
+                "total_ms": round(m["total"] * 1000, 3),
+                "mean_ms": round(m["total"] / m["count"] * 1000, 3),
+                "max_ms": round(m["max"] * 1000, 3),
+                "routes": dict(sorted(m["routes"].items(), key=lambda kv: -kv[1])[:5]),
+            }
+            for query_shape, m in ranked
+        ],
+        "n_plus_one": n_plus_one,
+    }
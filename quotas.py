@@ -0,0 +1,128 @@
+# Free-plan task quota bookkeeping.
+# task_quotas keeps, per poster, the number of tasks counting toward the
+# free limit plus a copy of their subscription state, so create_task checks
+# and reserves a slot with one UPDATE instead of a subscription lookup and a
+# COUNT over the user's task history. reconcile() repairs any drift.
+import logging
+import os
+import time
+from datetime import timezone
+
+from sqlalchemy import func, text
+
+import job_queue
+from server import CLOSED_STATUSES, CLOSED_TASK_STATUSES, SessionLocal, ProSubscription, Task, TaskQuota
+
+log = logging.getLogger(__name__)
+
+FREE_TASK_LIMIT = 3
+RECONCILE_SECONDS = int(os.environ.get("BMK_QUOTA_RECONCILE_SECONDS", "3600"))
+
+
+def counts_toward_quota(status):
+    return (status or "open") not in CLOSED_STATUSES
+
+
+def _epoch(dt):
+    # SQLite hands DateTime columns back naive; they are stored as UTC
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _subscription_state(sub):
+    if not sub or sub.plan != "pro":
+        return "free", None
+    return "pro", (_epoch(sub.expires_at) if sub.expires_at else None)
+
+
+def _ensure_row(db, user_id):
+    """Create the counter row from the user's current tasks the first time we see them."""
+    exists = db.execute(text("SELECT 1 FROM task_quotas WHERE user_id = :u"), {"u": user_id}).first()
+    if exists:
+        return
+    open_tasks = (
+        db.query(Task)
+        .filter(Task.user_id == user_id, Task.deleted == 0)
+        .filter(func.coalesce(Task.status, "open").notin_(CLOSED_STATUSES))
+        .count()
+    )
+    sub = db.query(ProSubscription).filter(ProSubscription.user_id == user_id).first()
+    plan, expires_at = _subscription_state(sub)
+    # A concurrent first request may have created the row since; theirs stands
+    db.execute(
+        text(
+            "INSERT INTO task_quotas (user_id, open_tasks, plan, expires_at) VALUES (:u, :n, :p, :e)"
+            " ON CONFLICT (user_id) DO NOTHING"
+        ),
+        {"u": user_id, "n": open_tasks, "p": plan, "e": expires_at},
+    )
+
+
+def try_reserve(db, user_id, enforce):
+    """Count one more open task for user_id. With enforce, refuse if over the free limit.
+
+    Check and increment are a single UPDATE, so concurrent posts can't both
+    slip under the limit.
+    """
+    _ensure_row(db, user_id)
+    condition = ""
+    if enforce:
+        condition = (
+            " AND (open_tasks < :limit"
+            " OR (plan = 'pro' AND (expires_at IS NULL OR expires_at >= :now)))"
+        )
+    result = db.execute(
+        text(f"UPDATE task_quotas SET open_tasks = open_tasks + 1 WHERE user_id = :u{condition}"),
+        {"u": user_id, "limit": FREE_TASK_LIMIT, "now": time.time()},
+    )
+    return result.rowcount == 1
+
+
+def adjust(db, user_id, delta):
+    # Tasks without a poster have no counter
+    if user_id is not None and delta:
+        _ensure_row(db, user_id)
+        db.execute(
+            text("UPDATE task_quotas SET open_tasks = MAX(open_tasks + :d, 0) WHERE user_id = :u"),
+            {"u": user_id, "d": delta},
+        )
+
+
+def set_subscription(db, user_id, sub):
+    _ensure_row(db, user_id)
+    plan, expires_at = _subscription_state(sub)
+    db.execute(
+        text("UPDATE task_quotas SET plan = :p, expires_at = :e WHERE user_id = :u"),
+        {"u": user_id, "p": plan, "e": expires_at},
+    )
+
+
+@job_queue.task("quotas.reconcile")
+def reconcile():
+    """Recompute every counter row from tasks and subscriptions; returns rows repaired."""
+    db = SessionLocal()
+    try:
+        actual = {
+            user_id: count
+            for user_id, count in db.execute(text(
+                "SELECT user_id, COUNT(*) FROM tasks"
+                f" WHERE user_id IS NOT NULL AND deleted = 0 AND COALESCE(status, 'open') NOT IN {CLOSED_TASK_STATUSES}"
+                " GROUP BY user_id"
+            ))
+        }
+        subs = {s.user_id: _subscription_state(s) for s in db.query(ProSubscription).all()}
+        repaired = 0
+        for row in db.query(TaskQuota).all():
+            plan, expires_at = subs.get(row.user_id, ("free", None))
+            open_tasks = actual.get(row.user_id, 0)
+            if (row.open_tasks, row.plan, row.expires_at) != (open_tasks, plan, expires_at):
+                row.open_tasks, row.plan, row.expires_at = open_tasks, plan, expires_at
+                repaired += 1
+        db.commit()
+        if repaired:
+            log.info("Quota reconcile repaired %d rows", repaired)
+        return repaired
+    finally:
+        db.close()
+
+
+job_queue.every(RECONCILE_SECONDS, "quotas.reconcile", queue="maintenance")
@@ -0,0 +1,214 @@
+# Per-IP and per-user rate limiting for abuse-prone routes.
+#
+# Every request is classified into a route class; each class has a token
+# bucket (burst + steady refill) and a sliding window cap. State is kept per
+# key in memory with O(1) updates and idle-key eviction, or in a small SQLite
+# file of its own when several workers need to share it
+# (BMK_RATE_LIMIT_BACKEND=sqlite), so its write locks never queue behind the
+# app's. Signed-in requests are also keyed on the user id of a valid token.
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from starlette.concurrency import run_in_threadpool
+
+ENABLED = os.environ.get("BMK_RATE_LIMIT_ENABLED", "1") == "1"
+BACKEND = os.environ.get("BMK_RATE_LIMIT_BACKEND", "memory")  # memory | sqlite
+# Number of trusted proxies in front of the app (render.yaml sets 1). Each one
+# appends the address it saw to X-Forwarded-For, so the client is that many
+# entries from the right; anything further left is whatever the client sent.
+TRUST_FORWARDED = int(os.environ.get("BMK_TRUST_FORWARDED", "0"))
+IDLE_SECONDS = 15 * 60
+MAX_KEYS = 100_000
+
+# burst: bucket size; rate: tokens/second; window/limit: sliding window cap
+RouteLimit = namedtuple("RouteLimit", "burst rate window limit")
+
+LIMITS = {
+    "login": RouteLimit(burst=5, rate=5 / 60, window=3600, limit=30),
+    "chat": RouteLimit(burst=20, rate=1.0, window=60, limit=60),
+    "tasks": RouteLimit(burst=10, rate=10 / 60, window=3600, limit=100),
+    "upload": RouteLimit(burst=5, rate=1 / 60, window=3600, limit=30),
+    # Each request may write up to server.MAX_BATCH_SIZE rows
+    "batch": RouteLimit(burst=2, rate=1 / 60, window=3600, limit=20),
+    "default": RouteLimit(burst=120, rate=10.0, window=60, limit=600),
+}
+
+_ROUTE_CLASSES = {
+    ("POST", "/login"): "login",
+    ("POST", "/register"): "login",
+    ("GET", "/login/google"): "login",
+    ("POST", "/chat"): "chat",
+    ("POST", "/tasks"): "tasks",
+    ("POST", "/upload"): "upload",
+    ("POST", "/tasks/batch"): "batch",
+    ("POST", "/users/batch"): "batch",
+    ("POST", "/workers/batch"): "batch",
+}
+
+
+def classify(method, path):
+    return _ROUTE_CLASSES.get((method, path.rstrip("/") or "/"), "default")
+
+
+def _step(state, limit, now):
+    """Advance one key's state by a request. Returns (state, retry_after or 0)."""
+    if state is None:
+        tokens, last, window_start, count, prev = float(limit.burst), now, now, 0, 0
+    else:
+        tokens, last, window_start, count, prev = state
+        tokens = min(float(limit.burst), tokens + (now - last) * limit.rate)
+    elapsed = now - window_start
+    if elapsed >= limit.window:
+        prev = count if elapsed < 2 * limit.window else 0
+        window_start = now - (elapsed % limit.window)
+        count = 0
+        elapsed = now - window_start
+    # Sliding window estimate: previous window weighted by its remaining overlap
+    estimated = prev * (1 - elapsed / limit.window) + count
+    retry_after = 0.0
+    if tokens < 1:
+        retry_after = (1 - tokens) / limit.rate
+    elif estimated + 1 > limit.limit:
+        retry_after = limit.window - elapsed
+    else:
+        tokens -= 1
+        count += 1
+    return (tokens, now, window_start, count, prev), retry_after
+
+
+class MemoryStore:
+    """LRU-ordered dict of key -> state; idle keys are evicted from the front."""
+
+    def __init__(self, max_keys=MAX_KEYS, idle_seconds=IDLE_SECONDS):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._state = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            state, retry_after = _step(self._state.get(key), limit, now)
+            self._state[key] = state
+            self._state.move_to_end(key)
+            # Bounded work per request keeps updates O(1)
+            for _ in range(8):
+                oldest_key, oldest = next(iter(self._state.items()))
+                if len(self._state) <= self.max_keys and now - oldest[1] < self.idle_seconds:
+                    break
+                del self._state[oldest_key]
+        return retry_after
+
+    def __len__(self):
+        return len(self._state)
+
+
+class SQLiteStore:
+    """Shared state for multi-worker deployments, in a SQLite file of its own."""
+
+    def __init__(self, db_path, idle_seconds=IDLE_SECONDS):
+        self.db_path = db_path
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._hits = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " key TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limits_updated_at ON rate_limits (updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            # Buckets are cheap to lose; don't wait on fsync for them
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, limit, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            state, retry_after = _step(tuple(json.loads(row[0])) if row else None, limit, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (key, state, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(state), now),
+            )
+            self._hits += 1
+            if self._hits % 1000 == 0:
+                conn.execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - self.idle_seconds,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+def _client_ip(scope, headers, trusted=TRUST_FORWARDED):
+    if trusted:
+        forwarded = [hop.strip() for hop in headers.get(b"x-forwarded-for", b"").split(b",") if hop.strip()]
+        if len(forwarded) >= trusted:
+            return forwarded[-trusted].decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After once a key runs dry."""
+
+    def __init__(self, app, backend=BACKEND, db_path=None, enabled=ENABLED, user_id=None,
+                 trusted_proxies=TRUST_FORWARDED):
+        self.app = app
+        self.enabled = enabled
+        # user_id(authorization header) -> id of the signed-in user, or None
+        self.user_id = user_id
+        self.trusted_proxies = trusted_proxies
+        if backend == "sqlite":
+            self.store = SQLiteStore(db_path)
+            self._blocking = True
+        else:
+            self.store = MemoryStore()
+            self._blocking = False
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route_class = classify(scope["method"], scope["path"])
+        limit = LIMITS[route_class]
+        headers = dict(scope["headers"])
+        keys = [f"{route_class}:ip:{_client_ip(scope, headers, self.trusted_proxies)}"]
+        auth = headers.get(b"authorization")
+        user_id = self.user_id(auth) if auth and self.user_id else None
+        if user_id is not None:
+            keys.append(f"{route_class}:user:{user_id}")
+        for key in keys:
+            if self._blocking:
+                retry_after = await run_in_threadpool(self.store.hit, key, limit)
+            else:
+                retry_after = self.store.hit(key, limit)
+            if retry_after:
+                return await self._reject(send, retry_after)
+        return await self.app(scope, receive, send)
+
+    async def _reject(self, send, retry_after):
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
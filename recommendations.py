@@ -0,0 +1,266 @@
+# Precomputed task recommendations for available workers.
+# Scores are kept in the worker_recommendations table so the app only does
+# a single indexed read when a worker opens their feed.
+import heapq
+import json
+import os
+import re
+
+from sqlalchemy import func, or_, tuple_
+
+import job_queue
+from server import CLOSED_STATUSES, SessionLocal, Task, Worker, WorkerRecommendation
+
+# How many tasks to keep per worker
+TOP_N = int(os.environ.get("BMK_RECOMMENDATIONS_TOP_N", "20"))
+# Full rebuild interval (seconds)
+REFRESH_SECONDS = int(os.environ.get("BMK_RECOMMENDATIONS_REFRESH_SECONDS", "900"))
+
+QUEUE = "recommendations"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokens(text):
+    return {w for w in _WORD_RE.findall((text or "").lower()) if len(w) > 2}
+
+
+def _skill_tokens(skills):
+    # skills is stored as a JSON list, but older rows hold plain comma strings
+    try:
+        parsed = json.loads(skills) if skills else []
+    except ValueError:
+        parsed = skills.split(",")
+    if isinstance(parsed, str):
+        parsed = [parsed]
+    tokens = set()
+    for skill in parsed:
+        tokens |= _tokens(str(skill))
+    return tokens
+
+
+def _is_open(task):
+    return not task.deleted and (task.status or "open") not in CLOSED_STATUSES
+
+
+def _profile(worker):
+    return _skill_tokens(worker.skills), _tokens(worker.location)
+
+
+def score(profile, task_tokens):
+    """Score a task for a worker profile; 0 means not relevant."""
+    skills, location = profile
+    matched = len(skills & task_tokens)
+    if not matched:
+        return 0.0
+    return matched + (0.5 if location & task_tokens else 0.0)
+
+
+def _task_tokens(task):
+    return _tokens(f"{task.title or ''} {task.description or ''}")
+
+
+def _replace_worker_rows(db, worker_id, scored):
+    db.query(WorkerRecommendation).filter(WorkerRecommendation.worker_id == worker_id).delete()
+    db.add_all(
+        WorkerRecommendation(worker_id=worker_id, task_id=task_id, score=s)
+        for s, task_id in scored
+    )
+
+
+def _rank_open_tasks(profile, open_tasks):
+    scored = ((score(profile, tokens), task_id) for task_id, tokens in open_tasks)
+    return heapq.nlargest(TOP_N, (item for item in scored if item[0] > 0))
+
+
+def _load_open_tasks(db):
+    rows = (
+        db.query(Task.id, Task.title, Task.description)
+        .filter(Task.deleted == 0, func.coalesce(Task.status, "open").notin_(CLOSED_STATUSES))
+        .all()
+    )
+    return [(row.id, _task_tokens(row)) for row in rows]
+
+
+def _chunks(items, size=500):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _matching_workers(db, tokens):
+    """Available workers whose skills may contain one of tokens (a superset; score() decides)."""
+    if not tokens:
+        return []
+    query = db.query(Worker.id, Worker.skills, Worker.location).filter(Worker.isAvailable == 1, Worker.deleted == 0)
+    # SQLite's LIKE only folds ASCII case; a token with other cased letters can't be prefiltered
+    if any(not c.isascii() and c.upper() != c for token in tokens for c in token):
+        return query.all()
+    # LIKE is case-insensitive; skills JSON may also hold \u escapes, which only score() can read
+    return query.filter(or_(
+        Worker.skills.contains("\\u", autoescape=True),
+        *(Worker.skills.contains(token, autoescape=True) for token in tokens),
+    )).all()
+
+
+def _list_stats(db, worker_ids):
+    """worker_id -> (list length, lowest (score, task_id)) for those of worker_ids with a list."""
+    stats = {}
+    for chunk in _chunks(worker_ids):
+        ranked = (
+            db.query(
+                WorkerRecommendation.worker_id,
+                WorkerRecommendation.score,
+                WorkerRecommendation.task_id,
+                func.count().over(partition_by=WorkerRecommendation.worker_id).label("length"),
+                func.row_number().over(
+                    partition_by=WorkerRecommendation.worker_id,
+                    order_by=(WorkerRecommendation.score.asc(), WorkerRecommendation.task_id.asc()),
+                ).label("rank"),
+            )
+            .filter(WorkerRecommendation.worker_id.in_(chunk))
+            .subquery()
+        )
+        for row in db.query(ranked).filter(ranked.c.rank == 1):
+            stats[row.worker_id] = (row.length, (row.score, row.task_id))
+    return stats
+
+
+@job_queue.task("recommendations.refresh_worker")
+def refresh_worker(worker_id):
+    """Recompute the full top-N list for one worker (profile edits)."""
+    db = SessionLocal()
+    try:
+        worker = db.query(Worker).filter(Worker.id == worker_id).first()
+        if not worker or not worker.isAvailable or worker.deleted:
+            db.query(WorkerRecommendation).filter(WorkerRecommendation.worker_id == worker_id).delete()
+        else:
+            _replace_worker_rows(db, worker_id, _rank_open_tasks(_profile(worker), _load_open_tasks(db)))
+        db.commit()
+    finally:
+        db.close()
+
+
+@job_queue.task("recommendations.task_saved")
+def on_task_saved(task_id):
+    """Incrementally fold a created or updated task into the lists it belongs in.
+
+    Only workers whose skills share a token with the task, and workers
+    already listing it, are touched, with a fixed number of queries.
+    """
+    db = SessionLocal()
+    try:
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task or not _is_open(task):
+            affected = _drop_task(db, task_id)
+        else:
+            affected = _fold_task(db, task_id, _task_tokens(task))
+        db.commit()
+    finally:
+        db.close()
+    # A task leaving a full list may let a previously cut task back in
+    for worker_id in affected:
+        refresh_worker(worker_id)
+
+
+@job_queue.task("recommendations.tasks_saved")
+def on_tasks_saved(task_ids):
+    for task_id in task_ids:
+        on_task_saved(task_id)
+
+
+@job_queue.task("recommendations.refresh_workers")
+def refresh_workers(worker_ids):
+    for worker_id in worker_ids:
+        refresh_worker(worker_id)
+
+
+@job_queue.task("recommendations.task_deleted")
+def on_task_deleted(task_id):
+    db = SessionLocal()
+    try:
+        affected = _drop_task(db, task_id)
+        db.commit()
+    finally:
+        db.close()
+    for worker_id in affected:
+        refresh_worker(worker_id)
+
+
+def _drop_task(db, task_id):
+    """Remove a task from all lists; returns workers whose full list shrank."""
+    rows = db.query(WorkerRecommendation).filter(WorkerRecommendation.task_id == task_id).all()
+    stats = _list_stats(db, [r.worker_id for r in rows])
+    affected = [r.worker_id for r in rows if stats[r.worker_id][0] >= TOP_N]
+    for r in rows:
+        db.delete(r)
+    return affected
+
+
+def _fold_task(db, task_id, tokens):
+    """Insert/update a task's score in every list it belongs in, keeping lists at TOP_N.
+
+    Returns the workers whose full list the task dropped out of; they need
+    a full refresh to backfill.
+    """
+    scores = {}
+    for worker in _matching_workers(db, tokens):
+        s = score(_profile(worker), tokens)
+        if s > 0:
+            scores[worker.id] = s
+    existing = {
+        r.worker_id: r
+        for r in db.query(WorkerRecommendation).filter(WorkerRecommendation.task_id == task_id)
+    }
+    dropped = [worker_id for worker_id in existing if worker_id not in scores]
+    added = [worker_id for worker_id in scores if worker_id not in existing]
+    stats = _list_stats(db, dropped + added)
+    affected = [worker_id for worker_id in dropped if stats[worker_id][0] >= TOP_N]
+    for worker_id in dropped:
+        db.delete(existing[worker_id])
+    for worker_id, row in existing.items():
+        if worker_id in scores:
+            row.score = scores[worker_id]
+    evicted = []
+    for worker_id in added:
+        s = scores[worker_id]
+        length, lowest = stats.get(worker_id, (0, None))
+        if length >= TOP_N:
+            if (s, task_id) <= lowest:
+                continue
+            evicted.append((worker_id, lowest[1]))
+        db.add(WorkerRecommendation(worker_id=worker_id, task_id=task_id, score=s))
+    for chunk in _chunks(evicted):
+        db.query(WorkerRecommendation).filter(
+            tuple_(WorkerRecommendation.worker_id, WorkerRecommendation.task_id).in_(chunk)
+        ).delete(synchronize_session=False)
+    return affected
+
+
+@job_queue.task("recommendations.rebuild_all")
+def rebuild_all():
+    """Recompute every available worker's list from scratch."""
+    db = SessionLocal()
+    try:
+        open_tasks = _load_open_tasks(db)
+        db.query(WorkerRecommendation).delete()
+        for worker in db.query(Worker).filter(Worker.isAvailable == 1, Worker.deleted == 0).all():
+            _replace_worker_rows(db, worker.id, _rank_open_tasks(_profile(worker), open_tasks))
+        db.commit()
+    finally:
+        db.close()
+
+
+def top_tasks(db, worker_id, limit=TOP_N):
+    """Read a worker's precomputed list (served from the worker/score index)."""
+    return (
+        db.query(Task, WorkerRecommendation.score)
+        .join(WorkerRecommendation, WorkerRecommendation.task_id == Task.id)
+        .filter(WorkerRecommendation.worker_id == worker_id, Task.deleted == 0)
+        .order_by(WorkerRecommendation.score.desc(), WorkerRecommendation.task_id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+job_queue.every(REFRESH_SECONDS, "recommendations.rebuild_all", queue=QUEUE)
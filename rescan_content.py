@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+BMK Server - Re-check stored content against the current bad-word list
+Streams chat messages, tasks and workers in id order, scans each chunk in a
+process pool and writes the flagged column back in bulk.
+
+Usage: python rescan_content.py [--words-file words.txt] [--chunk-size 5000] [--processes N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, '.')
+
+import content_filter
+
+# table -> columns that are scanned together
+TABLES = {
+    "chat_messages": ["content"],
+    "tasks": ["title", "description"],
+    "workers": ["name", "skills", "about"],
+}
+
+
+def _init_worker(words):
+    content_filter.set_bad_words(words)
+
+
+def _scan_chunk(rows):
+    """rows: [(id, flagged, text)] -> [(new_flag, id)] for rows whose flag changed."""
+    hits = content_filter.find_bad_words_batch([text for _, _, text in rows])
+    changes = []
+    for (row_id, flagged, _), found in zip(rows, hits):
+        new_flag = 1 if found else 0
+        if (flagged or 0) != new_flag:
+            changes.append((new_flag, row_id))
+    return changes
+
+
+def _read_chunks(conn, table, columns, chunk_size):
+    # Keyset pagination keeps each read an index range scan
+    text_expr = " || ' ' || ".join(f"COALESCE({c}, '')" for c in columns)
+    last_id = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            f"SELECT id, flagged, {text_expr} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(r) for r in rows]
+
+
+def rescan(chunk_size=5000, processes=None):
+    from server import engine, ensure_schema
+
+    ensure_schema()
+
+    words = list(content_filter.BAD_WORDS)
+    processes = processes or os.cpu_count() or 1
+    report = {}
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(words,)) as pool:
+        for table, columns in TABLES.items():
+            started = time.perf_counter()
+            scanned = flagged = cleared = 0
+            with engine.connect() as reader:
+                chunks = _read_chunks(reader, table, columns, chunk_size)
+                # Keep a bounded number of chunks in flight so memory stays flat
+                pending = []
+                for chunk in chunks:
+                    scanned += len(chunk)
+                    pending.append(pool.submit(_scan_chunk, chunk))
+                    if len(pending) >= processes * 2:
+                        flagged, cleared = _apply(table, pending.pop(0).result(), flagged, cleared)
+                for future in pending:
+                    flagged, cleared = _apply(table, future.result(), flagged, cleared)
+            elapsed = time.perf_counter() - started
+            report[table] = {
+                "scanned": scanned,
+                "flagged": flagged,
+                "cleared": cleared,
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(scanned / elapsed) if elapsed else scanned,
+            }
+            print(f"  {table:14s} {scanned:9d} rows  +{flagged} flagged  -{cleared} cleared  "
+                  f"{report[table]['rows_per_second']} rows/s")
+    return report
+
+
+def _apply(table, changes, flagged, cleared):
+    from server import engine
+
+    if changes:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"UPDATE {table} SET flagged = ? WHERE id = ?", changes)
+    flagged += sum(1 for flag, _ in changes if flag)
+    cleared += sum(1 for flag, _ in changes if not flag)
+    return flagged, cleared
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-check stored content against the bad-word list")
+    parser.add_argument("--words-file", help="word list to use (one per line)")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.words_file:
+        content_filter.load_bad_words(args.words_file)
+    print(f"Rescanning with {len(content_filter.BAD_WORDS)} words...")
+    print("-" * 60)
+    rescan(chunk_size=args.chunk_size, processes=args.processes)
+    print("-" * 60)
+    print("Rescan complete!")
@@ -0,0 +1,101 @@
+# Historical activity from the daily_rollups table.
+#
+# Triggers (ROLLUP_TRIGGERS in server.py) add every new user, task, closed
+# task, chat message and Pro upgrade to its day x municipality x category
+# row, and to its day x category row, in the writer's transaction. Queries
+# that don't split by place read the small per-category table; the rest sum
+# the municipality rows, whose number is bounded by the places and
+# categories active each day rather than by how large the raw tables grow.
+# rebuild() recomputes the columns that can be derived from the rows still
+# in the tables (tasks and chat messages) after bulk loads that bypassed
+# the triggers; new users and Pro upgrades only exist as rollups.
+import argparse
+from datetime import date
+
+from sqlalchemy import text
+
+from server import ROLLUP_BACKFILL, ROLLUP_METRICS as METRICS, ROLLUP_SUMMARY, engine
+
+GROUPS = ("day", "municipality", "category", "district")
+MAX_RANGE_DAYS = 731
+
+# Districts come from the municipalities table; a name shared by
+# municipalities in different districts has none
+_DISTRICT_OF = (
+    "SELECT name, CASE WHEN COUNT(DISTINCT district) = 1 THEN MIN(district) END AS district "
+    "FROM municipalities GROUP BY name"
+)
+
+
+def timeseries(since, until, group_by=("day",), municipality=None, district=None, category=None):
+    """Summed rollups for days since..until (inclusive), one row per group_by combination."""
+    by_place = district is not None or municipality is not None or {"municipality", "district"} & set(group_by)
+    # District isn't stored: sum per municipality first, then map those (few) rows to districts
+    inner_keys = [g for g in group_by if g != "district"]
+    if "district" in group_by and "municipality" not in inner_keys:
+        inner_keys.append("municipality")
+    where = ["day >= :since", "day <= :until"]
+    params = {"since": since.isoformat(), "until": until.isoformat()}
+    if municipality is not None:
+        where.append("municipality = :municipality")
+        params["municipality"] = municipality
+    if category is not None:
+        where.append("category = :category")
+        params["category"] = category
+    if district is not None:
+        # As a list of municipalities, so the (municipality, day) index does the work
+        where.append(f"municipality IN (SELECT name FROM ({_DISTRICT_OF}) WHERE district = :district)")
+        params["district"] = district
+    inner = ", ".join(inner_keys + [f"SUM({metric}) AS {metric}" for metric in METRICS])
+    inner = f"SELECT {inner} FROM {'daily_rollups' if by_place else 'daily_category_rollups'} WHERE {' AND '.join(where)}"
+    if inner_keys:
+        inner += f" GROUP BY {', '.join(inner_keys)}"
+    outer_keys = ["COALESCE(m.district, '')" if g == "district" else f"r.{g}" for g in group_by]
+    columns = [f"{key} AS {name}" for name, key in zip(group_by, outer_keys)]
+    columns += [f"SUM(r.{metric}) AS {metric}" for metric in METRICS]
+    sql = f"SELECT {', '.join(columns)} FROM ({inner}) r"
+    if "district" in group_by:
+        sql += f" LEFT JOIN ({_DISTRICT_OF}) m ON m.name = r.municipality"
+    if outer_keys:
+        sql += f" GROUP BY {', '.join(outer_keys)} ORDER BY {', '.join(outer_keys)}"
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql), params).mappings().all()
+    # A total over no rollup rows comes back as one row of NULLs
+    return [
+        {**row, **{metric: row[metric] or 0 for metric in METRICS}}
+        for row in rows
+        if outer_keys or row["new_tasks"] is not None
+    ]
+
+
+def rebuild():
+    """Recompute task and chat columns from the raw tables; returns rollup rows afterwards."""
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE daily_rollups SET new_tasks = 0, closed_tasks = 0, chat_messages = 0")
+        for statement in ROLLUP_BACKFILL:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(
+            "DELETE FROM daily_rollups WHERE " + " AND ".join(f"{metric} = 0" for metric in METRICS)
+        )
+        for statement in ROLLUP_SUMMARY:
+            conn.exec_driver_sql(statement)
+        return conn.exec_driver_sql("SELECT COUNT(*) FROM daily_rollups").scalar()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily activity rollups")
+    parser.add_argument("--rebuild", action="store_true", help="recompute task and chat counts from the tables")
+    parser.add_argument("--since", type=date.fromisoformat)
+    parser.add_argument("--until", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--group-by", default="day")
+    args = parser.parse_args()
+
+    from server import ensure_schema
+    ensure_schema()
+    if args.rebuild:
+        print(f"✓ {rebuild():,d} rollup rows")
+    since = args.since or date.fromordinal(args.until.toordinal() - 29)
+    group_by = args.group_by.split(",")
+    for row in timeseries(since, args.until, group_by=group_by):
+        print("  ".join(f"{row[g]!s:>16s}" for g in group_by), "  ",
+              "  ".join(f"{metric}={row[metric]}" for metric in METRICS))
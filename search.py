@@ -0,0 +1,192 @@
+# Full-text search over tasks, workers and chat messages.
+#
+# The FTS5 tables and their sync triggers are created by ensure_schema()
+# (see SEARCH_INDEXES in server.py); this module turns user input into a safe
+# MATCH expression and runs ranked, paginated queries with highlighted
+# snippets. Every term is quoted, so punctuation in the input can't become
+# FTS syntax; the last term (and any term ending in *) matches as a prefix,
+# which is what a search-as-you-type box sends. `python search.py --rebuild`
+# reindexes from the content tables if an index is ever suspected stale.
+#
+# A rebuild fills a second index in batches of BMK_SEARCH_REBUILD_BATCH rows,
+# a transaction each, while the old one keeps serving; temporary triggers
+# replay writes to rows already copied. A final short transaction indexes
+# the rows added since and swaps the new index in. No transaction holds the
+# write lock for longer than a batch.
+import argparse
+import os
+import re
+import time
+
+# Run as a script, this file is __main__, not the search module server.py
+# imports at its end; importing server before job_queue lets server finish
+# loading (and import job_queue itself) before anything here needs it. geo.py
+# and the other feature modules with a command line follow the same order.
+from server import SEARCH_INDEXES, engine, search_index_ddl, search_index_triggers
+import job_queue
+
+MAX_PAGE_SIZE = 50
+REBUILD_BATCH = int(os.environ.get("BMK_SEARCH_REBUILD_BATCH", "5000"))
+# Pause between batches so waiting writers get the lock
+REBUILD_PAUSE_SECONDS = float(os.environ.get("BMK_SEARCH_REBUILD_PAUSE_MS", "5")) / 1000
+# Pages per incremental merge step after a rebuild
+MERGE_PAGES = 500
+SNIPPET_TOKENS = 12
+HIGHLIGHT = ("<b>", "</b>")
+
+# Returned with each hit: name -> columns of the content table
+RESULT_COLUMNS = {
+    "tasks": ("id", "user_id", "title", "status"),
+    "workers": ("id", "user_id", "name", "skills", "location", "rating"),
+    "chat": ("id", "user_id", "timestamp"),
+}
+# bm25 column weights, in SEARCH_INDEXES column order: a title or name match
+# outranks the same word in a description
+WEIGHTS = {
+    "tasks": (10.0, 1.0),
+    "workers": (10.0, 1.0, 5.0),
+    "chat": (1.0,),
+}
+
+_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def match_expression(q, prefix=True):
+    """FTS5 MATCH string for free-text q; "" if q has no searchable terms.
+
+    Terms are ANDed. "quoted words" match as a phrase, a trailing * makes a
+    term a prefix, and with prefix=True the last bare term is one too.
+    """
+    terms = []  # [quoted text, is prefix, is a bare word]
+    for phrase, word in _TERM_RE.findall(q or ""):
+        bare = word.replace('"', "").rstrip("*")
+        if phrase.strip():
+            terms.append([f'"{phrase.strip()}"', False, False])
+        elif bare:
+            terms.append([f'"{bare}"', word.endswith("*"), True])
+    if prefix and terms and terms[-1][2]:
+        terms[-1][1] = True
+    return " ".join(text + ("*" if star else "") for text, star, _ in terms)
+
+
+def _query(name, match, limit, offset):
+    fts, table, _ = SEARCH_INDEXES[name]
+    columns = ", ".join(f"c.{column}" for column in RESULT_COLUMNS[name])
+    weights = ", ".join(str(w) for w in WEIGHTS[name])
+    open_tag, close_tag = HIGHLIGHT
+    sql = (
+        f"SELECT {columns}, snippet({fts}, -1, ?, ?, '…', {SNIPPET_TOKENS}) AS snippet, "
+        f"bm25({fts}, {weights}) AS score "
+        f"FROM {fts} JOIN {table} c ON c.id = {fts}.rowid "
+        f"WHERE {fts} MATCH ? AND c.deleted = 0 ORDER BY score LIMIT ? OFFSET ?"
+    )
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(sql, (open_tag, close_tag, match, limit, offset)).mappings().all()
+    # bm25 is lower-is-better; flip it so clients can sort descending
+    return [{**row, "score": round(-row["score"], 4)} for row in rows]
+
+
+def search(q, types=("tasks", "workers"), limit=20, offset=0, prefix=True):
+    """Ranked hits for q in each index in types, one page per index."""
+    match = match_expression(q, prefix=prefix)
+    result = {"query": q, "offset": offset, "limit": limit, "next_offset": None}
+    more = False
+    for name in types:
+        # One extra row tells us whether there is a next page
+        rows = _query(name, match, limit + 1, offset) if match else []
+        more = more or len(rows) > limit
+        result[name] = rows[:limit]
+    if more:
+        result["next_offset"] = offset + limit
+    return result
+
+
+def _advance(conn, name, table, limit=None):
+    """Move name's cursor past the next limit rows (all rows without one); returns the (prev_id, last_id] range."""
+    batch = f"SELECT id FROM {table} WHERE id > last_id ORDER BY id" + (f" LIMIT {int(limit)}" if limit else "")
+    # A write first, so the transaction holds the write lock from its first statement
+    conn.exec_driver_sql(
+        f"UPDATE search_rebuilds SET prev_id = last_id, last_id = COALESCE((SELECT MAX(id) FROM ({batch})), last_id)"
+        f" WHERE name = ?",
+        (name,),
+    )
+    return conn.exec_driver_sql("SELECT prev_id, last_id FROM search_rebuilds WHERE name = ?", (name,)).first()
+
+
+def _rebuild_index(name, optimize):
+    fts, table, columns = SEARCH_INDEXES[name]
+    shadow = f"{fts}_rebuild"
+    names = ", ".join(columns)
+    copy = f"INSERT INTO {shadow} (rowid, {names}) SELECT id, {names} FROM {table} WHERE id > ? AND id <= ?"
+    triggers = search_index_triggers(
+        shadow, table, columns, when=f"{{row}}.id <= (SELECT last_id FROM search_rebuilds WHERE name = '{name}')"
+    )
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT OR REPLACE INTO search_rebuilds (name, prev_id, last_id) VALUES (?, 0, 0)", (name,))
+        # Left behind by an interrupted rebuild, if any
+        for trigger, _ in triggers:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {shadow}")
+        conn.exec_driver_sql(search_index_ddl(shadow, table, columns))
+        for _, create in triggers:
+            conn.exec_driver_sql(create)
+    while True:
+        with engine.begin() as conn:
+            prev_id, last_id = _advance(conn, name, table, REBUILD_BATCH)
+            conn.exec_driver_sql(copy, (prev_id, last_id))
+        if last_id == prev_id:
+            break
+        time.sleep(REBUILD_PAUSE_SECONDS)
+    with engine.begin() as conn:
+        # Rows inserted since the last batch, then the swap; the live triggers name the index, not the table
+        conn.exec_driver_sql(copy, tuple(_advance(conn, name, table)))
+        for trigger, _ in triggers:
+            conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        conn.exec_driver_sql(f"DROP TABLE {fts}")
+        # Don't let the rename check the live triggers, which name the index just dropped
+        conn.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+        try:
+            conn.exec_driver_sql(f"ALTER TABLE {shadow} RENAME TO {fts}")
+        finally:
+            conn.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+        conn.exec_driver_sql("DELETE FROM search_rebuilds WHERE name = ?", (name,))
+        count = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+    while optimize:
+        # Merge the b-trees the batches left, a few hundred pages per transaction
+        with engine.begin() as conn:
+            before = conn.exec_driver_sql("SELECT total_changes()").scalar()
+            conn.exec_driver_sql(f"INSERT INTO {fts} ({fts}, rank) VALUES ('merge', ?)", (-MERGE_PAGES,))
+            optimize = conn.exec_driver_sql("SELECT total_changes()").scalar() - before >= 2
+        time.sleep(REBUILD_PAUSE_SECONDS)
+    return count
+
+
+@job_queue.task("search.rebuild")
+def rebuild(names=None, optimize=True):
+    """Reindex names (default: all) from their content tables; returns rows indexed per index.
+
+    Runs in batches (see the top of this file), so it is safe on a live server.
+    """
+    return {name: _rebuild_index(name, optimize) for name in names or SEARCH_INDEXES}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search indexes")
+    parser.add_argument("--rebuild", action="store_true", help="reindex from the content tables")
+    parser.add_argument("--index", action="append", choices=sorted(SEARCH_INDEXES),
+                        help="index to rebuild (repeatable, default all)")
+    parser.add_argument("query", nargs="?", help="run a search and print the hits")
+    args = parser.parse_args()
+
+    from server import ensure_schema
+    ensure_schema()
+    if args.rebuild:
+        for name, count in rebuild(args.index).items():
+            print(f"✓ {name:8s} {count:10,d} rows indexed")
+    if args.query:
+        found = search(args.query, types=args.index or tuple(SEARCH_INDEXES))
+        for name in args.index or SEARCH_INDEXES:
+            for hit in found[name]:
+                print(f"{name:8s} #{hit['id']:<8d} {hit['score']:8.3f}  {hit['snippet']}")
+    if not (args.rebuild or args.query):
+        parser.print_help()
@@ -1,19 +1,45 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse
-import shutil
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from starlette.concurrency import run_in_threadpool
+import functools
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+import zlib
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from google_oauth import router as google_router
-
-app = FastAPI()
+import content_filter
+import metrics
+import query_profiler
+import rate_limit
+import tracing
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema work happens here rather than at import so cold starts stay cheap
+    ensure_schema()
+    # Derived payloads from the last run, if the data hasn't moved since
+    warm_cache.load_snapshot()
+    # Nearby-search snapshots load in the background; a request before then waits for them
+    geo.warm()
+    # Background jobs (modules are imported at the bottom of this file)
+    job_queue.start_workers()
+    yield
+    job_queue.stop_workers()
+    warm_cache.save_snapshot()
+
+
+app = FastAPI(lifespan=lifespan)
+# Splits each request into deps / handler / render stages for Server-Timing
+app.router.route_class = tracing.TracedRoute
 
 # Include Google OAuth authentication routes
 app.include_router(google_router)
 
-FILES_DIR = os.path.join(os.path.dirname(__file__), "files")
+FILES_DIR = os.environ.get("BMK_FILES_DIR", os.path.join(os.path.dirname(__file__), "files"))
 
 os.makedirs(FILES_DIR, exist_ok=True)
 
@@ -40,8 +66,12 @@ def get_guidelines():
             {"path": "/chat", "methods": ["GET", "POST", "DELETE"], "desc": "Retrieve/add/delete chat messages."},
             {"path": "/download_app", "methods": ["GET"], "desc": "Download the BMK app (APK)."},
             {"path": "/stats", "methods": ["GET"], "desc": "Get app statistics."},
+            {"path": "/stats/timeseries", "methods": ["GET"], "desc": "Daily activity by municipality and category."},
+            {"path": "/search", "methods": ["GET"], "desc": "Full-text search over tasks, workers and chat."},
             {"path": "/users", "methods": ["GET", "POST", "DELETE"], "desc": "Manage users."},
             {"path": "/tasks", "methods": ["GET", "POST"], "desc": "Manage tasks."},
+            {"path": "/tasks/nearby", "methods": ["GET"], "desc": "Open tasks nearest a point, with distances."},
+            {"path": "/workers/nearby", "methods": ["GET"], "desc": "Available workers nearest a point, with distances."},
             {"path": "/ban/{user_id}", "methods": ["POST"], "desc": "Ban a user."},
             {"path": "/upload", "methods": ["POST"], "desc": "Upload a file."},
             {"path": "/files/{filename}", "methods": ["GET"], "desc": "Download a file."},
@@ -67,6 +97,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Cached per header: a token that has expired since still names the same user,
+# which is all a rate limit key needs, and forged ones stay None
+@functools.lru_cache(maxsize=4096)
+def bearer_user_id(authorization: bytes):
+    """user_id of the signed bearer token in an Authorization header, or None."""
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    from jose import JWTError, jwt
+    try:
+        claims = jwt.decode(token.strip(), SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return claims.get("user_id")
+
+# Per-IP / per-user token buckets for login, chat, task posting and uploads.
+# The shared (sqlite) backend keeps its buckets next to the app DB, not in it.
+app.add_middleware(
+    rate_limit.RateLimitMiddleware,
+    backend=rate_limit.BACKEND,
+    db_path=os.environ.get("BMK_RATE_LIMIT_DB", os.environ.get("BMK_SQLITE_PATH", "bmk.db") + "-ratelimit"),
+    user_id=bearer_user_id,
+)
+
+app.add_middleware(tracing.TracingMiddleware)
+
+# Outermost, so rate-limited and failed requests are measured too
+app.add_middleware(metrics.MetricsMiddleware)
+
 @app.get("/")
 def read_root():
     return {"message": "BMK server is running!"}
@@ -94,6 +153,11 @@ def debug_files():
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of request, database and cache metrics"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Secure config loading example
 
 # Use environment variable for DB path, default to SQLite file
@@ -102,9 +166,17 @@ DATABASE_URL = f"sqlite:///{SQLITE_DB_PATH}"
 
 # SQLAlchemy setup
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+metrics.instrument_engine(engine)
+query_profiler.instrument(engine)
+tracing.instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# purge.py hard-deletes rows from these tables. Without AUTOINCREMENT SQLite
+# hands the highest purged id to the next row, and stale tokens, reports and
+# data_changes entries would then point at someone else's account.
+NO_ID_REUSE = {"sqlite_autoincrement": True}
+
 # Sample User model
 class User(Base):
     __tablename__ = "users"
@@ -114,6 +186,11 @@ class User(Base):
     role = Column(String, index=True)
     password_hash = Column(String)
     banned = Column(Integer, default=0)  # 0 = not banned, 1 = banned
+    report_count = Column(Integer, default=0)  # maintained by moderation.py
+    flagged = Column(Integer, default=0)  # 1 = crossed the report threshold
+    flag_baseline = Column(Integer, default=0, server_default="0")  # report_count when last cleared
+    deleted = Column(Integer, default=0, server_default="0", index=True)  # 1 = hidden, purge pending (see purge.py)
+    __table_args__ = (Index("ix_users_flagged_report_count", "flagged", "report_count"), NO_ID_REUSE)
 
 
 # Sample Municipality model
@@ -133,8 +210,27 @@ class Task(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    status = Column(String, index=True)
-    user_id = Column(Integer, index=True)
+    status = Column(String)
+    user_id = Column(Integer)
+    flagged = Column(Integer, default=0)  # 1 = matched the content filter
+    deleted = Column(Integer, default=0, server_default="0")  # 1 = owner deleted, purge pending
+    category = Column(String, nullable=True)
+    location = Column(String, nullable=True)  # free text, usually a municipality name
+    budget = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)  # UTC; rows from before the column have none
+    is_urgent = Column(Integer, default=0, server_default="0")
+    # Exact point, if the app sent one; otherwise the location's municipality is used (see geo.py)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # GET /tasks filters, each served newest first straight from an index;
+    # (status, ...) and (user_id, ...) also cover lookups on their first column
+    __table_args__ = (
+        Index("ix_tasks_created_at", "created_at"),
+        Index("ix_tasks_status_created_at", "status", "created_at"),
+        Index("ix_tasks_user_id_status_created_at", "user_id", "status", "created_at"),
+        Index("ix_tasks_category_created_at", "category", "created_at"),
+        NO_ID_REUSE,
+    )
 
 class Worker(Base):
     __tablename__ = "workers"
@@ -147,6 +243,11 @@ class Worker(Base):
     about = Column(String)
     isAvailable = Column(Integer, default=1)
     rating = Column(Float, default=0.0)
+    flagged = Column(Integer, default=0)
+    deleted = Column(Integer, default=0, server_default="0")
+    latitude = Column(Float, nullable=True)  # as on Task
+    longitude = Column(Float, nullable=True)
+    __table_args__ = NO_ID_REUSE
 
 # ChatMessage model
 class ChatMessage(Base):
@@ -155,6 +256,9 @@ class ChatMessage(Base):
     user_id = Column(Integer, index=True)
     content = Column(String)
     timestamp = Column(String)
+    flagged = Column(Integer, default=0)
+    deleted = Column(Integer, default=0, server_default="0")
+    __table_args__ = NO_ID_REUSE
 
 # Optional Pro subscription table: keeps basic users, adds Pro tier
 class ProSubscription(Base):
@@ -162,10 +266,373 @@ class ProSubscription(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True, unique=True)
     plan = Column(String, default="free")  # free | pro
-    expires_at = Column(DateTime, nullable=True)  # UTC expiry for pro
+    expires_at = Column(DateTime, nullable=True, index=True)  # UTC expiry for pro
+    __table_args__ = (Index("ix_pro_subscriptions_plan_expires_at", "plan", "expires_at"),)
+
+# Per-poster open task counter + cached plan for the free-plan quota (see quotas.py)
+class TaskQuota(Base):
+    __tablename__ = "task_quotas"
+    user_id = Column(Integer, primary_key=True)
+    open_tasks = Column(Integer, default=0)
+    plan = Column(String, default="free")
+    expires_at = Column(Float, nullable=True)  # epoch seconds, None = no expiry
+
+# Precomputed top-N open tasks per available worker (see recommendations.py)
+class WorkerRecommendation(Base):
+    __tablename__ = "worker_recommendations"
+    worker_id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, primary_key=True, index=True)
+    score = Column(Float)
+    __table_args__ = (Index("ix_worker_recommendations_worker_score", "worker_id", "score"),)
+
+# Moderation reports (see moderation.py)
+class Report(Base):
+    __tablename__ = "reports"
+    id = Column(Integer, primary_key=True, index=True)
+    reporter_id = Column(Integer)
+    reported_user_id = Column(Integer, index=True, nullable=True)
+    reported_message_id = Column(Integer, index=True, nullable=True)
+    reason = Column(String)
+    details = Column(String, nullable=True)
+    status = Column(String, default="open")  # open | reviewed | dismissed
+    created_at = Column(DateTime, index=True)
+    # Serves a status-filtered page in get_reports' id order without a sort
+    __table_args__ = (Index("ix_reports_status_id", "status", "id"),)
+
+# Durable background jobs (see job_queue.py); times are epoch seconds
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    queue = Column(String, default="default")
+    name = Column(String, index=True)
+    payload = Column(String)  # JSON kwargs for the handler
+    status = Column(String, default="queued")  # queued | running | failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(Float)
+    lease_until = Column(Float, nullable=True)
+    locked_by = Column(String, nullable=True, index=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(Float)
+    started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True)
+    __table_args__ = (Index("ix_jobs_status_run_at", "status", "run_at"),)
+
+# Logical filename -> content-addressed blob (see file_store.py)
+class StoredFile(Base):
+    __tablename__ = "stored_files"
+    name = Column(String, primary_key=True)
+    sha256 = Column(String, index=True)
+    size = Column(Integer)
+    content_type = Column(String, nullable=True)
+    created_at = Column(DateTime)
+
+# Per-table write counters, bumped by triggers (see VERSIONED_TABLES below);
+# derived caches compare these to decide whether they are still current
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+# Row-level change log written by the same triggers, so other processes can
+# invalidate individual cached entities (see invalidation.py)
+class DataChange(Base):
+    __tablename__ = "data_changes"
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_key = Column(Integer)
+
+# Progress of a batched search.rebuild: rows up to last_id are in the new index
+class SearchRebuild(Base):
+    __tablename__ = "search_rebuilds"
+    name = Column(String, primary_key=True)
+    prev_id = Column(Integer, nullable=False, default=0)
+    last_id = Column(Integer, nullable=False, default=0)
+
+# Activity per UTC day, task municipality (location) and task category, kept
+# by the triggers in ROLLUP_TRIGGERS; activity that isn't a task has "" for
+# both. Counts are history: deleting rows later doesn't take them back out.
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+    day = Column(String, primary_key=True)  # YYYY-MM-DD
+    municipality = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    new_users = Column(Integer, default=0, server_default="0", nullable=False)
+    new_tasks = Column(Integer, default=0, server_default="0", nullable=False)
+    closed_tasks = Column(Integer, default=0, server_default="0", nullable=False)
+    chat_messages = Column(Integer, default=0, server_default="0", nullable=False)
+    new_pro_subscriptions = Column(Integer, default=0, server_default="0", nullable=False)
+    __table_args__ = (
+        Index("ix_daily_rollups_municipality_day", "municipality", "day"),
+        Index("ix_daily_rollups_category_day", "category", "day"),
+    )
 
-# Create tables if they don't exist
-Base.metadata.create_all(bind=engine)
+# The same counts summed over municipalities: a day has one row per category,
+# so queries that don't split by place stay small however sparse the above is
+class DailyCategoryRollup(Base):
+    __tablename__ = "daily_category_rollups"
+    day = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    new_users = Column(Integer, default=0, server_default="0", nullable=False)
+    new_tasks = Column(Integer, default=0, server_default="0", nullable=False)
+    closed_tasks = Column(Integer, default=0, server_default="0", nullable=False)
+    chat_messages = Column(Integer, default=0, server_default="0", nullable=False)
+    new_pro_subscriptions = Column(Integer, default=0, server_default="0", nullable=False)
+
+# Columns added after tables were first created; create_all won't add them
+MIGRATIONS = [
+    ("tasks", "flagged", "INTEGER DEFAULT 0"),
+    ("workers", "flagged", "INTEGER DEFAULT 0"),
+    ("chat_messages", "flagged", "INTEGER DEFAULT 0"),
+    ("users", "report_count", "INTEGER DEFAULT 0"),
+    ("users", "flagged", "INTEGER DEFAULT 0"),
+    ("users", "deleted", "INTEGER DEFAULT 0"),
+    ("users", "flag_baseline", "INTEGER DEFAULT 0"),
+    ("tasks", "category", "VARCHAR"),
+    ("tasks", "location", "VARCHAR"),
+    ("tasks", "budget", "VARCHAR"),
+    ("tasks", "created_at", "DATETIME"),
+    ("tasks", "is_urgent", "INTEGER DEFAULT 0"),
+    ("tasks", "deleted", "INTEGER DEFAULT 0"),
+    ("workers", "deleted", "INTEGER DEFAULT 0"),
+    ("chat_messages", "deleted", "INTEGER DEFAULT 0"),
+    ("tasks", "latitude", "FLOAT"),
+    ("tasks", "longitude", "FLOAT"),
+    ("workers", "latitude", "FLOAT"),
+    ("workers", "longitude", "FLOAT"),
+]
+
+# Indexes made redundant by a composite index starting with the same column,
+# or replaced by one that matches the query's order
+DROPPED_INDEXES = ["ix_tasks_status", "ix_tasks_user_id", "ix_reports_status_created_at"]
+
+def _autoincrement_tables():
+    return [table for table in Base.metadata.sorted_tables if table.kwargs.get("sqlite_autoincrement")]
+
+def _rebuild_with_autoincrement(conn, table):
+    """Recreate a table created before it had AUTOINCREMENT, keeping its rows and ids.
+
+    Its triggers go with the old table; ensure_schema reinstalls them afterwards.
+    """
+    sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                               (table.name,)).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+    columns = ", ".join(f'"{c.name}"' for c in table.columns if c.name in existing)
+    old = f"{table.name}_before_autoincrement"
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old}")
+    for (index,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (old,)
+    ).all():
+        conn.exec_driver_sql(f"DROP INDEX {index}")
+    table.create(bind=conn)
+    conn.exec_driver_sql(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}")
+    conn.exec_driver_sql(f"DROP TABLE {old}")
+
+def run_migrations():
+    with engine.begin() as conn:
+        for table, column, ddl in MIGRATIONS:
+            columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+        for name in DROPPED_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        # One-off copy per table (a few seconds at a million rows)
+        for table in _autoincrement_tables():
+            _rebuild_with_autoincrement(conn, table)
+    # Indexes on migrated columns can only be created once the columns exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+# Tables whose writes bump data_versions, whatever code path does the write
+VERSIONED_TABLES = [
+    "users", "tasks", "workers", "chat_messages", "municipalities", "pro_subscriptions", "stored_files",
+]
+# Column identifying a row in data_changes; subscriptions are looked up by user
+CHANGE_KEYS = {"pro_subscriptions": "user_id", "stored_files": "name"}
+
+def install_version_triggers():
+    with engine.begin() as conn:
+        for table in VERSIONED_TABLES:
+            conn.exec_driver_sql("INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)", (table,))
+            key = CHANGE_KEYS.get(table, "id")
+            for op, row in (("INSERT", "NEW"), ("UPDATE", "OLD"), ("DELETE", "OLD")):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS bump_{table}_{op.lower()}")
+                conn.exec_driver_sql(
+                    f"CREATE TRIGGER bump_{table}_{op.lower()} AFTER {op} ON {table} BEGIN "
+                    f"UPDATE data_versions SET version = version + 1 WHERE name = '{table}'; "
+                    f"INSERT INTO data_changes (table_name, row_key) VALUES ('{table}', {row}.{key}); END"
+                )
+
+# Full-text indexes (see search.py): name -> (FTS5 table, content table, columns).
+# External-content tables, so the text is stored once and the index is kept
+# in sync by triggers; updates that don't touch these columns skip reindexing.
+SEARCH_INDEXES = {
+    "tasks": ("tasks_fts", "tasks", ("title", "description")),
+    "workers": ("workers_fts", "workers", ("name", "about", "skills")),
+    "chat": ("chat_fts", "chat_messages", ("content",)),
+}
+# Marks count as word characters so Devanagari vowel signs don't split words
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+
+def search_index_ddl(fts, table, columns):
+    """CREATE statement for an FTS5 index over columns of table (search.rebuild builds copies under other names)."""
+    return (
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, content='{table}', content_rowid='id', "
+        f"prefix='2 3', tokenize=\"{SEARCH_TOKENIZER}\")"
+    )
+
+def search_index_triggers(fts, table, columns, when=None):
+    """[(trigger name, CREATE TRIGGER)] keeping fts in step with writes to table.
+
+    when, if given, is a condition with {row} standing for new or old.
+    """
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    remove = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    add = f"INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new});"
+    triggers = []
+    for suffix, event, row, body in (
+        ("insert", "INSERT", "new", add),
+        ("delete", "DELETE", "old", remove),
+        ("update", f"UPDATE OF {names}", "old", remove + " " + add),
+    ):
+        condition = f" WHEN {when.format(row=row)}" if when else ""
+        triggers.append((f"{fts}_{suffix}", f"CREATE TRIGGER {fts}_{suffix} AFTER {event} ON {table}{condition} BEGIN {body} END"))
+    return triggers
+
+def install_search_indexes():
+    with engine.begin() as conn:
+        for fts, table, columns in SEARCH_INDEXES.values():
+            created = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).first() is None
+            if created:
+                conn.exec_driver_sql(search_index_ddl(fts, table, columns))
+            for name, create in search_index_triggers(fts, table, columns):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+                conn.exec_driver_sql(create)
+            if created:
+                # Index the rows that were there before the index
+                conn.exec_driver_sql(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+# Task statuses that end a task; CLOSED_TASK_STATUSES is the same list for SQL
+CLOSED_STATUSES = ("closed", "completed")
+CLOSED_TASK_STATUSES = "(" + ", ".join(f"'{status}'" for status in CLOSED_STATUSES) + ")"
+# Rollup table -> key columns
+ROLLUP_TABLES = {
+    "daily_rollups": ("day", "municipality", "category"),
+    "daily_category_rollups": ("day", "category"),
+}
+ROLLUP_METRICS = ("new_users", "new_tasks", "closed_tasks", "chat_messages", "new_pro_subscriptions")
+
+def _rollup_upsert(day, municipality, category, **counts):
+    values = {"day": day, "municipality": municipality, "category": category}
+    columns = ", ".join(counts)
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in counts)
+    statements = []
+    for table, keys in ROLLUP_TABLES.items():
+        statements.append(
+            f"INSERT INTO {table} ({', '.join(keys)}, {columns}) "
+            f"VALUES ({', '.join(values[k] for k in keys)}, {', '.join(str(v) for v in counts.values())}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates};"
+        )
+    return " ".join(statements)
+
+# table -> [(trigger name, event, WHEN condition or None, body)], see DailyRollup.
+# Tasks and chat messages are dated by their own timestamps, the rest by the write.
+_TODAY = "date('now')"
+_TASK_KEY = ("COALESCE(new.location, '')", "COALESCE(new.category, '')")
+ROLLUP_TRIGGERS = {
+    "users": [
+        ("rollup_users_insert", "INSERT", None, _rollup_upsert(_TODAY, "''", "''", new_users=1)),
+    ],
+    "tasks": [
+        ("rollup_tasks_insert", "INSERT", None, _rollup_upsert(
+            f"COALESCE(date(new.created_at), {_TODAY})", *_TASK_KEY, new_tasks=1,
+            closed_tasks=f"COALESCE(new.status IN {CLOSED_TASK_STATUSES}, 0)")),
+        ("rollup_tasks_close", "UPDATE OF status",
+         f"new.status IN {CLOSED_TASK_STATUSES} AND COALESCE(old.status, '') NOT IN {CLOSED_TASK_STATUSES}",
+         _rollup_upsert(_TODAY, *_TASK_KEY, closed_tasks=1)),
+    ],
+    "chat_messages": [
+        ("rollup_chat_messages_insert", "INSERT", None, _rollup_upsert(
+            f"COALESCE(date(new.timestamp), {_TODAY})", "''", "''", chat_messages=1)),
+    ],
+    "pro_subscriptions": [
+        ("rollup_pro_subscriptions_insert", "INSERT", "new.plan = 'pro'",
+         _rollup_upsert(_TODAY, "''", "''", new_pro_subscriptions=1)),
+        ("rollup_pro_subscriptions_upgrade", "UPDATE OF plan", "new.plan = 'pro' AND COALESCE(old.plan, '') <> 'pro'",
+         _rollup_upsert(_TODAY, "''", "''", new_pro_subscriptions=1)),
+    ],
+}
+
+# The daily_rollups columns that can be recomputed from the rows themselves.
+# Tasks closed before the triggers existed count on the day they were posted.
+ROLLUP_BACKFILL = [
+    f"INSERT INTO daily_rollups (day, municipality, category, new_tasks, closed_tasks) "
+    f"SELECT date(created_at), COALESCE(location, ''), COALESCE(category, ''), COUNT(*), "
+    f"COALESCE(SUM(status IN {CLOSED_TASK_STATUSES}), 0) "
+    f"FROM tasks WHERE date(created_at) IS NOT NULL GROUP BY 1, 2, 3 "
+    f"ON CONFLICT (day, municipality, category) DO UPDATE SET "
+    f"new_tasks = new_tasks + excluded.new_tasks, closed_tasks = closed_tasks + excluded.closed_tasks",
+    "INSERT INTO daily_rollups (day, municipality, category, chat_messages) "
+    "SELECT date(timestamp), '', '', COUNT(*) FROM chat_messages WHERE date(timestamp) IS NOT NULL GROUP BY 1 "
+    "ON CONFLICT (day, municipality, category) DO UPDATE SET chat_messages = chat_messages + excluded.chat_messages",
+]
+# daily_category_rollups recomputed from daily_rollups
+ROLLUP_SUMMARY = [
+    "DELETE FROM daily_category_rollups",
+    f"INSERT INTO daily_category_rollups (day, category, {', '.join(ROLLUP_METRICS)}) "
+    f"SELECT day, category, {', '.join(f'SUM({m})' for m in ROLLUP_METRICS)} "
+    f"FROM daily_rollups GROUP BY day, category",
+]
+
+def install_rollup_triggers():
+    with engine.begin() as conn:
+        fresh = (
+            conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'rollup_tasks_insert'").first() is None
+            and conn.exec_driver_sql("SELECT 1 FROM daily_rollups LIMIT 1").first() is None
+        )
+        for table, triggers in ROLLUP_TRIGGERS.items():
+            for name, event, when, body in triggers:
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+                condition = f" WHEN {when}" if when else ""
+                conn.exec_driver_sql(f"CREATE TRIGGER {name} AFTER {event} ON {table}{condition} BEGIN {body} END")
+        if fresh:
+            # Start from the history already in the tables
+            for statement in ROLLUP_BACKFILL + ROLLUP_SUMMARY:
+                conn.exec_driver_sql(statement)
+
+def schema_version():
+    # Changes whenever a table, column, index or migration is added
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts += [f"{c.name}:{c.type}" for c in table.columns]
+        parts += sorted(index.name for index in table.indexes)
+    parts += [f"{table}.{column}" for table, column, _ in MIGRATIONS]
+    parts += [f"autoincrement:{table.name}" for table in _autoincrement_tables()]
+    parts += [f"versioned:{table}" for table in VERSIONED_TABLES]
+    parts += [f"fts:{fts}:{','.join(columns)}" for fts, _, columns in SEARCH_INDEXES.values()]
+    parts += [f"rollup:{name}:{when}:{body}" for triggers in ROLLUP_TRIGGERS.values() for name, _, when, body in triggers]
+    return zlib.crc32("|".join(parts).encode()) & 0x7FFFFFFF
+
+def ensure_schema():
+    """Create tables and run migrations unless PRAGMA user_version shows this schema is in place."""
+    version = schema_version()
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() == version:
+            return False
+    Base.metadata.create_all(bind=engine)
+    run_migrations()
+    install_version_triggers()
+    install_search_indexes()
+    install_rollup_triggers()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+    return True
 
 
 # Dependency to get DB session
@@ -179,25 +646,26 @@ def get_db():
     finally:
         db.close()
 
+def require_admin(admin: bool):
+    # In production, restrict to admins
+    if not admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+# Cheap synchronous content filter check for write paths
+def reject_bad_words(*texts):
+    for text in texts:
+        if text and content_filter.contains_bad_words(str(text)):
+            raise HTTPException(status_code=400, detail="Content contains prohibited words")
+
 # Endpoint to get all municipalities with full location details
 @app.get("/municipalities")
 def get_municipalities(db: Session = Depends(get_db)):
-    municipalities = db.query(Municipality).all()
-    return [
-        {
-            "id": m.id,
-            "name": m.name,
-            "province": m.province,
-            "district": m.district,
-            "ward": m.ward,
-            "latitude": m.latitude,
-            "longitude": m.longitude
-        }
-        for m in municipalities
-    ]
+    # Pre-serialized; rebuilt only when the municipalities table changes
+    return Response(warm_cache.get("municipalities", db), media_type="application/json")
 
 # Endpoint to add a new municipality
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from typing import Any
 
 # Pydantic model for creating a municipality
 class MunicipalityCreate(BaseModel):
@@ -231,6 +699,12 @@ class TaskCreate(BaseModel):
     description: str
     status: str | None = None
     user_id: int | None = None
+    category: str | None = None
+    location: str | None = None
+    budget: str | None = None
+    is_urgent: bool | None = None
+    latitude: float | None = None
+    longitude: float | None = None
 
 class SubscriptionUpdate(BaseModel):
     plan: str | None = None  # "pro" or "free"
@@ -242,6 +716,28 @@ class ChatMessageCreate(BaseModel):
     content: str
     timestamp: str
 
+# Bulk create endpoints accept at most this many items per request
+MAX_BATCH_SIZE = 5000
+
+def _check_batch_size(items: list):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} items per batch")
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+def _batch_item_object(item):
+    if not isinstance(item, dict):
+        raise HTTPException(status_code=422, detail="Item must be an object")
+    return item
+
+def _batch_item_error(index: int, e: Exception) -> dict:
+    if isinstance(e, ValidationError):
+        return {"index": index, "detail": _validation_message(e)}
+    if isinstance(e, HTTPException):
+        return {"index": index, "detail": e.detail}
+    return {"index": index, "detail": str(e)}
+
 @app.post("/municipalities")
 def create_municipality(muni: MunicipalityCreate, db: Session = Depends(get_db)):
     new_muni = Municipality(
@@ -268,7 +764,7 @@ def create_municipality(muni: MunicipalityCreate, db: Session = Depends(get_db))
 # Endpoint to get all users
 @app.get("/users")
 def get_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
+    users = db.query(User).filter(User.deleted == 0).all()
     return [
         {
             "id": u.id,
@@ -282,10 +778,8 @@ def get_users(db: Session = Depends(get_db)):
 # Endpoint to add a new user
 # Endpoint to add a new user
 
-# Password hashing and JWT setup
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from datetime import datetime, timedelta, timezone
+# Password hashing and JWT setup (passlib/bcrypt and jose load on first use)
+from datetime import date, datetime, timedelta, timezone
 
 SECRET_KEY = os.environ.get("BMK_SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
@@ -295,19 +789,44 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 # Set BMK_ENABLE_PRO=1 to enforce Pro-specific limits.
 ENABLE_PRO = os.environ.get("BMK_ENABLE_PRO", "0") == "1"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_pwd_context = None
+
+def password_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with tracing.span("bcrypt"):
+        return password_context().hash(password)
+
+# bcrypt is slow on purpose (~0.25-0.5 s a hash), so a batch may only carry
+# a few explicit passwords; those are hashed a chunk per thread (bcrypt
+# releases the GIL). Items without one share a single hash of the default.
+MAX_BATCH_PASSWORDS = int(os.environ.get("BMK_MAX_BATCH_PASSWORDS", "50"))
+HASH_THREADS = int(os.environ.get("BMK_HASH_THREADS", str(min(4, os.cpu_count() or 1))))
+
+def hash_passwords(passwords: list) -> list:
+    """bcrypt hashes of passwords, in order."""
+    from concurrent.futures import ThreadPoolExecutor
+    if len(passwords) <= 1:
+        return [get_password_hash(p) for p in passwords]
+    with ThreadPoolExecutor(max_workers=HASH_THREADS) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=max(1, len(passwords) // HASH_THREADS)))
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with tracing.span("bcrypt"):
+        return password_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    from jose import jwt
+    with tracing.span("jwt"):
+        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 # Register endpoint
 @app.post("/register")
@@ -335,8 +854,8 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 # Login endpoint
 @app.post("/login")
 def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+    db_user = db.query(User).filter(User.email == user.email, User.deleted == 0).first()
+    if not db_user or not db_user.password_hash or not verify_password(user.password, db_user.password_hash):
         return {"error": "Invalid credentials"}
     access_token = create_access_token({"sub": db_user.email, "user_id": db_user.id})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -355,12 +874,13 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     password = user.password or "bmk123"
     role = user.role or "worker"
     
-    hashed_pw = get_password_hash(password)
+    # Hashed here, so the account can log in at once and the password is never
+    # stored; a sync route runs in the threadpool, so bcrypt doesn't block the loop
     new_user = User(
         name=user.name,
         email=email,
         role=role,
-        password_hash=hashed_pw
+        password_hash=get_password_hash(password)
     )
     db.add(new_user)
     db.commit()
@@ -373,14 +893,129 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     }
 
 
-# Endpoint to get all tasks
+# Bulk user creation: one transaction, passwords hashed before the write
+@app.post("/users/batch")
+def create_users_batch(items: list[Any], db: Session = Depends(get_db)):
+    _check_batch_size(items)
+    errors = []
+    pending = []  # (index, User, password or None for the default)
+    seen_emails = set()
+    explicit_passwords = 0
+    for index, item in enumerate(items):
+        try:
+            user = UserCreate(**_batch_item_object(item))
+        except (ValidationError, HTTPException) as e:
+            errors.append(_batch_item_error(index, e))
+            continue
+        email = user.email or f"{user.name.lower().replace(' ', '.')}@bmk.local"
+        if email in seen_emails:
+            errors.append({"index": index, "detail": "Duplicate email in batch"})
+            continue
+        if user.password:
+            if explicit_passwords >= MAX_BATCH_PASSWORDS:
+                errors.append({"index": index, "detail": f"At most {MAX_BATCH_PASSWORDS} passwords per batch"})
+                continue
+            explicit_passwords += 1
+        seen_emails.add(email)
+        pending.append((index, User(name=user.name, email=email, role=user.role or "worker"), user.password))
+
+    # One query for all already-registered emails
+    existing = set()
+    emails = [u.email for _, u, _ in pending]
+    for start in range(0, len(emails), 500):
+        chunk = emails[start:start + 500]
+        existing.update(e for (e,) in db.query(User.email).filter(User.email.in_(chunk)))
+    new_users = []
+    for index, user, password in pending:
+        if user.email in existing:
+            errors.append({"index": index, "detail": "Email already registered"})
+        else:
+            new_users.append((index, user, password))
+
+    hashes = iter(hash_passwords([pw for _, _, pw in new_users if pw]))
+    default_hash = get_password_hash("bmk123") if any(not pw for _, _, pw in new_users) else None
+    for _, u, pw in new_users:
+        u.password_hash = next(hashes) if pw else default_hash
+    db.add_all(u for _, u, _ in new_users)
+    db.flush()
+    created = [{"index": index, "id": u.id} for index, u, _ in new_users]
+    db.commit()
+    return {
+        "created": created,
+        "errors": sorted(errors, key=lambda e: e["index"]),
+    }
+
+
+def _task_dict(task: Task):
+    return {
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "status": task.status,
+        "user_id": task.user_id,
+        "category": task.category,
+        "location": task.location,
+        "budget": task.budget,
+        "created_at": task.created_at.isoformat() if task.created_at else None,
+        "is_urgent": bool(task.is_urgent),
+        "latitude": task.latitude,
+        "longitude": task.longitude
+    }
+
+
+def _worker_dict(worker: Worker):
+    return {
+        "id": worker.id,
+        "user_id": worker.user_id,
+        "name": worker.name,
+        "phone": worker.phone,
+        "skills": worker.skills,
+        "location": worker.location,
+        "about": worker.about,
+        "isAvailable": worker.isAvailable,
+        "rating": worker.rating,
+        "latitude": worker.latitude,
+        "longitude": worker.longitude
+    }
+
+MAX_TASK_PAGE = 500
+
+# Endpoint to get all tasks, newest first. Each filter has an index that
+# serves it in created_at order: status, category and the date range via
+# (status|category, created_at), a poster via (user_id, status, created_at).
 @app.get("/tasks")
-def get_tasks(db: Session = Depends(get_db)):
-    tasks = db.query(Task).all()
+def get_tasks(
+    status: str | None = None,
+    category: str | None = None,
+    user_id: int | None = None,
+    urgent: bool | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+):
+    # Poster names come from the same query (users by primary key), not one lookup per task
+    query = db.query(Task, User.name).outerjoin(User, User.id == Task.user_id).filter(Task.deleted == 0)
+    if status:
+        query = query.filter(Task.status == status)
+    if category:
+        query = query.filter(Task.category == category)
+    if user_id is not None:
+        query = query.filter(Task.user_id == user_id)
+    if urgent is not None:
+        query = query.filter(Task.is_urgent == (1 if urgent else 0))
+    if since:
+        query = query.filter(Task.created_at >= _naive_utc(since))
+    if until:
+        query = query.filter(Task.created_at < _naive_utc(until))
+    query = query.order_by(Task.created_at.desc(), Task.id.desc())
+    if offset > 0:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(max(1, min(limit, MAX_TASK_PAGE)))
     result = []
-    for t in tasks:
-        # Get user info if available
-        user = db.query(User).filter(User.id == t.user_id).first()
+    for t, poster_name in query:
         result.append({
             "id": t.id,
             "title": t.title,
@@ -388,102 +1023,176 @@ def get_tasks(db: Session = Depends(get_db)):
             "status": t.status,
             "user_id": t.user_id,
             "posterId": str(t.user_id),
-            "posterName": user.name if user else "Unknown User",
+            "posterName": poster_name or "Unknown User",
             "posterPhone": "",
-            "category": "General",
-            "location": "Unknown Location",
+            "category": t.category or "General",
+            "location": t.location or "Unknown Location",
             "municipality": "",
             "type": "Task",
             "salary": "",
-            "budget": "Negotiable",
+            "budget": t.budget or "Negotiable",
             "duration": "Flexible",
             "requirements": [],
-            "postedDate": "2025-01-01T00:00:00",
+            # Tasks from before created_at existed keep the old placeholder date
+            "postedDate": t.created_at.isoformat() if t.created_at else "2025-01-01T00:00:00",
             "applyUrl": "",
             "matchScore": 0,
-            "isUrgent": False
+            "isUrgent": bool(t.is_urgent)
         })
     return result
 
 # Endpoint to add a new task
 @app.post("/tasks")
 def create_task(task: TaskCreate, db: Session = Depends(get_db)):
+    reject_bad_words(task.title, task.description)
     user_id = task.user_id or 1
 
-    # Optional free-plan limit (only when ENABLE_PRO=1)
-    if ENABLE_PRO:
-        sub = db.query(ProSubscription).filter(ProSubscription.user_id == user_id).first()
-        now_utc = datetime.now(timezone.utc)
-        has_pro = bool(sub and sub.plan == "pro" and (sub.expires_at is None or sub.expires_at >= now_utc))
-
-        if not has_pro:
-            open_count = (
-                db.query(Task)
-                .filter(Task.user_id == user_id)
-                .filter((Task.status == None) | (Task.status != "closed"))
-                .count()
-            )
-            if open_count >= 3:
-                raise HTTPException(status_code=403, detail="Free plan limit reached: upgrade to Pro to post more than 3 open tasks.")
+    status = task.status or "open"  # Default to "open" if not provided
+
+    # Open task counter; the free-plan limit is only enforced when ENABLE_PRO=1
+    if quotas.counts_toward_quota(status) and not quotas.try_reserve(db, user_id, enforce=ENABLE_PRO):
+        raise HTTPException(status_code=403, detail="Free plan limit reached: upgrade to Pro to post more than 3 open tasks.")
 
     new_task = Task(
         title=task.title,
         description=task.description,
-        status=task.status or "open",  # Default to "open" if not provided
-        user_id=user_id  # Default to user 1 if not provided
+        status=status,
+        user_id=user_id,  # Default to user 1 if not provided
+        category=task.category,
+        location=task.location,
+        budget=task.budget,
+        created_at=datetime.now(timezone.utc),
+        is_urgent=1 if task.is_urgent else 0,
+        latitude=task.latitude,
+        longitude=task.longitude
     )
     db.add(new_task)
+    db.flush()
+    job_queue.enqueue("recommendations.task_saved", {"task_id": new_task.id}, queue=recommendations.QUEUE, db=db)
     db.commit()
     db.refresh(new_task)
+    return _task_dict(new_task)
+
+# Bulk task creation: one transaction, one bulk INSERT, per-item errors
+@app.post("/tasks/batch")
+def create_tasks_batch(items: list[Any], db: Session = Depends(get_db)):
+    _check_batch_size(items)
+    errors = []
+    new_tasks = []
+    now = datetime.now(timezone.utc)
+    for index, item in enumerate(items):
+        try:
+            task = TaskCreate(**_batch_item_object(item))
+            reject_bad_words(task.title, task.description)
+            user_id = task.user_id or 1
+            status = task.status or "open"
+            if quotas.counts_toward_quota(status) and not quotas.try_reserve(db, user_id, enforce=ENABLE_PRO):
+                raise HTTPException(status_code=403, detail="Free plan limit reached: upgrade to Pro to post more than 3 open tasks.")
+        except (ValidationError, HTTPException) as e:
+            errors.append(_batch_item_error(index, e))
+            continue
+        new_tasks.append((index, Task(
+            title=task.title, description=task.description, status=status, user_id=user_id,
+            category=task.category, location=task.location, budget=task.budget,
+            created_at=now, is_urgent=1 if task.is_urgent else 0,
+            latitude=task.latitude, longitude=task.longitude,
+        )))
+
+    db.add_all(t for _, t in new_tasks)
+    db.flush()
+    if new_tasks:
+        job_queue.enqueue("recommendations.tasks_saved", {"task_ids": [t.id for _, t in new_tasks]}, queue=recommendations.QUEUE, db=db)
+    db.commit()
     return {
-        "id": new_task.id,
-        "title": new_task.title,
-        "description": new_task.description,
-        "status": new_task.status,
-        "user_id": new_task.user_id
+        "created": [{"index": index, "id": t.id} for index, t in new_tasks],
+        "errors": errors,
     }
 
+def _nearby_origin(lat, lng, municipality, db):
+    """The point a nearby search ranks from: lat/lng if given, else the municipality's centroid."""
+    if lat is not None and lng is not None:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise HTTPException(status_code=400, detail="lat must be within [-90, 90] and lng within [-180, 180]")
+        return lat, lng
+    if municipality:
+        origin = geo.centroid(db, municipality)
+        if origin is None:
+            raise HTTPException(status_code=404, detail="Municipality not found")
+        return origin
+    raise HTTPException(status_code=400, detail="Give lat and lng, or a municipality")
+
+
+def _nearby_radius(radius_km):
+    if radius_km is not None and radius_km <= 0:
+        raise HTTPException(status_code=400, detail="radius_km must be positive")
+    return radius_km
+
+# The k open tasks nearest a point (lat/lng, or a municipality's centre),
+# closest first, optionally within radius_km and of one category. Ranked
+# in memory by geo.py; declared before /tasks/{task_id} so "nearby" isn't an id.
+@app.get("/tasks/nearby")
+def get_nearby_tasks(
+    lat: float | None = None,
+    lng: float | None = None,
+    municipality: str | None = None,
+    k: int = 20,
+    radius_km: float | None = None,
+    category: str | None = None,
+    db: Session = Depends(get_db),
+):
+    lat, lng = _nearby_origin(lat, lng, municipality, db)
+    found = geo.nearest_tasks(db, lat, lng, k=max(1, min(k, geo.MAX_K)),
+                              radius_km=_nearby_radius(radius_km), category=category)
+    return [{**_task_dict(task), "distance_km": round(km, 3)} for task, km in found]
+
 # Endpoint to get task by ID
 @app.get("/tasks/{task_id}")
 def get_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == task_id).first()
+    def load():
+        task = db.query(Task).filter(Task.id == task_id, Task.deleted == 0).first()
+        return _task_dict(task) if task else None
+    task = entity_cache.tasks.get(task_id, load)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return {
-        "id": task.id,
-        "title": task.title,
-        "description": task.description,
-        "status": task.status,
-        "user_id": task.user_id
-    }
+    return task
 
 # Endpoint to update task status
 @app.put("/tasks/{task_id}")
 def update_task(task_id: int, task_update: TaskCreate, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == task_id).first()
+    reject_bad_words(task_update.title, task_update.description)
+    task = db.query(Task).filter(Task.id == task_id, Task.deleted == 0).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    delta = quotas.counts_toward_quota(task_update.status) - quotas.counts_toward_quota(task.status)
+    quotas.adjust(db, task.user_id, delta)
     task.title = task_update.title
     task.description = task_update.description
     task.status = task_update.status
+    # Optional fields are only changed when sent
+    for field in ("category", "location", "budget", "latitude", "longitude"):
+        value = getattr(task_update, field)
+        if value is not None:
+            setattr(task, field, value)
+    if task_update.is_urgent is not None:
+        task.is_urgent = 1 if task_update.is_urgent else 0
+    job_queue.enqueue("recommendations.task_saved", {"task_id": task.id}, queue=recommendations.QUEUE, db=db)
     db.commit()
+    entity_cache.tasks.invalidate(task_id)
     db.refresh(task)
-    return {
-        "id": task.id,
-        "title": task.title,
-        "description": task.description,
-        "status": task.status,
-        "user_id": task.user_id
-    }
+    return _task_dict(task)
 
 # Endpoint to delete task
 @app.delete("/tasks/{task_id}")
 def delete_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == task_id).first()
+    task = db.query(Task).filter(Task.id == task_id, Task.deleted == 0).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    if quotas.counts_toward_quota(task.status):
+        quotas.adjust(db, task.user_id, -1)
     db.delete(task)
+    job_queue.enqueue("recommendations.task_deleted", {"task_id": task_id}, queue=recommendations.QUEUE, db=db)
     db.commit()
+    entity_cache.tasks.invalidate(task_id)
     return {"detail": "Task deleted"}
 
 # ================= SUBSCRIPTIONS =================
@@ -491,28 +1200,42 @@ def delete_task(task_id: int, db: Session = Depends(get_db)):
 def _now_utc():
     return datetime.now(timezone.utc)
 
-def _is_pro(sub: 'ProSubscription | None') -> bool:
-    if not sub:
-        return False
-    if sub.plan != "pro":
+def _as_utc(dt):
+    # SQLite returns DateTime columns naive; they are stored as UTC
+    return dt if dt is None or dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def _naive_utc(dt):
+    # For comparisons with stored DateTime columns; naive input is taken as UTC
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+def _plan_is_pro(plan, expires_at) -> bool:
+    if plan != "pro":
         return False
-    if sub.expires_at is None:
+    if expires_at is None:
         return True
-    return sub.expires_at >= _now_utc()
+    return _as_utc(expires_at) >= _now_utc()
+
+def _is_pro(sub: 'ProSubscription | None') -> bool:
+    return bool(sub) and _plan_is_pro(sub.plan, sub.expires_at)
 
 @app.get("/users/{user_id}/subscription")
 def get_subscription(user_id: int, db: Session = Depends(get_db)):
-    sub = db.query(ProSubscription).filter(ProSubscription.user_id == user_id).first()
+    def load():
+        # (plan, expires_at); "no subscription" is cached too, as free
+        sub = db.query(ProSubscription).filter(ProSubscription.user_id == user_id).first()
+        return (sub.plan, sub.expires_at) if sub else ("free", None)
+    # Expiry is evaluated per request, so a cached Pro entry lapses on time
+    plan, expires_at = entity_cache.subscriptions.get(user_id, load)
     return {
         "user_id": user_id,
-        "plan": sub.plan if sub else "free",
-        "expires_at": sub.expires_at.isoformat() if (sub and sub.expires_at) else None,
-        "is_pro": _is_pro(sub),
+        "plan": plan,
+        "expires_at": expires_at.isoformat() if expires_at else None,
+        "is_pro": _plan_is_pro(plan, expires_at),
     }
 
 @app.post("/users/{user_id}/upgrade")
 def upgrade_user(user_id: int, data: SubscriptionUpdate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).filter(User.id == user_id, User.deleted == 0).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -523,10 +1246,13 @@ def upgrade_user(user_id: int, data: SubscriptionUpdate, db: Session = Depends(g
         db.flush()
 
     days = data.days or 30
-    base_time = sub.expires_at if (sub.expires_at and sub.expires_at >= _now_utc()) else _now_utc()
+    expires_at = _as_utc(sub.expires_at)
+    base_time = expires_at if (expires_at and expires_at >= _now_utc()) else _now_utc()
     sub.plan = "pro"
     sub.expires_at = base_time + timedelta(days=days)
+    quotas.set_subscription(db, user_id, sub)
     db.commit()
+    entity_cache.subscriptions.invalidate(user_id)
     db.refresh(sub)
     return {"detail": "Upgraded to Pro", "expires_at": sub.expires_at.isoformat()}
 
@@ -537,33 +1263,45 @@ def downgrade_user(user_id: int, db: Session = Depends(get_db)):
         return {"detail": "Already on free"}
     sub.plan = "free"
     sub.expires_at = None
+    quotas.set_subscription(db, user_id, sub)
     db.commit()
+    entity_cache.subscriptions.invalidate(user_id)
     return {"detail": "Downgraded to Free"}
 
+# Active Pro users; lapsed rows are downgraded by subscriptions.sweep_expired
+@app.get("/subscriptions/pro")
+def get_pro_subscriptions(offset: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    subs = (
+        db.query(ProSubscription)
+        .filter(ProSubscription.plan == "pro")
+        .filter((ProSubscription.expires_at == None) | (ProSubscription.expires_at >= _now_utc()))
+        .order_by(ProSubscription.expires_at)
+        .offset(offset)
+        .limit(min(limit, 500))
+        .all()
+    )
+    return [
+        {"user_id": s.user_id, "expires_at": s.expires_at.isoformat() if s.expires_at else None}
+        for s in subs
+    ]
+
+# Expiry sweeper run metrics
+@app.get("/subscriptions/sweeper")
+def get_subscription_sweeper_stats():
+    return subscriptions.stats()
+
 # ============== WORKERS ==============
 
 # Endpoint to get all workers
 @app.get("/workers")
 def get_workers(db: Session = Depends(get_db)):
-    workers = db.query(Worker).filter(Worker.isAvailable == 1).all()
-    return [
-        {
-            "id": w.id,
-            "user_id": w.user_id,
-            "name": w.name,
-            "phone": w.phone,
-            "skills": w.skills,
-            "location": w.location,
-            "about": w.about,
-            "isAvailable": w.isAvailable,
-            "rating": w.rating
-        }
-        for w in workers
-    ]
+    workers = db.query(Worker).filter(Worker.isAvailable == 1, Worker.deleted == 0).all()
+    return [_worker_dict(w) for w in workers]
 
 # Endpoint to create/update worker profile
 @app.post("/workers")
 def create_worker(data: dict, db: Session = Depends(get_db)):
+    reject_bad_words(data.get('name'), data.get('skills'), data.get('about'))
     user_id = data.get('user_id', 1)
     # Check if worker already exists
     worker = db.query(Worker).filter(Worker.user_id == user_id).first()
@@ -575,6 +1313,8 @@ def create_worker(data: dict, db: Session = Depends(get_db)):
         worker.location = data.get('location', worker.location)
         worker.about = data.get('about', worker.about)
         worker.isAvailable = data.get('isAvailable', 1)
+        worker.latitude = data.get('latitude', worker.latitude)
+        worker.longitude = data.get('longitude', worker.longitude)
     else:
         # Create new
         worker = Worker(
@@ -585,45 +1325,122 @@ def create_worker(data: dict, db: Session = Depends(get_db)):
             location=data.get('location', ''),
             about=data.get('about', ''),
             isAvailable=data.get('isAvailable', 1),
-            rating=0.0
+            rating=0.0,
+            latitude=data.get('latitude'),
+            longitude=data.get('longitude')
         )
         db.add(worker)
+    db.flush()
+    job_queue.enqueue("recommendations.refresh_worker", {"worker_id": worker.id}, queue=recommendations.QUEUE, db=db)
     db.commit()
+    entity_cache.workers.invalidate(worker.id)
     db.refresh(worker)
+    return _worker_dict(worker)
+
+# Bulk worker create/update, same upsert-by-user_id semantics as POST /workers
+@app.post("/workers/batch")
+def create_workers_batch(items: list[Any], db: Session = Depends(get_db)):
+    _check_batch_size(items)
+    errors = []
+    valid = []
+    for index, data in enumerate(items):
+        try:
+            _batch_item_object(data)
+            reject_bad_words(data.get('name'), data.get('skills'), data.get('about'))
+        except HTTPException as e:
+            errors.append(_batch_item_error(index, e))
+            continue
+        valid.append((index, data))
+
+    user_ids = list({data.get('user_id', 1) for _, data in valid})
+    existing = {}
+    for start in range(0, len(user_ids), 500):
+        for w in db.query(Worker).filter(Worker.user_id.in_(user_ids[start:start + 500])):
+            existing[w.user_id] = w
+
+    saved = []
+    for index, data in valid:
+        user_id = data.get('user_id', 1)
+        worker = existing.get(user_id)
+        if worker:
+            worker.name = data.get('name', worker.name)
+            worker.phone = data.get('phone', worker.phone)
+            worker.skills = data.get('skills', worker.skills)
+            worker.location = data.get('location', worker.location)
+            worker.about = data.get('about', worker.about)
+            worker.isAvailable = data.get('isAvailable', 1)
+            worker.latitude = data.get('latitude', worker.latitude)
+            worker.longitude = data.get('longitude', worker.longitude)
+        else:
+            worker = Worker(
+                user_id=user_id,
+                name=data.get('name', 'Unknown'),
+                phone=data.get('phone', ''),
+                skills=data.get('skills', ''),
+                location=data.get('location', ''),
+                about=data.get('about', ''),
+                isAvailable=data.get('isAvailable', 1),
+                rating=0.0,
+                latitude=data.get('latitude'),
+                longitude=data.get('longitude')
+            )
+            db.add(worker)
+            existing[user_id] = worker
+        saved.append((index, worker))
+    db.flush()
+    if saved:
+        worker_ids = list(dict.fromkeys(w.id for _, w in saved))
+        job_queue.enqueue("recommendations.refresh_workers", {"worker_ids": worker_ids}, queue=recommendations.QUEUE, db=db)
+    db.commit()
     return {
-        "id": worker.id,
-        "user_id": worker.user_id,
-        "name": worker.name,
-        "phone": worker.phone,
-        "skills": worker.skills,
-        "location": worker.location,
-        "about": worker.about,
-        "isAvailable": worker.isAvailable,
-        "rating": worker.rating
+        "created": [{"index": index, "id": w.id} for index, w in saved],
+        "errors": errors,
     }
 
+# The k available workers nearest a point, as GET /tasks/nearby
+@app.get("/workers/nearby")
+def get_nearby_workers(
+    lat: float | None = None,
+    lng: float | None = None,
+    municipality: str | None = None,
+    k: int = 20,
+    radius_km: float | None = None,
+    db: Session = Depends(get_db),
+):
+    lat, lng = _nearby_origin(lat, lng, municipality, db)
+    found = geo.nearest_workers(db, lat, lng, k=max(1, min(k, geo.MAX_K)), radius_km=_nearby_radius(radius_km))
+    return [{**_worker_dict(worker), "distance_km": round(km, 3)} for worker, km in found]
+
 # Endpoint to get worker by ID
 @app.get("/workers/{worker_id}")
 def get_worker(worker_id: int, db: Session = Depends(get_db)):
-    worker = db.query(Worker).filter(Worker.id == worker_id).first()
+    def load():
+        worker = db.query(Worker).filter(Worker.id == worker_id, Worker.deleted == 0).first()
+        return _worker_dict(worker) if worker else None
+    worker = entity_cache.workers.get(worker_id, load)
     if not worker:
         raise HTTPException(status_code=404, detail="Worker not found")
-    return {
-        "id": worker.id,
-        "user_id": worker.user_id,
-        "name": worker.name,
-        "phone": worker.phone,
-        "skills": worker.skills,
-        "location": worker.location,
-        "about": worker.about,
-        "isAvailable": worker.isAvailable,
-        "rating": worker.rating
-    }
+    return worker
+
+# Endpoint to get precomputed task recommendations for a worker
+@app.get("/workers/{worker_id}/recommendations")
+def get_worker_recommendations(worker_id: int, limit: int = 20, db: Session = Depends(get_db)):
+    return [
+        {
+            "id": t.id,
+            "title": t.title,
+            "description": t.description,
+            "status": t.status,
+            "user_id": t.user_id,
+            "matchScore": score
+        }
+        for t, score in recommendations.top_tasks(db, worker_id, limit)
+    ]
 
 # Endpoint to get all chat messages
 @app.get("/chat")
 def get_chat_messages(db: Session = Depends(get_db)):
-    messages = db.query(ChatMessage).all()
+    messages = db.query(ChatMessage).filter(ChatMessage.deleted == 0).all()
     return [
         {
             "id": m.id,
@@ -637,6 +1454,7 @@ def get_chat_messages(db: Session = Depends(get_db)):
 # Endpoint to add a new chat message
 @app.post("/chat")
 def create_chat_message(msg: ChatMessageCreate, db: Session = Depends(get_db)):
+    reject_bad_words(msg.content)
     new_msg = ChatMessage(
         user_id=msg.user_id,
         content=msg.content,
@@ -652,37 +1470,54 @@ def create_chat_message(msg: ChatMessageCreate, db: Session = Depends(get_db)):
         "timestamp": new_msg.timestamp
     }
 
-# File upload endpoint
+# File upload endpoint: multipart "file" field, parsed and stored in chunks as
+# it arrives (off the event loop), deduplicated by content. The body is read
+# here rather than through File(...), which would spool all of it first.
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    file_location = os.path.join(FILES_DIR, file.filename)
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename}
-
-# File download endpoint
-# File download endpoint
-@app.get("/files/{filename}")
-def get_file(filename: str):
-    file_path = os.path.join(FILES_DIR, filename)
-    if not os.path.exists(file_path):
+async def upload_file(request: Request):
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if declared > file_store.MAX_UPLOAD_BYTES + file_store.MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        stored, deduplicated = await run_in_threadpool(file_store.save_upload, request)
+    except file_store.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except file_store.BadUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**stored, "deduplicated": deduplicated}
+
+# File download endpoint (supports Range/If-Range resumes and conditional GETs)
+@app.api_route("/files/{filename}", methods=["GET", "HEAD"])
+def get_file(filename: str, request: Request):
+    meta = file_store.metadata(filename)
+    if not meta:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, filename=filename)
+    headers = {"ETag": meta.etag, "Last-Modified": meta.last_modified, "Cache-Control": "no-cache"}
+    if file_store.not_modified(meta, request.headers):
+        return Response(status_code=304, headers=headers)
+    # FileResponse serves 206 byte ranges and uses zero-copy pathsend when the server offers it
+    return FileResponse(meta.path, filename=filename, stat_result=meta.stat, headers=headers)
 
 # Moderation: Delete user
 @app.delete("/users/{user_id}")
 def delete_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).filter(User.id == user_id, User.deleted == 0).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
+    # Hidden everywhere now; purge.py removes the user and their content in small batches
+    purge.hide_user(db, user_id)
+    job_queue.enqueue("purge.user", {"user_id": user_id}, queue="maintenance", db=db)
     db.commit()
+    entity_cache.invalidate_user(user_id)
     return {"detail": "User deleted"}
 
 # Moderation: Delete chat message
 @app.delete("/chat/{message_id}")
 def delete_chat_message(message_id: int, db: Session = Depends(get_db)):
-    msg = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+    msg = db.query(ChatMessage).filter(ChatMessage.id == message_id, ChatMessage.deleted == 0).first()
     if not msg:
         raise HTTPException(status_code=404, detail="Message not found")
     db.delete(msg)
@@ -692,23 +1527,86 @@ def delete_chat_message(message_id: int, db: Session = Depends(get_db)):
 # Moderation: Ban user
 @app.post("/ban/{user_id}")
 def ban_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.query(User).filter(User.id == user_id, User.deleted == 0).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user.banned = 1
     db.commit()
+    entity_cache.invalidate_user(user_id)
     return {"detail": f"User {user_id} banned"}
 
 # App statistics endpoint
 @app.get("/stats")
 def get_stats(db: Session = Depends(get_db)):
-    user_count = db.query(User).count()
-    task_count = db.query(Task).count()
-    chat_count = db.query(ChatMessage).count()
+    return Response(warm_cache.get("stats", db), media_type="application/json")
+
+# Daily activity (new users, tasks posted and closed, chat messages, Pro
+# upgrades) from the rollup table; group_by is a comma list of day,
+# municipality, district and category, empty for totals over the range
+@app.get("/stats/timeseries")
+def get_stats_timeseries(
+    since: date | None = None,
+    until: date | None = None,
+    group_by: str = "day",
+    municipality: str | None = None,
+    district: str | None = None,
+    category: str | None = None,
+):
+    until = until or datetime.now(timezone.utc).date()
+    since = since or until - timedelta(days=29)
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    if (until - since).days >= rollups.MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {rollups.MAX_RANGE_DAYS} days per request")
+    groups = [g.strip() for g in group_by.split(",") if g.strip()]
+    if any(g not in rollups.GROUPS for g in groups) or len(set(groups)) != len(groups):
+        raise HTTPException(status_code=400, detail=f"group_by must be a comma list of {', '.join(rollups.GROUPS)}")
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "group_by": groups,
+        "rows": rollups.timeseries(since, until, groups, municipality=municipality, district=district, category=category),
+    }
+
+# Background job queue throughput, latency and backlog
+@app.get("/jobs/stats")
+def get_job_stats(db: Session = Depends(get_db)):
+    return job_queue.stats(db)
+
+# Ranked full-text search (FTS5); type is a comma list of tasks, workers, chat
+@app.get("/search")
+def search_content(q: str, type: str = "tasks,workers", limit: int = 20, offset: int = 0, prefix: bool = True):
+    types = [t.strip() for t in type.split(",") if t.strip()]
+    unknown = [t for t in types if t not in SEARCH_INDEXES]
+    if not types or unknown:
+        raise HTTPException(status_code=400, detail=f"type must be a comma list of {', '.join(SEARCH_INDEXES)}")
+    return search.search(q, types=types, limit=max(1, min(limit, search.MAX_PAGE_SIZE)),
+                         offset=max(0, offset), prefix=prefix)
+
+@app.post("/search/rebuild")
+def rebuild_search_indexes(admin: bool = False, db: Session = Depends(get_db)):
+    """Reindex every search index from its table, in the background"""
+    require_admin(admin)
+    job = job_queue.enqueue("search.rebuild", queue="maintenance", db=db)
+    db.commit()
+    return {"detail": "Search index rebuild queued", "job_id": job.id}
+
+@app.get("/debug/queries")
+def get_slow_queries(admin: bool = False, limit: int = 20, sort: str = "total"):
+    """Slowest statement shapes over the rolling window, plus suspected N+1 routes"""
+    require_admin(admin)
+    if sort not in ("total", "mean", "max", "count"):
+        raise HTTPException(status_code=400, detail="sort must be one of total, mean, max, count")
+    return query_profiler.top_queries(limit=max(1, min(limit, 200)), sort=sort)
+
+@app.get("/debug/traces")
+def get_slow_traces(admin: bool = False, limit: int = 20):
+    """Recent sampled requests slower than BMK_TRACE_SLOW_MS, with their stage spans"""
+    require_admin(admin)
     return {
-        "users": user_count,
-        "tasks": task_count,
-        "chat_messages": chat_count
+        "sample_rate": tracing.SAMPLE_RATE,
+        "slow_ms": tracing.SLOW_MS,
+        "traces": tracing.slow_traces(limit=max(1, min(limit, tracing.BUFFER_SIZE))),
     }
 
 # App version check endpoint
@@ -749,4 +1647,22 @@ def get_feature_flags():
         "max_tasks_per_user": 50,
         "maintenance_mode": False,  # Set True to show maintenance screen
         "maintenance_message": "Server maintenance in progress. Please try again later."
-    }
\ No newline at end of file
+    }
+
+
+# Feature modules import models from this file, so they are loaded last
+import job_queue
+import recommendations
+import file_store
+import quotas
+import subscriptions
+import invalidation
+import entity_cache
+import warm_cache
+import search
+import purge
+import rollups
+import geo
+from moderation import router as moderation_router
+
+app.include_router(moderation_router)
@@ -0,0 +1,90 @@
+# Scheduled sweeper that moves lapsed Pro subscriptions back to free.
+# Once swept, "who is Pro" is just plan = 'pro' on the (plan, expires_at)
+# index instead of evaluating expiry row by row.
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select, text, update
+
+import job_queue
+from server import SessionLocal, ProSubscription
+
+SWEEP_SECONDS = int(os.environ.get("BMK_SUBSCRIPTION_SWEEP_SECONDS", "300"))
+SWEEP_BATCH_SIZE = int(os.environ.get("BMK_SUBSCRIPTION_SWEEP_BATCH", "500"))
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "runs": 0,
+    "rows_total": 0,
+    "last_run_at": None,
+    "last_rows": 0,
+    "last_batches": 0,
+    "last_duration_seconds": 0.0,
+    "max_duration_seconds": 0.0,
+}
+
+
+def _sweep_batch(now):
+    """Downgrade up to SWEEP_BATCH_SIZE lapsed rows in one short transaction."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(ProSubscription.id, ProSubscription.user_id)
+            .where(ProSubscription.plan == "pro", ProSubscription.expires_at < now)
+            .limit(SWEEP_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return 0
+        ids = [r.id for r in rows]
+        # Re-check expiry in the UPDATE in case someone renewed in between
+        affected = db.execute(
+            update(ProSubscription)
+            .where(ProSubscription.id.in_(ids), ProSubscription.plan == "pro", ProSubscription.expires_at < now)
+            .values(plan="free")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        # Keep the cached plan used by the task quota in step
+        user_ids = ", ".join(str(int(r.user_id)) for r in rows if r.user_id is not None)
+        if user_ids:
+            db.execute(text(
+                f"UPDATE task_quotas SET plan = 'free', expires_at = NULL"
+                f" WHERE plan = 'pro' AND expires_at < :now AND user_id IN ({user_ids})"
+            ), {"now": now.timestamp()})
+        db.commit()
+        return affected
+    finally:
+        db.close()
+
+
+@job_queue.task("subscriptions.sweep_expired")
+def sweep_expired():
+    """Downgrade every lapsed Pro subscription in batches; returns rows affected."""
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    total = batches = 0
+    while True:
+        affected = _sweep_batch(now)
+        if not affected:
+            break
+        total += affected
+        batches += 1
+    elapsed = time.perf_counter() - started
+    with _metrics_lock:
+        _metrics["runs"] += 1
+        _metrics["rows_total"] += total
+        _metrics["last_run_at"] = now.isoformat()
+        _metrics["last_rows"] = total
+        _metrics["last_batches"] = batches
+        _metrics["last_duration_seconds"] = round(elapsed, 4)
+        _metrics["max_duration_seconds"] = max(_metrics["max_duration_seconds"], round(elapsed, 4))
+    return total
+
+
+def stats():
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+job_queue.every(SWEEP_SECONDS, "subscriptions.sweep_expired", queue="maintenance")
@@ -0,0 +1,27 @@
+import random
+import re
+
+import content_filter
+
+WORDS = ["he", "she", "hers", "his", "ushers", "sh"]
+
+
+def _brute_force(words, text):
+    """Whole-word matches the slow way: one regex per word."""
+    text = content_filter.normalize(text)
+    return {w for w in words if re.search(rf"(?<!\w){re.escape(w)}(?!\w)", text)}
+
+
+def test_automaton_matches_regex_scan_on_overlapping_words():
+    automaton = content_filter.Automaton(WORDS)
+    rng = random.Random(7)
+    for _ in range(500):
+        text = " ".join(rng.choice(WORDS + ["x", "ushe", "hishers"]) for _ in range(rng.randint(0, 8)))
+        found = {automaton.words[i] for i in automaton.scan(text)}
+        assert found == _brute_force(WORDS, text), text
+
+
+def test_normalized_variants_match_but_not_inside_words():
+    automaton = content_filter.Automaton(["spamword"])
+    assert automaton.scan("buy SP@MW0RD now", first_only=True) == [0]
+    assert automaton.scan("spamwords and xspamword") == []
@@ -0,0 +1,110 @@
+import hashlib
+import os
+
+from fastapi.testclient import TestClient
+
+import server
+
+client = TestClient(server.app)
+
+BIG_FILE_SIZE = 300 * 1024 * 1024
+
+
+def _make_big_file(name):
+    # Sparse file with markers so a misplaced range shows up in the hash
+    path = os.path.join(server.FILES_DIR, name)
+    with open(path, "wb") as f:
+        f.truncate(BIG_FILE_SIZE)
+        for offset in range(0, BIG_FILE_SIZE, 7 * 1024 * 1024):
+            f.seek(offset)
+            f.write(offset.to_bytes(8, "big"))
+    return path
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def test_resume_interrupted_download():
+    path = _make_big_file("big.bin")
+    digest = hashlib.sha256()
+    received = 0
+
+    # First attempt: the connection drops after cutoff bytes
+    cutoff = 123 * 1024 * 1024 + 17
+    with client.stream("GET", "/files/big.bin") as resp:
+        assert resp.status_code == 200
+        assert resp.headers["accept-ranges"] == "bytes"
+        etag = resp.headers["etag"]
+        for chunk in resp.iter_bytes():
+            chunk = chunk[:cutoff - received]
+            digest.update(chunk)
+            received += len(chunk)
+            if received == cutoff:
+                break
+    assert received == cutoff
+
+    # Resume from where we stopped, only if the file hasn't changed
+    headers = {"Range": f"bytes={received}-", "If-Range": etag}
+    with client.stream("GET", "/files/big.bin", headers=headers) as resp:
+        assert resp.status_code == 206
+        assert resp.headers["content-range"] == f"bytes {received}-{BIG_FILE_SIZE - 1}/{BIG_FILE_SIZE}"
+        for chunk in resp.iter_bytes():
+            digest.update(chunk)
+            received += len(chunk)
+
+    assert received == BIG_FILE_SIZE
+    assert digest.hexdigest() == _sha256(path)
+    os.remove(path)
+
+
+def test_stale_if_range_sends_whole_file():
+    client.post("/upload", files={"file": ("notes.txt", b"first version")})
+    etag = client.get("/files/notes.txt").headers["etag"]
+    client.post("/upload", files={"file": ("notes.txt", b"second version")})
+    resp = client.get("/files/notes.txt", headers={"Range": "bytes=7-", "If-Range": etag})
+    assert resp.status_code == 200
+    assert resp.content == b"second version"
+
+
+def test_conditional_get():
+    client.post("/upload", files={"file": ("hello.txt", b"hello world")})
+    resp = client.get("/files/hello.txt")
+    assert resp.headers["etag"] == f'"{hashlib.sha256(b"hello world").hexdigest()}"'
+
+    resp = client.get("/files/hello.txt", headers={"If-None-Match": resp.headers["etag"]})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+    resp = client.get("/files/hello.txt", headers={"If-Modified-Since": resp.headers["last-modified"]})
+    assert resp.status_code == 304
+
+    resp = client.get("/files/hello.txt", headers={"Range": "bytes=6-"})
+    assert resp.status_code == 206
+    assert resp.content == b"world"
+
+
+def test_unsatisfiable_range_and_missing_file():
+    client.post("/upload", files={"file": ("tiny.txt", b"abc")})
+    assert client.get("/files/tiny.txt", headers={"Range": "bytes=10-"}).status_code == 416
+    assert client.get("/files/does-not-exist.txt").status_code == 404
+
+
+def test_malformed_content_length_is_a_bad_request():
+    resp = client.post("/upload", content=b"x", headers={"Content-Length": "abc", "Content-Type": "text/plain"})
+    assert resp.status_code == 400
+
+
+def test_file_replaced_by_another_worker_is_not_served_from_cache():
+    client.post("/upload", files={"file": ("swap.txt", b"before")})
+    assert client.get("/files/swap.txt").content == b"before"
+    after = client.post("/upload", files={"file": ("swap-source.txt", b"after!")}).json()
+    # The row changes behind this process's cache, as a write from another worker would
+    with server.engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE stored_files SET sha256 = ?, size = ? WHERE name = 'swap.txt'",
+                             (after["sha256"], after["size"]))
+    assert client.get("/files/swap.txt").content == b"after!"
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+import geo
+import server
+
+
+def _brute_force(lat, lng, lat0, lng0, k):
+    phi, lam, phi0, lam0 = np.radians(lat), np.radians(lng), np.radians(lat0), np.radians(lng0)
+    a = np.sin((phi - phi0) / 2) ** 2 + np.cos(phi0) * np.cos(phi) * np.sin((lam - lam0) / 2) ** 2
+    return np.sort(2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0))))[:k]
+
+
+def test_nearest_matches_brute_force_including_sparse_and_antimeridian_points():
+    rng = np.random.default_rng(3)
+    # A dense cluster plus points scattered over the globe, some by the antimeridian
+    lat = np.concatenate([rng.uniform(27.0, 28.0, 2000), rng.uniform(-80, 80, 300), rng.uniform(-10, 10, 50)])
+    lng = np.concatenate([rng.uniform(85.0, 86.0, 2000), rng.uniform(-180, 180, 300), rng.uniform(178, 180, 50)])
+    points = geo.Points(np.arange(len(lat)), lat, lng)
+    origins = [(27.5, 85.5), (0.0, -179.9), (-60.0, 20.0), (85.0, 0.0)]
+    for lat0, lng0 in origins:
+        for k in (1, 7, 40):
+            ids, distances = points.nearest(lat0, lng0, k)
+            assert np.allclose(distances, _brute_force(lat, lng, lat0, lng0, k)), (lat0, lng0, k)
+            assert len(set(ids.tolist())) == k
+
+
+def test_radius_and_key_filter_the_ranking():
+    lat, lng = [27.70, 27.71, 27.90, 27.72], [85.30, 85.31, 85.30, 85.32]
+    points = geo.Points([1, 2, 3, 4], lat, lng, keys=["plumbing", "wiring", "plumbing", "plumbing"])
+    ids, distances = points.nearest(27.70, 85.30, 10, radius_km=5, key="plumbing")
+    assert ids.tolist() == [1, 4]
+    assert distances[0] == 0 and distances[1] < 5
+    assert points.nearest(27.70, 85.30, 10, key="painting")[0].tolist() == []
+
+
+def _wait_for_refresh(index):
+    for _ in range(200):
+        if not index._refreshing:
+            return
+        time.sleep(0.01)
+    raise AssertionError("refresh did not finish")
+
+
+def test_changed_rows_are_patched_in_and_filtered_hits_are_replaced(monkeypatch):
+    db = server.SessionLocal()
+    try:
+        tasks = [server.Task(title=f"Geo {i}", category="geo-test", status="open", deleted=0,
+                             latitude=-45.0 + i * 0.001, longitude=170.0) for i in range(30)]
+        db.add_all(tasks)
+        db.commit()
+        geo.tasks.build()
+        # Closed behind the snapshot's back: more than the spare hits it ranks
+        for task in tasks[:15]:
+            task.status = "closed"
+        db.commit()
+        found = geo.nearest_tasks(db, -45.0, 170.0, k=10, category="geo-test")
+        assert [task.id for task, _ in found] == [task.id for task in tasks[15:25]]
+
+        db.add(server.Task(title="Geo new", category="geo-test", status="open", deleted=0,
+                           latitude=-45.0, longitude=170.0))
+        db.commit()
+        monkeypatch.setattr(geo, "REFRESH_SECONDS", 0)
+        # The test table is small; 16 changed rows would otherwise be worth a reload
+        monkeypatch.setattr(geo, "REBUILD_FRACTION", 1.0)
+        monkeypatch.setattr(geo.tasks, "build", lambda: pytest.fail("patched rows shouldn't reload the table"))
+        geo.tasks.points()
+        _wait_for_refresh(geo.tasks)
+        ids, _ = geo.tasks.nearest(-45.0, 170.0, 16, key="geo-test")
+        assert db.get(server.Task, int(ids[0])).title == "Geo new"
+        assert set(ids.tolist()[1:]) == {task.id for task in tasks[15:]}
+    finally:
+        db.close()
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+from sqlalchemy import text
+
+import job_queue
+import server
+
+
+@pytest.fixture(autouse=True)
+def _empty_queue():
+    with server.engine.begin() as conn:
+        conn.execute(text("DELETE FROM jobs"))
+    yield
+    job_queue._handlers.pop("test.fail", None)
+    job_queue._handlers.pop("test.ok", None)
+
+
+def _job(job_id):
+    with server.engine.connect() as conn:
+        return conn.execute(text("SELECT * FROM jobs WHERE id = :id"), {"id": job_id}).mappings().first()
+
+
+def _enqueue(name, payload=None, max_attempts=3):
+    """Enqueue on its own transaction and return the new job's id."""
+    job_queue.enqueue(name, payload, queue="test", max_attempts=max_attempts)
+    with server.engine.connect() as conn:
+        return conn.execute(text("SELECT MAX(id) FROM jobs")).scalar()
+
+
+def _failing(**payload):
+    raise RuntimeError("boom")
+
+
+def test_failing_job_backs_off_then_fails_after_max_attempts():
+    job_queue.register("test.fail", _failing)
+    job_id = _enqueue("test.fail", max_attempts=2)
+
+    assert job_queue.run_one()
+    job = _job(job_id)
+    assert (job["status"], job["attempts"], job["last_error"]) == ("queued", 1, "RuntimeError: boom")
+    assert job["run_at"] > time.time()
+    # Not runnable until the backoff has passed
+    assert not job_queue.run_one()
+
+    with server.engine.begin() as conn:
+        conn.execute(text("UPDATE jobs SET run_at = 0 WHERE id = :id"), {"id": job_id})
+    assert job_queue.run_one()
+    job = _job(job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 2)
+
+
+def test_expired_lease_is_retried_until_attempts_run_out():
+    ran = []
+    job_queue.register("test.ok", lambda **payload: ran.append(payload))
+    retried = _enqueue("test.ok", {"n": 1})
+    exhausted = _enqueue("test.ok", {"n": 2})
+    # Both were claimed by a worker that died; one had attempts left
+    with server.engine.begin() as conn:
+        conn.execute(text("UPDATE jobs SET status = 'running', lease_until = :past, attempts = 1 WHERE id = :id"),
+                     {"id": retried, "past": time.time() - 1})
+        conn.execute(text("UPDATE jobs SET status = 'running', lease_until = :past, attempts = 3 WHERE id = :id"),
+                     {"id": exhausted, "past": time.time() - 1})
+
+    assert job_queue.run_one()
+    assert not job_queue.run_one()
+    assert ran == [{"n": 1}]
+    assert _job(retried) is None  # finished jobs are deleted
+    job = _job(exhausted)
+    assert (job["status"], job["attempts"]) == ("failed", 3)
+
+
+def test_job_enqueued_in_a_session_wakes_workers_only_on_commit():
+    job_queue._wake.clear()
+    db = server.SessionLocal()
+    try:
+        job_queue.enqueue("test.ok", queue="test", db=db)
+        assert not job_queue._wake.is_set()
+        db.rollback()
+        assert not job_queue._wake.is_set()
+        job_queue.enqueue("test.ok", queue="test", db=db)
+        db.commit()
+        assert job_queue._wake.is_set()
+    finally:
+        db.close()
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+import moderation
+import server
+
+client = TestClient(server.app)
+
+
+def _flagged(user_id):
+    db = server.SessionLocal()
+    try:
+        return db.query(server.User).filter(server.User.id == user_id).one().flagged
+    finally:
+        db.close()
+
+
+def _report(user_id, times):
+    for _ in range(times):
+        assert client.post("/report", json={"reporter_id": 1, "reported_user_id": user_id,
+                                            "reason": "spam"}).status_code == 200
+
+
+def test_clear_lasts_until_threshold_more_reports():
+    db = server.SessionLocal()
+    try:
+        user = server.User(name="Reported", email="reported@example.com", role="poster")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    finally:
+        db.close()
+    threshold = moderation.REPORT_FLAG_THRESHOLD
+
+    _report(user_id, threshold)
+    assert _flagged(user_id) == 1
+    assert client.post(f"/reports/users/{user_id}/clear", params={"admin": True}).status_code == 200
+    _report(user_id, threshold - 1)
+    assert _flagged(user_id) == 0
+    _report(user_id, 1)
+    assert _flagged(user_id) == 1
+
+
+def test_status_page_is_read_in_index_order():
+    with server.engine.connect() as conn:
+        plan = [row[3] for row in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM reports WHERE status = 'open' AND id < 100 ORDER BY id DESC LIMIT 51"
+        )]
+    assert any("USING INDEX ix_reports_status_id (status=? AND id<?)" in detail for detail in plan), plan
+    assert not any("TEMP B-TREE" in detail for detail in plan)
@@ -0,0 +1,63 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+import purge
+import server
+
+
+def _user_with_tasks(email, tasks):
+    db = server.SessionLocal()
+    try:
+        user = server.User(name="Poster", email=email, role="poster")
+        db.add(user)
+        db.flush()
+        db.add_all(server.Task(user_id=user.id, title=f"Task {i}", status="open") for i in range(tasks))
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def test_purge_deletes_in_batches_and_keeps_other_users_rows(monkeypatch):
+    monkeypatch.setattr(purge, "BATCH_SIZE", 3)
+    monkeypatch.setattr(purge, "PAUSE_SECONDS", 0)
+    doomed = _user_with_tasks("doomed@example.com", 7)
+    kept = _user_with_tasks("kept@example.com", 2)
+    with server.engine.begin() as conn:
+        purge.hide_user(conn, doomed)
+
+    deletes = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("DELETE FROM tasks"):
+            deletes.append(statement)
+
+    event.listen(server.engine, "before_cursor_execute", record)
+    try:
+        removed = purge.purge_user(doomed)
+    finally:
+        event.remove(server.engine, "before_cursor_execute", record)
+
+    assert removed["tasks"] == 7 and removed["users"] == 1
+    # 3 + 3 + 1: the short batch ends the table
+    assert len(deletes) == 3
+    with server.engine.connect() as conn:
+        count = "SELECT COUNT(*) FROM tasks WHERE user_id = :u"
+        assert conn.execute(text(count), {"u": doomed}).scalar() == 0
+        assert conn.execute(text(count), {"u": kept}).scalar() == 2
+
+
+def test_deleted_email_registers_again_and_purged_ids_are_not_reused(monkeypatch):
+    monkeypatch.setattr(purge, "PAUSE_SECONDS", 0)
+    client = TestClient(server.app)
+    user_id = _user_with_tasks("again@example.com", 0)
+    assert client.delete(f"/users/{user_id}").status_code == 200
+    # Before the purge job has run
+    again = client.post("/register", json={"name": "Again", "email": "again@example.com",
+                                           "password": "pw123456", "role": "poster"}).json()
+    assert again["email"] == "again@example.com"
+    # The newest user has the highest id, the one SQLite would hand out again
+    with server.engine.begin() as conn:
+        purge.hide_user(conn, again["id"])
+    purge.purge_user(again["id"])
+    assert _user_with_tasks("next@example.com", 0) > again["id"]
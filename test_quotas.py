@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import quotas
+import server
+
+client = TestClient(server.app)
+
+
+@pytest.fixture(autouse=True)
+def _enforce(monkeypatch):
+    monkeypatch.setattr(server, "ENABLE_PRO", True)
+
+
+def _poster(email):
+    db = server.SessionLocal()
+    try:
+        user = server.User(name="Poster", email=email, role="poster")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def _post(user_id, status=None):
+    return client.post("/tasks", json={"title": "Quota task", "description": "needs doing",
+                                       "user_id": user_id, "status": status})
+
+
+def _open_tasks(user_id):
+    with server.engine.connect() as conn:
+        return conn.execute(text("SELECT open_tasks FROM task_quotas WHERE user_id = :u"), {"u": user_id}).scalar()
+
+
+def test_free_plan_is_refused_past_the_limit_and_finished_tasks_free_a_slot():
+    user_id = _poster("quota-free@example.com")
+    posted = [_post(user_id) for _ in range(quotas.FREE_TASK_LIMIT)]
+    assert all(response.status_code == 200 for response in posted)
+    assert _post(user_id).status_code == 403
+    # Completed tasks don't count, whether posted that way or finished later
+    assert _post(user_id, status="completed").status_code == 200
+    task_id = posted[0].json()["id"]
+    finished = {"title": "Quota task", "description": "done", "status": "completed"}
+    assert client.put(f"/tasks/{task_id}", json=finished).status_code == 200
+    assert _open_tasks(user_id) == quotas.FREE_TASK_LIMIT - 1
+    assert _post(user_id).status_code == 200
+
+
+def test_pro_posts_past_the_limit_until_it_expires():
+    user_id = _poster("quota-pro@example.com")
+    assert client.post(f"/users/{user_id}/upgrade", json={"days": 30}).status_code == 200
+    for _ in range(quotas.FREE_TASK_LIMIT + 1):
+        assert _post(user_id).status_code == 200
+
+    db = server.SessionLocal()
+    try:
+        sub = db.query(server.ProSubscription).filter(server.ProSubscription.user_id == user_id).one()
+        sub.expires_at = datetime.now(timezone.utc) - timedelta(days=1)
+        quotas.set_subscription(db, user_id, sub)
+        db.commit()
+    finally:
+        db.close()
+    assert _post(user_id).status_code == 403
+
+
+def test_reconcile_repairs_a_skewed_counter_and_posterless_tasks_have_none():
+    user_id = _poster("quota-skew@example.com")
+    assert _post(user_id).status_code == 200
+    assert _post(user_id, status="closed").status_code == 200
+    with server.engine.begin() as conn:
+        conn.execute(text("UPDATE task_quotas SET open_tasks = 99 WHERE user_id = :u"), {"u": user_id})
+    assert _post(user_id).status_code == 403
+
+    assert quotas.reconcile() >= 1
+    assert _open_tasks(user_id) == 1
+    assert _post(user_id).status_code == 200
+
+    db = server.SessionLocal()
+    try:
+        quotas.adjust(db, None, 1)
+        db.commit()
+        assert db.execute(text("SELECT COUNT(*) FROM task_quotas WHERE user_id IS NULL")).scalar() == 0
+    finally:
+        db.close()
@@ -0,0 +1,52 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+import rate_limit
+import server
+
+
+async def _ok(scope, receive, send):
+    await PlainTextResponse("ok")(scope, receive, send)
+
+
+def _client(**kwargs):
+    middleware = rate_limit.RateLimitMiddleware(_ok, backend="memory", enabled=True, **kwargs)
+    return middleware, TestClient(middleware)
+
+
+def test_login_burst_then_429_with_retry_after():
+    _, client = _client()
+    statuses = [client.post("/login").status_code for _ in range(rate_limit.LIMITS["login"].burst)]
+    assert statuses == [200] * rate_limit.LIMITS["login"].burst
+    resp = client.post("/login")
+    assert resp.status_code == 429
+    assert int(resp.headers["retry-after"]) >= 1
+
+
+def test_user_key_is_the_user_id_of_a_valid_token_only():
+    middleware, client = _client(user_id=server.bearer_user_id)
+    token = server.create_access_token({"sub": "a@example.com", "user_id": 42})
+    client.get("/tasks", headers={"Authorization": f"Bearer {token}"})
+    client.get("/tasks", headers={"Authorization": "Bearer forged.token.value"})
+    users = [key for key in middleware.store._state if ":user:" in key]
+    assert users == ["default:user:42"]
+
+
+def test_forwarded_for_uses_the_entry_the_trusted_proxy_appended():
+    middleware, client = _client(trusted_proxies=1)
+    client.get("/", headers={"X-Forwarded-For": "1.2.3.4, 203.0.113.7"})
+    assert list(middleware.store._state) == ["default:ip:203.0.113.7"]
+
+
+def test_sqlite_backend_does_not_lock_the_app_db(tmp_path):
+    store = rate_limit.SQLiteStore(str(tmp_path / "rate_limits.db"))
+    app_db = sqlite3.connect(server.SQLITE_DB_PATH, isolation_level=None)
+    app_db.execute("BEGIN IMMEDIATE")
+    try:
+        # A write held open on the app DB must not stall the limiter
+        assert store.hit("login:ip:1.2.3.4", rate_limit.LIMITS["login"]) == 0
+    finally:
+        app_db.execute("ROLLBACK")
+        app_db.close()
@@ -0,0 +1,32 @@
+from datetime import date, datetime, timezone
+
+import rollups
+import server
+
+POSTED = date(2001, 3, 4)
+
+
+def test_triggers_count_tasks_and_timeseries_sums_them():
+    db = server.SessionLocal()
+    try:
+        tasks = [
+            server.Task(title="Rollup test", category="rollup-test", location=location, status="open",
+                        created_at=datetime(2001, 3, 4, 10, 0))
+            for location in ("Pokhara", "Pokhara", "Dharan")
+        ]
+        db.add_all(tasks)
+        db.commit()
+        tasks[0].status = "closed"
+        db.commit()
+    finally:
+        db.close()
+
+    by_place = rollups.timeseries(POSTED, POSTED, ("municipality",), category="rollup-test")
+    assert [(row["municipality"], row["new_tasks"]) for row in by_place] == [("Dharan", 1), ("Pokhara", 2)]
+    # The per-category table agrees with the municipality rows it summarizes
+    [total] = rollups.timeseries(POSTED, POSTED, ("day",), category="rollup-test")
+    assert (total["day"], total["new_tasks"], total["closed_tasks"]) == (POSTED.isoformat(), 3, 0)
+    # A close counts on the day it happens
+    today = datetime.now(timezone.utc).date()
+    [closed] = rollups.timeseries(today, today, (), category="rollup-test")
+    assert closed["closed_tasks"] == 1
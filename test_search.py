@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import search
+import server
+
+
+def _add_tasks(*tasks):
+    db = server.SessionLocal()
+    try:
+        rows = [server.Task(title=title, description=description, status="open", deleted=deleted)
+                for title, description, deleted in tasks]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
+    finally:
+        db.close()
+
+
+def test_title_match_outranks_description_match_and_deleted_rows_are_hidden():
+    # bm25 scores a term found in most rows as ~0, so give it a corpus to be rare in
+    _add_tasks(*[(f"Filler task {i}", "paint the fence", 0) for i in range(10)])
+    in_description, in_title, deleted = _add_tasks(
+        ("Fix the sink", "bring a zanzibarwrench please", 0),
+        ("Zanzibarwrench needed", "kitchen job", 0),
+        ("Zanzibarwrench hire", "", 1),
+    )
+    hits = search.search("zanzibarwr", types=("tasks",))["tasks"]
+    assert [hit["id"] for hit in hits] == [in_title, in_description]
+    assert hits[0]["score"] > hits[1]["score"]
+    assert deleted not in [hit["id"] for hit in hits]
+
+
+
+def test_batched_rebuild_keeps_writes_made_between_batches(monkeypatch):
+    monkeypatch.setattr(search, "REBUILD_BATCH", 4)
+    ids = _add_tasks(*[(f"Rebuild task {i}", "quixoticbatch", 0) for i in range(10)])
+    late = []
+
+    def write_between_batches(seconds):
+        with server.engine.connect() as conn:
+            copied = conn.exec_driver_sql("SELECT last_id FROM search_rebuilds WHERE name = 'tasks'").scalar()
+        if late or copied is None or not ids[0] <= copied < ids[9]:
+            return
+        # A row already copied, one not yet copied, and one past the end
+        with server.engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE tasks SET description = 'plainer' WHERE id = ?", (ids[0],))
+            conn.exec_driver_sql("UPDATE tasks SET deleted = 1 WHERE id = ?", (ids[1],))
+            conn.exec_driver_sql("DELETE FROM tasks WHERE id = ?", (ids[9],))
+        late.extend(_add_tasks(("Late quixoticbatch", "", 0)))
+
+    monkeypatch.setattr(search, "time", SimpleNamespace(sleep=write_between_batches))
+    search.rebuild(["tasks"])
+
+    assert late
+    with server.engine.connect() as conn:
+        conn.exec_driver_sql("INSERT INTO tasks_fts (tasks_fts, rank) VALUES ('integrity-check', 1)")
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM search_rebuilds").scalar() == 0
+    found = lambda: {hit["id"] for hit in search.search("quixoticbatch", types=("tasks",), limit=50)["tasks"]}
+    assert found() == set(ids[2:9]) | set(late)
+    # The live triggers feed the swapped-in index
+    assert _add_tasks(("Quixoticbatch after", "", 0))[0] in found()
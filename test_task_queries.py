@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import server
+
+client = TestClient(server.app)
+
+
+@contextmanager
+def _captured_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(server.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(server.engine, "before_cursor_execute", record)
+
+
+def _plan(params):
+    """EXPLAIN QUERY PLAN of the statement GET /tasks runs for params, one detail per line."""
+    with _captured_statements() as statements:
+        resp = client.get("/tasks", params=params)
+    assert resp.status_code == 200
+    listing = [(sql, args) for sql, args in statements if "FROM tasks" in sql and "ORDER BY" in sql]
+    assert len(listing) == 1
+    sql, args = listing[0]
+    with server.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", args).all()
+    return [row[3] for row in rows]
+
+
+def _uses(plan, index, constraint):
+    return any(f"USING INDEX {index} ({constraint})" in detail for detail in plan)
+
+
+def _sorts(plan):
+    return any("TEMP B-TREE" in detail for detail in plan)
+
+
+def test_unfiltered_listing_reads_created_at_index():
+    plan = _plan({})
+    assert any("SCAN tasks USING INDEX ix_tasks_created_at" in detail for detail in plan)
+    assert not _sorts(plan)
+
+
+def test_status_and_date_range_use_status_index():
+    plan = _plan({"status": "open", "since": "2026-01-01T00:00:00", "until": "2026-02-01T00:00:00Z"})
+    assert _uses(plan, "ix_tasks_status_created_at", "status=? AND created_at>? AND created_at<?")
+    assert not _sorts(plan)
+
+
+def test_category_uses_category_index():
+    plan = _plan({"category": "plumbing", "urgent": "true", "limit": 20})
+    assert _uses(plan, "ix_tasks_category_created_at", "category=?")
+    assert not _sorts(plan)
+
+
+def test_poster_and_status_use_user_index():
+    plan = _plan({"user_id": 7, "status": "open"})
+    assert _uses(plan, "ix_tasks_user_id_status_created_at", "user_id=? AND status=?")
+    assert not _sorts(plan)
+
+
+def test_poster_names_are_joined_by_primary_key():
+    plan = _plan({"status": "open"})
+    assert any("users USING INTEGER PRIMARY KEY" in detail for detail in plan)
+
+
+def test_filters_return_real_columns():
+    created = client.post("/tasks", json={
+        "title": "Fix leaking tap", "description": "Kitchen tap", "user_id": 424242,
+        "category": "plumbing", "location": "Lalitpur", "budget": "Rs. 1500", "is_urgent": True,
+    }).json()
+    client.post("/tasks", json={"title": "Paint gate", "description": "Front gate", "user_id": 424242,
+                                "category": "painting"})
+    tasks = client.get("/tasks", params={"user_id": 424242, "category": "plumbing", "urgent": "true"}).json()
+    assert [t["id"] for t in tasks] == [created["id"]]
+    assert tasks[0]["location"] == "Lalitpur"
+    assert tasks[0]["budget"] == "Rs. 1500"
+    assert tasks[0]["isUrgent"] is True
+    assert tasks[0]["postedDate"] == created["created_at"]
+    assert client.get("/tasks", params={"user_id": 424242, "since": "2100-01-01"}).json() == []
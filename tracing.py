@@ -0,0 +1,215 @@
+# Per-request stage timing.
+#
+# Each request gets a Trace holding time spent in dependency resolution
+# (get_db, auth, body parsing), the handler body, database statements and
+# response rendering; with BMK_SERVER_TIMING=1 the totals go out as a
+# Server-Timing header (off by default: it tells any client how long
+# auth, bcrypt and the database took). A BMK_TRACE_SAMPLE_RATE fraction of
+# requests also record individual spans, and sampled requests slower than
+# BMK_TRACE_SLOW_MS are kept in a ring buffer for /debug/traces. With both
+# off the middleware is a pass-through.
+import functools
+import inspect
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from fastapi.routing import APIRoute
+
+import metrics
+
+SERVER_TIMING = os.environ.get("BMK_SERVER_TIMING", "0") == "1"
+SAMPLE_RATE = float(os.environ.get("BMK_TRACE_SAMPLE_RATE", "0"))
+SLOW_MS = float(os.environ.get("BMK_TRACE_SLOW_MS", "500"))
+BUFFER_SIZE = int(os.environ.get("BMK_TRACE_BUFFER", "100"))
+MAX_SPANS = 500
+
+_trace = ContextVar("bmk_trace", default=None)
+_buffer = deque(maxlen=BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, sampled):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.queries = 0
+        self.spans = [] if sampled else None
+        self.handler_started = None
+        self.handler_ended = None
+
+    def add(self, stage, start, end, **attrs):
+        self.stages[stage] = self.stages.get(stage, 0.0) + (end - start)
+        if self.spans is not None and len(self.spans) < MAX_SPANS:
+            self.spans.append({
+                "name": stage,
+                "start_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                **attrs,
+            })
+
+    def server_timing(self, now):
+        parts = []
+        for stage, seconds in self.stages.items():
+            part = f"{stage};dur={seconds * 1000:.2f}"
+            if stage == "db":
+                part += f';desc="{self.queries} queries"'
+            parts.append(part)
+        parts.append(f"total;dur={(now - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current():
+    return _trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block as a named stage of the current request, if any."""
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), **attrs)
+
+
+def _timed_endpoint(endpoint):
+    # Same sync/async flavour as the original so FastAPI runs it the same way
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            if trace is None:
+                return await endpoint(*args, **kwargs)
+            trace.handler_started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                trace.handler_ended = time.perf_counter()
+                trace.add("handler", trace.handler_started, trace.handler_ended)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            trace = _trace.get()
+            if trace is None:
+                return endpoint(*args, **kwargs)
+            trace.handler_started = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                trace.handler_ended = time.perf_counter()
+                trace.add("handler", trace.handler_started, trace.handler_ended)
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """APIRoute splitting a request into deps / handler / render stages."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            trace = _trace.get()
+            if trace is None:
+                return await handler(request)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                ended = time.perf_counter()
+                if trace.handler_started is None:
+                    # Failed before the handler ran (validation, auth, ...)
+                    trace.add("deps", started, ended)
+                else:
+                    trace.add("deps", started, trace.handler_started)
+                    if trace.handler_ended is not None:
+                        trace.add("render", trace.handler_ended, ended)
+
+        return traced_handler
+
+
+class TracingMiddleware:
+    """ASGI middleware attaching a Trace to each request and emitting Server-Timing."""
+
+    def __init__(self, app, server_timing=SERVER_TIMING, sample_rate=SAMPLE_RATE):
+        self.app = app
+        self.server_timing = server_timing
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.server_timing or self.sample_rate):
+            return await self.app(scope, receive, send)
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace = Trace(sampled)
+        token = _trace.set(trace)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = trace.server_timing(time.perf_counter()).encode()
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            total = time.perf_counter() - trace.started
+            if sampled and total * 1000 >= SLOW_MS:
+                record = {
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": metrics.route_template(scope),
+                    "status": status,
+                    "total_ms": round(total * 1000, 3),
+                    "queries": trace.queries,
+                    "stages_ms": {k: round(v * 1000, 3) for k, v in trace.stages.items()},
+                    "spans": sorted(trace.spans, key=lambda sp: sp["start_ms"]),
+                }
+                with _buffer_lock:
+                    _buffer.append(record)
+
+
+def instrument_engine(engine):
+    """Add each statement on engine to the current request's db stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _trace.get() is not None:
+            conn.info.setdefault("bmk_trace_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        trace = _trace.get()
+        starts = conn.info.get("bmk_trace_start")
+        if trace is None or not starts:
+            return
+        trace.queries += 1
+        if trace.spans is None:
+            trace.add("db", starts.pop(), time.perf_counter())
+        else:
+            trace.add("db", starts.pop(), time.perf_counter(), statement=statement[:200])
+
+
+def slow_traces(limit=20):
+    """Most recent sampled slow-request traces, newest first."""
+    with _buffer_lock:
+        traces = list(_buffer)
+    return traces[::-1][:limit]
@@ -0,0 +1,150 @@
+# Precomputed response payloads that survive restarts.
+#
+# Each derived payload (already-serialized JSON for a hot read-only route) is
+# built from a few tables and stored with those tables' data_versions
+# counters; it is served until one of them moves, in any worker process
+# (invalidation.py tracks the counters without a query per lookup). The
+# cache is written to a pickle snapshot on shutdown and periodically, and
+# loaded back at startup - keeping only entries whose schema hash and table
+# versions still match the database - so the first requests after a wake-up
+# skip the rebuild.
+#
+# Only payloads built from queries belong here. The search indexes are FTS5
+# tables inside the database file, so they already survive a restart as
+# they are. The static payloads (/guidelines, /app/version, /app/features)
+# are literals with no queries behind them, so a snapshot would save nothing.
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+
+import invalidation
+import job_queue
+import metrics
+from server import SessionLocal, SQLITE_DB_PATH, ChatMessage, Municipality, Task, User, schema_version
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_PATH = os.environ.get(
+    "BMK_CACHE_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(SQLITE_DB_PATH)), "bmk_cache.snapshot"),
+)
+SNAPSHOT_SECONDS = int(os.environ.get("BMK_CACHE_SNAPSHOT_SECONDS", "300"))
+
+_lock = threading.Lock()
+_builders = {}  # name -> (tables, fn(db) -> JSON-able content)
+_entries = {}   # name -> (((table, version), ...), payload bytes)
+
+
+def dumps(content):
+    # Same output as FastAPI's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def derived(name, tables):
+    """Register fn(db) as the builder of payload name, valid while tables are unchanged."""
+    def decorator(fn):
+        _builders[name] = (tuple(tables), fn)
+        return fn
+    return decorator
+
+
+def _versions(tables):
+    current = invalidation.versions()
+    return tuple((table, current.get(table, 0)) for table in tables)
+
+
+def get(name, db):
+    """Serialized payload name, rebuilt only if its tables changed since it was cached."""
+    tables, build = _builders[name]
+    versions = _versions(tables)
+    entry = _entries.get(name)
+    if entry is not None and entry[0] == versions:
+        metrics.cache_hit("derived")
+        return entry[1]
+    metrics.cache_miss("derived")
+    payload = dumps(build(db))
+    with _lock:
+        _entries[name] = (versions, payload)
+    return payload
+
+
+def warm():
+    """Build every registered payload that is missing or stale."""
+    db = SessionLocal()
+    try:
+        for name in _builders:
+            get(name, db)
+    finally:
+        db.close()
+
+
+def save_snapshot(path=SNAPSHOT_PATH):
+    with _lock:
+        entries = dict(_entries)
+    data = {"format": SNAPSHOT_FORMAT, "schema": schema_version(), "saved_at": time.time(), "entries": entries}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Atomic, so several workers saving at once never leave a torn file
+    os.replace(tmp, path)
+    return len(entries)
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Restore entries still valid for the current database; returns how many."""
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        log.warning("Ignoring unreadable cache snapshot %s: %s", path, e)
+        return 0
+    if data.get("format") != SNAPSHOT_FORMAT or data.get("schema") != schema_version():
+        return 0
+    loaded = 0
+    for name, (versions, payload) in data["entries"].items():
+        if name in _builders and versions == _versions(_builders[name][0]):
+            with _lock:
+                _entries[name] = (versions, payload)
+            loaded += 1
+    return loaded
+
+
+@job_queue.task("warm_cache.refresh")
+def refresh():
+    """Rebuild stale payloads off the request path and persist the snapshot."""
+    warm()
+    return save_snapshot()
+
+
+@derived("municipalities", tables=["municipalities"])
+def municipalities(db):
+    return [
+        {
+            "id": m.id,
+            "name": m.name,
+            "province": m.province,
+            "district": m.district,
+            "ward": m.ward,
+            "latitude": m.latitude,
+            "longitude": m.longitude
+        }
+        for m in db.query(Municipality).all()
+    ]
+
+
+@derived("stats", tables=["users", "tasks", "chat_messages"])
+def stats(db):
+    return {
+        "users": db.query(User).filter(User.deleted == 0).count(),
+        "tasks": db.query(Task).filter(Task.deleted == 0).count(),
+        "chat_messages": db.query(ChatMessage).filter(ChatMessage.deleted == 0).count()
+    }
+
+
+job_queue.every(SNAPSHOT_SECONDS, "warm_cache.refresh", queue="maintenance")